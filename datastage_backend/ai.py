@@ -1,3 +1,9 @@
+import re
+
+from database import quote_identifier
+from intents import IntentMatcher
+
+
 def generate_column_documentation(table_name, column_name, column_type, sample_values):
     """Generate mock AI description for a single column."""
     return f"This column stores {column_name} data of type {column_type}. Example values include: {', '.join(sample_values[:3])}."
@@ -12,53 +18,124 @@ def generate_documentation(table_name, columns, sample_rows):
     )
 
 
+def _greeting_answer(facts):
+    parts = ["Hi! I'm your local data assistant. No API key required!"]
+    if facts["customer_count"]:
+        parts.append(f" We have **{facts['customer_count']}** customers in the database.")
+    if facts["tables"]:
+        parts.append(f" Available tables: {', '.join(facts['tables'])}.")
+    parts.append(" Ask me things like: 'How many customers?', 'Which states have customers?', or 'What tables do we have?'")
+    return " ".join(parts)
+
+
+def _customer_count_answer(facts):
+    if facts["customer_count"]:
+        return f"There are exactly **{facts['customer_count']}** customers recorded in your database."
+    return "The customers table is currently empty or not loaded yet."
+
+
+def _list_tables_answer(facts):
+    if facts["tables"]:
+        return f"Available database tables: **{', '.join(facts['tables'])}**. You can ask me specific questions about their contents."
+    return "No tables are currently available in the database."
+
+
+def _location_answer(facts):
+    if facts["customer_count"]:
+        msg = f"We currently have **{facts['customer_count']}** customers spread across **{facts['customer_states']}** states and **{facts['customer_cities']}** unique cities."
+        if facts["top_states"]:
+            msg += f" The states with the highest number of customers are: {', '.join(facts['top_states'])}."
+        return msg
+    return "Customer location data is not available."
+
+
+def _relationships_answer(facts):
+    if facts["relationships"]:
+        return f"These columns link the tables: **{'; '.join(facts['relationships'])}**. Join on them to combine the tables."
+    return "No relationships between tables have been found yet. Run relationship discovery to infer them from the data."
+
+
+# Answer builders that intents refer to by name; intents with a fixed reply use "answer" instead.
+CHAT_HANDLERS = {
+    "greeting": _greeting_answer,
+    "customer_count": _customer_count_answer,
+    "list_tables": _list_tables_answer,
+    "customer_location": _location_answer,
+    "relationships": _relationships_answer,
+}
+
+# Checked in priority order, mirroring the order the answers used to be tried in.
+CHAT_INTENTS = [
+    {"name": "greeting", "priority": 0, "handler": "greeting",
+     "exact": ["", "hi", "hello", "hey", "hii", "hi there", "hey there"]},
+    {"name": "customer_count", "priority": 1, "handler": "customer_count",
+     "any": ["how many customer", "customer count", "number of customer", "total customer"]},
+    {"name": "list_tables", "priority": 2, "handler": "list_tables",
+     "any": ["what table", "list table", "which table", "tables do we have", "tables are there"]},
+    # Whole words only: "related" or "join" inside e.g. "joined" must not take over other questions.
+    {"name": "relationships", "priority": 2, "weight": 2.0, "handler": "relationships",
+     "any": ["relationship", " related ", "foreign key", " join ", " joins ", " linked ", " connected "]},
+    {"name": "customer_location", "priority": 3, "handler": "customer_location",
+     "any": ["state", "city", "where are customer", "location"]},
+    {"name": "customer_names", "priority": 4,
+     "any": ["first name", "last name", "name"],
+     "answer": "Customer names are stored in the 'first_name' and 'last_name' columns of the 'customers' table."},
+    {"name": "customer_contact", "priority": 5,
+     "any": ["email", "contact", "phone"],
+     "answer": "Contact information such as emails and phone numbers are available in the 'customers' table."},
+]
+
+# Every keyword group must match; the first (lowest priority) matching rule wins.
+SQL_INTENTS = [
+    {"name": "count_customers", "priority": 0, "all": [["count"], ["customer"]],
+     "sql": "SELECT COUNT(*) FROM customers;"},
+    {"name": "customers_by_state", "priority": 1, "all": [["state"], ["customer"]],
+     "sql": "SELECT state, COUNT(*) as count FROM customers GROUP BY state ORDER BY count DESC LIMIT 5;"},
+    {"name": "customers_by_city", "priority": 2, "all": [["city"], ["customer"]],
+     "sql": "SELECT city, COUNT(*) as count FROM customers GROUP BY city ORDER BY count DESC LIMIT 5;"},
+]
+DEFAULT_SQL = "SELECT * FROM customers LIMIT 10;"
+
+chat_matcher = IntentMatcher(CHAT_INTENTS)
+sql_matcher = IntentMatcher(SQL_INTENTS)
+
+
+def register_chat_intent(intent):
+    """Add a chat intent; it needs an "answer" string or a "handler" name from CHAT_HANDLERS."""
+    if "answer" not in intent and intent.get("handler") not in CHAT_HANDLERS:
+        raise ValueError("Chat intent needs an 'answer' or a known 'handler'")
+    chat_matcher.register(intent)
+
+
+def register_sql_intent(intent):
+    """Add a natural-language-to-SQL rule; it needs a "sql" string."""
+    if "sql" not in intent:
+        raise ValueError("SQL intent needs 'sql'")
+    sql_matcher.register(intent)
+
+
 def chat_with_ai(question, context, extra_context=None, data_facts=None):
     """Return a varied, data-driven answer when AI is not available."""
-    q = (question or "").strip().lower()
     facts = data_facts or {}
-    tables = facts.get("tables", [])
-    customer_count = facts.get("customer_count", 0)
-    customer_states = facts.get("customer_states", 0)
-    customer_cities = facts.get("customer_cities", 0)
-    top_states = facts.get("top_states", [])
-
-    if not q or q in ("hi", "hello", "hey", "hii", "hi there", "hey there"):
-        parts = ["Hi! I'm your local data assistant. No API key required!"]
-        if customer_count:
-            parts.append(f" We have **{customer_count}** customers in the database.")
-        if tables:
-            parts.append(f" Available tables: {', '.join(tables)}.")
-        parts.append(" Ask me things like: 'How many customers?', 'Which states have customers?', or 'What tables do we have?'")
-        return " ".join(parts)
-
-    if "how many customer" in q or "customer count" in q or "number of customer" in q or "total customer" in q:
-        if customer_count:
-            return f"There are exactly **{customer_count}** customers recorded in your database."
-        return "The customers table is currently empty or not loaded yet."
-
-    if "what table" in q or "list table" in q or "which table" in q or "tables do we have" in q or "tables are there" in q:
-        if tables:
-            return f"Available database tables: **{', '.join(tables)}**. You can ask me specific questions about their contents."
-        return "No tables are currently available in the database."
-
-    if "state" in q or "city" in q or "where are customer" in q or "location" in q:
-        if customer_count:
-            msg = f"We currently have **{customer_count}** customers spread across **{customer_states}** states and **{customer_cities}** unique cities."
-            if top_states:
-                msg += f" The states with the highest number of customers are: {', '.join(top_states)}."
-            return msg
-        return "Customer location data is not available."
-        
-    if "first name" in q or "last name" in q or "name" in q:
-        return f"Customer names are stored in the 'first_name' and 'last_name' columns of the 'customers' table."
-        
-    if "email" in q or "contact" in q or "phone" in q:
-        return f"Contact information such as emails and phone numbers are available in the 'customers' table."
+    facts = {
+        "tables": facts.get("tables", []),
+        "customer_count": facts.get("customer_count", 0),
+        "customer_states": facts.get("customer_states", 0),
+        "customer_cities": facts.get("customer_cities", 0),
+        "top_states": facts.get("top_states", []),
+        "relationships": facts.get("relationships", []),
+    }
+
+    intent = chat_matcher.best(question)
+    if intent is not None:
+        if "answer" in intent:
+            return intent["answer"]
+        return CHAT_HANDLERS[intent["handler"]](facts)
 
     suggestions = []
-    if customer_count:
+    if facts["customer_count"]:
         suggestions.append("'How many customers do we have?'")
-    if tables:
+    if facts["tables"]:
         suggestions.append("'What tables are in the database?'")
     suggestions.append("'Which states have the most customers?'")
     return (
@@ -66,18 +143,40 @@ def chat_with_ai(question, context, extra_context=None, data_facts=None):
     )
 
 
-def generate_sql(natural_language, schema):
-    """Convert natural language to SQL query using hardcoded generic logic."""
-    q = (natural_language or "").strip().lower()
-    
-    if "count" in q and "customer" in q:
-        return "SELECT COUNT(*) FROM customers;"
-    
-    if "state" in q and "customer" in q:
-        return "SELECT state, COUNT(*) as count FROM customers GROUP BY state ORDER BY count DESC LIMIT 5;"
-        
-    if "city" in q and "customer" in q:
-        return "SELECT city, COUNT(*) as count FROM customers GROUP BY city ORDER BY count DESC LIMIT 5;"
+def _join_sql(natural_language, relationships):
+    """SELECT joining two tables named in the question along a known relationship."""
+    text = f" {' '.join(re.findall(r'[a-z0-9]+', natural_language.lower()))} "
+    tables = {t for r in relationships for t in (r["table"], r["ref_table"])}
+    named = set()
+    # Longest names first, consuming the words they match, so "order items" is not also "orders".
+    for table in sorted(tables, key=len, reverse=True):
+        name = " ".join(re.findall(r"[a-z0-9]+", table.lower())).removesuffix("s")
+        for form in (f" {name}s ", f" {name} "):
+            if form in text:
+                named.add(table)
+                text = text.replace(form, " ")
+    for r in relationships:
+        if r["table"] != r["ref_table"] and r["table"] in named and r["ref_table"] in named:
+            return (
+                f"SELECT a.*, b.* FROM {quote_identifier(r['table'])} a JOIN {quote_identifier(r['ref_table'])} b "
+                f"ON a.{quote_identifier(r['column'])} = b.{quote_identifier(r['ref_column'])} LIMIT 100;"
+            )
+    return None
+
+
+def generate_sql(natural_language, schema, relationships=None):
+    """Convert natural language to SQL query using the registered SQL intents.
+
+    relationships (dicts with table, column, ref_table, ref_column) let a
+    question naming two related tables fall back to a JOIN between them.
+    """
+    intent = sql_matcher.best(natural_language)
+    if intent is not None:
+        return intent["sql"]
+
+    join = _join_sql(natural_language, relationships or [])
+    if join:
+        return join
 
     # Default generic query
-    return "SELECT * FROM customers LIMIT 10;"
+    return DEFAULT_SQL
@@ -1,29 +1,105 @@
-from flask import Flask, jsonify, request
+import argparse
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 from flask_cors import CORS
 import database
 import ai
+import catalog_profiler
+import column_snapshots
 import settings_store
 import connection_store
+import data_quality
+import profiler
+import profile_cache
+import doc_cache
+import index_advisor
+import jobs
+import metrics
+import query_cache
+import query_runner
+import relationships
+import schema_watch
+import search_index
+import sources
+import streaming
+import startup
+import table_browser
 
 app = Flask(__name__)
 CORS(app)  # Allow cross-origin requests (useful during development)
 
-# Initialize the database on startup
-database.init_db()
+
+@app.before_request
+def _start_request_timer():
+    """Start route timing, and cProfile when the request asks for ?profile=1."""
+    g.request_started = time.perf_counter()
+    if metrics.PROFILING and request.args.get("profile") == "1":
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+@app.after_request
+def _record_request(response):
+    """Observe the route's latency; with ?profile=1 replace the body by the cProfile summary."""
+    profile = g.pop("profiler", None)
+    if profile is not None:
+        profile.disable()
+        out = io.StringIO()
+        out.write(f"{request.method} {request.full_path} -> {response.status}\n\n")
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(metrics.PROFILE_LINES)
+        response = Response(out.getvalue(), status=response.status_code, mimetype="text/plain")
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.http_duration.observe(
+            (request.method, route, str(response.status_code)), time.perf_counter() - started
+        )
+    return response
+
+
+@app.teardown_appcontext
+def _release_connections(exc):
+    """Hand the request's read connections back to their pools (after any streamed body)."""
+    database.release_connections()
+
+
+@app.before_request
+def _ensure_started():
+    """Run the startup pipeline on the first request (a no-op afterwards)."""
+    startup.start()
+    schema_watch.start_watcher()
+
+
+@app.before_request
+def _select_source():
+    """Work against ?source= (or X-DataSage-Source), falling back to the connected source."""
+    name = request.args.get("source") or request.headers.get("X-DataSage-Source") or sources.active()
+    try:
+        sources.activate(name)
+    except sources.UnknownSource:
+        return jsonify({"error": f"Unknown data source: {name}"}), 404
 
 
 def _current_db_stats():
     """Return current table count and total column count from backend DB."""
-    tables = database.get_tables()
-    total_cols = sum(
-        len(database.get_table_info(t)) for t in tables
-    )
-    return {"tables": len(tables), "columns": total_cols}
+    schema = database.get_schema()
+    total_cols = sum(len(cols) for cols in schema.values())
+    return {"tables": len(schema), "columns": total_cols}
 
 
 @app.route('/connect', methods=['POST'])
 def connect_database():
-    """Save connection config and return success with current DB stats (Dashboard uses same DB)."""
+    """Save connection config, register it as a data source and make it the active one.
+
+    SQLite files become their own source (named by "name" or the file name);
+    the built-in database is the "default" source. Other types are saved but
+    not supported yet, so the backend keeps using the built-in database.
+    """
     data = request.get_json() or {}
     config = {
         "type": data.get("type", "sqlite"),
@@ -32,11 +108,27 @@ def connect_database():
         "username": data.get("username", ""),
         "database": data.get("database", "datasage.db"),
     }
+    name = sources.DEFAULT_SOURCE
+    message = "Connection saved. Backend is using the configured data source."
+    if config["type"] == "sqlite" and os.path.abspath(config["database"]) != os.path.abspath(database.DB_PATH):
+        if not os.path.isfile(config["database"]):
+            return jsonify({"success": False, "message": f"Database file not found: {config['database']}"}), 400
+        name = data.get("name") or os.path.splitext(os.path.basename(config["database"]))[0]
+        try:
+            sources.register(name, {"type": "sqlite", "database": config["database"]})
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+    elif config["type"] not in sources.SOURCE_TYPES:
+        message = f"Connection saved. {config['type']} is not supported yet; using the built-in SQLite database."
+    config["source"] = name
     connection_store.save_connection(config)
-    stats = _current_db_stats()
+    sources.set_active(name)
+    with sources.use(name):
+        stats = _current_db_stats()
     return jsonify({
         "success": True,
-        "message": "Connection saved. Backend is using the configured data source.",
+        "message": message,
+        "source": name,
         **stats,
     })
 
@@ -49,80 +141,439 @@ def connection_status():
     return jsonify({
         "connected": config is not None,
         "config": config,
+        "source": sources.current(),
         **stats,
     })
 
 
+@app.route('/sources', methods=['GET'])
+def list_sources():
+    """List registered data sources (without opening them) and the active one."""
+    return jsonify({"sources": sources.describe(), "active": sources.active()})
+
+
+@app.route('/sources', methods=['POST'])
+def register_source():
+    """Register a data source: {"name", "type": "sqlite", "database": path}. Opened on first use."""
+    data = request.get_json() or {}
+    name = data.get("name")
+    if not name:
+        return jsonify({"error": "Missing source name"}), 400
+    config = {k: v for k, v in data.items() if k != "name"}
+    try:
+        sources.register(name, config)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"success": True, "name": name})
+
+
+@app.route('/sources/<name>', methods=['DELETE'])
+def remove_source(name):
+    """Forget a data source and close its pools."""
+    try:
+        sources.unregister(name)
+    except sources.UnknownSource:
+        return jsonify({"error": f"Unknown data source: {name}"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"success": True})
+
+
+@app.route('/pool-stats', methods=['GET'])
+def pool_stats():
+    """Return connection pool counters (connections opened, checkouts, health checks)."""
+    return jsonify({
+        **database.pool_stats(),
+        "profile_cache": profile_cache.stats(),
+        "doc_cache": doc_cache.stats(),
+        "query_cache": query_cache.stats(),
+        "jobs": jobs.stats(),
+        "schema_watch": schema_watch.stats(),
+        "column_snapshots": column_snapshots.stats(),
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Route and SQL latency histograms plus pool, cache and job counters, in Prometheus text format."""
+    counters = {}
+    for component, stats in (
+        ("pool", database.pool_stats()),
+        ("profile_cache", profile_cache.stats()),
+        ("doc_cache", doc_cache.stats()),
+        ("query_cache", query_cache.stats()),
+        ("jobs", jobs.stats()),
+        ("schema_watch", schema_watch.stats()),
+        ("column_snapshots", column_snapshots.stats()),
+    ):
+        for key, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                counters[(component, key)] = value
+    gauges = {"datasage_component_stat": ("Pool, cache and job counters from /pool-stats.", counters, ("component", "stat"))}
+    return Response(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/slow-queries', methods=['GET'])
+def slow_queries():
+    """Recent statements over DATASAGE_SLOW_QUERY_MS, with their calling functions (empty when the log is off)."""
+    return jsonify({"threshold_ms": metrics.SLOW_QUERY_MS or None, "queries": metrics.slow_queries()})
+
+
 @app.route('/')
 def health_check():
-    return jsonify({"status": "ok", "message": "DataSage AI backend is running"})
+    """Report readiness; 503 until the training data has been loaded."""
+    state = startup.status()
+    if state["ready"]:
+        return jsonify({"status": "ok", "message": "DataSage AI backend is running", "startup": state})
+    status = "error" if state["error"] else "starting"
+    return jsonify({"status": status, "message": "DataSage AI backend is starting", "startup": state}), 503
 
 @app.route('/extract', methods=['GET'])
 def extract_metadata():
-    """Return all tables and their columns."""
-    tables = database.get_tables()
-    result = {}
-    for table in tables:
-        columns = database.get_table_info(table)
-        result[table] = columns
-    return jsonify(result)
+    """Return all tables and their columns; columns with a known foreign key carry "references"."""
+    refs = relationships.references()
+    if not refs:
+        return jsonify(database.get_schema())
+    return jsonify({
+        t: [dict(c, references=refs[(t, c["name"])]) if (t, c["name"]) in refs else c for c in cols]
+        for t, cols in database.get_schema().items()
+    })
 
-@app.route('/profile/<table>', methods=['GET'])
-def profile_table(table):
-    """Return detailed profile for a specific table."""
-    if table not in database.get_tables():
+@app.route('/tables/<table>/rows', methods=['GET'])
+def browse_table(table):
+    """One page of a table in rowid (or primary key) order.
+
+    ?page_size= (max 1000), ?columns=a,b and ?cursor= (the next_cursor of the
+    previous page) select what comes back.
+    """
+    columns = [c for c in (request.args.get("columns") or "").split(",") if c]
+    try:
+        page = table_browser.browse(
+            table, request.args.get("cursor"), request.args.get("page_size", type=int), columns
+        )
+    except table_browser.TableNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    except table_browser.BrowseError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(page)
+
+
+@app.route('/tables/<table>/export', methods=['GET'])
+def export_table(table):
+    """Stream a whole table as ?format=csv, ndjson or columnar, optionally limited to ?columns=a,b."""
+    fmt = request.args.get("format", "csv")
+    if fmt not in streaming.ENCODERS:
+        return jsonify({"error": f"Unsupported format: {fmt}"}), 400
+    columns = [c for c in (request.args.get("columns") or "").split(",") if c]
+    try:
+        names, chunks = table_browser.export_chunks(table, columns)
+    except table_browser.TableNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    except table_browser.BrowseError as e:
+        return jsonify({"error": str(e)}), 400
+    extension = "ndjson" if fmt == "columnar" else fmt
+    headers = {"Content-Disposition": f'attachment; filename="{table}.{extension}"'}
+    return Response(
+        stream_with_context(streaming.ENCODERS[fmt](names, chunks)),
+        mimetype=streaming.MIMETYPES[fmt],
+        headers=headers,
+    )
+
+
+@app.route('/search', methods=['GET'])
+def search():
+    """Ranked full-text search over table/column names, generated docs and indexed table rows.
+
+    ?q= is matched by prefix on every word; ?kind=catalog|rows and ?table=
+    narrow it down; ?limit= and ?offset= page through the results. Indexes
+    only exist in the default source; other sources match table and column
+    names.
+    """
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"error": "Missing 'q'"}), 400
+    kind = request.args.get("kind")
+    if kind not in (None, "catalog", "rows"):
+        return jsonify({"error": "kind must be 'catalog' or 'rows'"}), 400
+    limit = request.args.get("limit", 20, type=int)
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    try:
+        results, has_more = search_index.search(q, kind, request.args.get("table"), limit, offset)
+    except search_index.SearchUnavailable as e:
+        return jsonify({"error": str(e)}), 501
+    return jsonify({
+        "query": q,
+        "results": results,
+        "offset": offset,
+        "next_offset": offset + len(results) if has_more else None,
+    })
+
+
+@app.route('/search/index', methods=['GET'])
+def search_indexed_tables():
+    """Tables whose rows are searchable, with the indexed columns."""
+    try:
+        return jsonify(search_index.indexed_tables())
+    except search_index.SearchUnavailable as e:
+        return jsonify({"error": str(e)}), 501
+
+
+@app.route('/search/index/<table>', methods=['PUT'])
+def set_search_columns(table):
+    """Choose which text columns of a table are indexed: {"columns": [...]} (an empty list removes it)."""
+    if table not in database.get_schema():
         return jsonify({"error": "Table not found"}), 404
+    columns = (request.get_json(silent=True) or {}).get("columns")
+    if not isinstance(columns, list):
+        return jsonify({"error": "Missing 'columns' list"}), 400
+    try:
+        search_index.set_columns(table, columns)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except search_index.SearchUnavailable as e:
+        return jsonify({"error": str(e)}), 501
+    return jsonify(search_index.indexed_tables())
+
+
+@app.route('/data-quality', methods=['GET'])
+def data_quality_summary():
+    """Quality score and alert count of every scanned table."""
+    return jsonify({"alerts_enabled": data_quality.alerts_enabled(), "tables": data_quality.summary()})
+
+
+@app.route('/data-quality/<table>', methods=['GET'])
+def data_quality_report(table):
+    """Stored per-column quality scores for a table (POST to scan it)."""
+    if table not in database.get_schema():
+        return jsonify({"error": "Table not found"}), 404
+    report = data_quality.report(table)
+    if report is None:
+        return jsonify({"error": "Table has not been scanned yet"}), 404
+    return jsonify({**report, "alerts_enabled": data_quality.alerts_enabled()})
 
-    columns = database.get_table_info(table)
-    col_names, sample_rows = database.get_table_preview(table)
-    row_count, stats = database.get_table_stats(table)
 
+@app.route('/data-quality/<table>', methods=['POST'])
+def data_quality_scan(table):
+    """Scan a table for quality issues, incrementally from the last checkpoint unless "full" is set.
+
+    Optional JSON body: {"full": bool, "ranges": {column: [low, high]}, "keys": [column, ...]}.
+    """
+    if table not in database.get_schema():
+        return jsonify({"error": "Table not found"}), 404
+    data = request.get_json(silent=True) or {}
+    report = data_quality.scan(
+        table,
+        full=bool(data.get("full")) or request.args.get("full") == "1",
+        ranges=data.get("ranges"),
+        keys=data.get("keys"),
+    )
+    return jsonify({**report, "alerts_enabled": data_quality.alerts_enabled()})
+
+
+@app.route('/schema-changes', methods=['GET'])
+def schema_changes():
+    """Change feed of added, dropped, renamed and altered tables and columns.
+
+    Checks for new changes first (one pragma read when nothing changed), then
+    returns recorded changes after ?since= (a change id), optionally for one
+    ?table=. Pass the returned "next" as since to poll for newer ones.
+    """
+    since = request.args.get("since", 0, type=int)
+    limit = min(max(request.args.get("limit", 100, type=int), 1), 1000)
+    if request.args.get("check") != "0":
+        schema_watch.check()
+    changes = schema_watch.changes(since, limit, request.args.get("table"))
     return jsonify({
-        "table": table,
-        "columns": columns,
-        "row_count": row_count,
-        "sample": [dict(zip(col_names, row)) for row in sample_rows],
-        "statistics": stats
+        "notify": schema_watch.enabled(),
+        "changes": changes,
+        "next": changes[-1]["id"] if changes else since,
     })
 
+
+@app.route('/relationships', methods=['GET'])
+def list_relationships():
+    """Stored foreign keys, declared and inferred (POST /relationships/discover to refresh)."""
+    return jsonify({"relationships": relationships.get_relationships()})
+
+
+@app.route('/relationships/discover', methods=['POST'])
+def discover_relationships():
+    """Infer foreign keys from the data; optional JSON body {"tables": [...]}."""
+    data = request.get_json(silent=True) or {}
+    return jsonify(relationships.discover(data.get("tables")))
+
+@app.route('/profile/<table>', methods=['GET'])
+def profile_table(table):
+    """Return detailed profile for a specific table.
+
+    Exact profiles are served from the persistent profile cache (stale
+    entries are refreshed in the background; ?refresh=1 forces a rescan).
+    ?mode=approx samples the table instead, bounded by ?rows= and ?time_ms=
+    (default profiler.DEFAULT_ROW_BUDGET / DEFAULT_TIME_BUDGET), and scales
+    the counts it saw to the whole table.
+    """
+    schema = database.get_schema()
+    if table not in schema:
+        return jsonify({"error": "Table not found"}), 404
+
+    return jsonify(_table_profile(
+        table,
+        schema[table],
+        mode=request.args.get("mode"),
+        rows=request.args.get("rows", type=int),
+        time_ms=request.args.get("time_ms", type=float),
+        refresh=request.args.get("refresh") == "1",
+    ))
+
+
+def _table_profile(table, columns, mode=None, rows=None, time_ms=None, refresh=False):
+    if mode == "approx":
+        result = profiler.profile_table_approx(
+            table,
+            row_budget=rows,
+            time_budget=time_ms / 1000 if time_ms else None,
+        )
+        return {
+            "table": table,
+            "columns": columns,
+            "mode": "approx",
+            **result,
+        }
+    profile, cache = profile_cache.get_profile(table, force_refresh=refresh)
+    return {**profile, "cache": cache}
+
+@app.route('/histogram/<table>/<column>', methods=['GET'])
+def column_histogram(table, column):
+    """Distribution of a numeric column: ?bins= equal-width bins between ?min= and ?max=
+    (default: the column's range), plus quartiles, mean and stddev.
+
+    Computed from the column's memory-mapped snapshot (rebuilt only after the
+    table changes), or with SQL when snapshots are off or the column also
+    holds text.
+    """
+    col_info = next((c for c in database.get_schema().get(table, []) if c["name"] == column), None)
+    if col_info is None:
+        return jsonify({"error": "Column not found"}), 404
+    if not profiler.is_numeric_type(col_info["type"]):
+        return jsonify({"error": f"{column} is not a numeric column"}), 400
+    bins = max(1, min(request.args.get("bins", 20, type=int), 1000))
+    result = column_snapshots.distribution(
+        table, column, bins, request.args.get("min", type=float), request.args.get("max", type=float)
+    )
+    return jsonify({"table": table, "column": column, **result})
+
+
+@app.route('/profile-catalog', methods=['POST'])
+def profile_catalog():
+    """Profile every table (or body "tables") across a process pool and save the results.
+
+    Body "workers" sets the process count (default catalog_profiler.DEFAULT_WORKERS,
+    at most catalog_profiler.MAX_WORKERS).
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        summary = catalog_profiler.profile_catalog(data.get("tables"), data.get("workers"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(summary)
+
+
 @app.route('/generate-doc/<table>', methods=['GET'])
 def generate_doc(table):
     """Generate AI documentation for a table."""
-    if table not in database.get_tables():
+    schema = database.get_schema()
+    if table not in schema:
         return jsonify({"error": "Table not found"}), 404
 
-    columns = database.get_table_info(table)
+    doc, source = _table_doc(table, schema[table])
+    return jsonify({"documentation": doc, "cache": source})
+
+
+def _table_doc(table, columns):
     col_names, sample_rows = database.get_table_preview(table, limit=3)
     sample_data = [dict(zip(col_names, row)) for row in sample_rows]
-
-    doc = ai.generate_documentation(
-        table_name=table,
-        columns=[c["name"] for c in columns],
-        sample_rows=sample_data
+    return doc_cache.get_or_generate(
+        doc_cache.doc_key(table, columns, samples=sample_data),
+        table,
+        None,
+        lambda: ai.generate_documentation(
+            table_name=table,
+            columns=[c["name"] for c in columns],
+            sample_rows=sample_data
+        ),
     )
-    return jsonify({"documentation": doc})
+
+
+@app.route('/generate-doc/<table>', methods=['DELETE'])
+def invalidate_doc(table):
+    """Drop cached documentation for a table and its columns."""
+    doc_cache.invalidate(table)
+    return jsonify({"success": True, "table": table})
 
 
 @app.route('/generate-doc/<table>/<column>', methods=['GET'])
 def generate_doc_column(table, column):
     """Generate AI documentation for a single column."""
-    if table not in database.get_tables():
+    schema = database.get_schema()
+    if table not in schema:
         return jsonify({"error": "Table not found"}), 404
-    columns = database.get_table_info(table)
-    col_names = [c["name"] for c in columns]
-    if column not in col_names:
+    columns = schema[table]
+    col_info = next((c for c in columns if c["name"] == column), None)
+    if col_info is None:
         return jsonify({"error": "Column not found"}), 404
-    col_info = next(c for c in columns if c["name"] == column)
-    col_names, sample_rows = database.get_table_preview(table, limit=20)
-    idx = col_names.index(column)
-    sample_vals = [str(row[idx]) for row in sample_rows if row[idx] is not None][:10]
-    doc = ai.generate_column_documentation(
-        table_name=table,
-        column_name=column,
-        column_type=col_info.get("type", "unknown"),
-        sample_values=sample_vals,
+    sample_vals = database.get_column_samples(table, [column])[column]
+    doc, source = _column_doc(table, columns, col_info, sample_vals)
+    return jsonify({"documentation": doc, "cache": source})
+
+
+def _column_doc(table, columns, col_info, sample_vals):
+    column = col_info["name"]
+    return doc_cache.get_or_generate(
+        doc_cache.doc_key(table, columns, column_name=column, samples=sample_vals),
+        table,
+        column,
+        lambda: ai.generate_column_documentation(
+            table_name=table,
+            column_name=column,
+            column_type=col_info.get("type", "unknown"),
+            sample_values=sample_vals,
+        ),
     )
-    return jsonify({"documentation": doc})
+
+
+@app.route('/generate-doc-batch/<table>', methods=['GET'])
+def generate_doc_batch(table):
+    """Document every column of a table (or ?columns=a,b) as NDJSON, one line per column.
+
+    The schema is read once and all samples come from a single scan; each
+    line is flushed as soon as that column's documentation is ready.
+    """
+    schema = database.get_schema()
+    if table not in schema:
+        return jsonify({"error": "Table not found"}), 404
+    columns = schema[table]
+    by_name = {c["name"]: c for c in columns}
+    requested = request.args.get("columns")
+    if requested:
+        names = [n.strip() for n in requested.split(",") if n.strip()]
+        missing = [n for n in names if n not in by_name]
+        if missing:
+            return jsonify({"error": "Column not found", "columns": missing}), 404
+    else:
+        names = list(by_name)
+    samples = database.get_column_samples(table, names)
+
+    def generate():
+        for name in names:
+            col_info = by_name[name]
+            try:
+                doc, source = _column_doc(table, columns, col_info, samples[name])
+                line = {"column": name, "type": col_info["type"], "documentation": doc, "cache": source}
+            except Exception as e:
+                line = {"column": name, "error": str(e)}
+            yield json.dumps(line) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
 
 @app.route('/chat', methods=['POST'])
@@ -131,19 +582,26 @@ def chat():
     data = request.get_json()
     if not data or 'question' not in data:
         return jsonify({"error": "Missing 'question' in request body"}), 400
+    return jsonify({"answer": _chat_answer(data["question"])})
+
 
-    tables = database.get_tables()
+def _chat_answer(question):
+    schema = database.get_schema()
+    tables = list(schema)
     context = []
-    for t in tables:
-        cols = database.get_table_info(t)
+    for t, cols in schema.items():
         context.append(f"{t}({', '.join(c['name'] for c in cols)})")
+    links = relationships.describe(relationships.get_relationships())
+    if links:
+        context.append(f"relationships: {', '.join(links)}")
     context_str = "; ".join(context)
 
     # Add training data context for customers table (sample rows + count)
+    data_facts = dict(database.get_chat_facts(), relationships=links)
     extra = None
     if "customers" in tables:
         try:
-            row_count, _ = database.get_table_stats("customers")
+            row_count = data_facts.get("customer_count", 0)
             col_names, sample_rows = database.get_table_preview("customers", limit=8)
             sample_str = "\n".join(
                 str(dict(zip(col_names, row))) for row in sample_rows
@@ -156,14 +614,148 @@ def chat():
         except Exception:
             pass
 
-    data_facts = database.get_chat_facts()
-    answer = ai.chat_with_ai(
-        data["question"],
+    return ai.chat_with_ai(
+        question,
         context_str,
         extra_context=extra,
         data_facts=data_facts,
     )
-    return jsonify({"answer": answer})
+
+# --- Background jobs: the expensive routes above, run off the request path ---
+def _job_table(params):
+    table = params.get("table")
+    schema = database.get_schema()
+    if table not in schema:
+        raise jobs.JobError(f"Table not found: {table}")
+    return table, schema[table]
+
+
+def _profile_job(params, job):
+    table, columns = _job_table(params)
+    return _table_profile(
+        table, columns,
+        mode=params.get("mode"),
+        rows=params.get("rows"),
+        time_ms=params.get("time_ms"),
+        refresh=bool(params.get("refresh")),
+    )
+
+
+def _profile_catalog_job(params, job):
+    return catalog_profiler.profile_catalog(params.get("tables"), params.get("workers"), progress=job.progress)
+
+
+def _generate_doc_job(params, job):
+    table, columns = _job_table(params)
+    doc, source = _table_doc(table, columns)
+    return {"documentation": doc, "cache": source}
+
+
+def _generate_doc_column_job(params, job):
+    table, columns = _job_table(params)
+    col_info = next((c for c in columns if c["name"] == params.get("column")), None)
+    if col_info is None:
+        raise jobs.JobError(f"Column not found: {params.get('column')}")
+    sample_vals = database.get_column_samples(table, [col_info["name"]])[col_info["name"]]
+    doc, source = _column_doc(table, columns, col_info, sample_vals)
+    return {"documentation": doc, "cache": source}
+
+
+def _generate_doc_batch_job(params, job):
+    table, columns = _job_table(params)
+    by_name = {c["name"]: c for c in columns}
+    names = params.get("columns") or list(by_name)
+    missing = [n for n in names if n not in by_name]
+    if missing:
+        raise jobs.JobError(f"Column not found: {', '.join(missing)}")
+    samples = database.get_column_samples(table, names)
+    docs = []
+    for i, name in enumerate(names):
+        doc, source = _column_doc(table, columns, by_name[name], samples[name])
+        docs.append({"column": name, "type": by_name[name]["type"], "documentation": doc, "cache": source})
+        job.progress(i + 1, len(names), name)
+    return {"table": table, "columns": docs}
+
+
+def _data_quality_job(params, job):
+    """Scan one table, or every table of the source when no table is given."""
+    tables = [_job_table(params)[0]] if params.get("table") else list(database.get_schema())
+    results = {}
+    for i, table in enumerate(tables):
+        report = data_quality.scan(table, full=bool(params.get("full")))
+        results[table] = {"score": report["score"], "alerts": len(report["alerts"]), "scan": report["scan"]}
+        job.progress(i + 1, len(tables), table)
+    return {"tables": results}
+
+
+def _relationships_job(params, job):
+    return relationships.discover(params.get("tables"), progress=job.progress)
+
+
+def _apply_indexes_job(params, job):
+    results = index_advisor.apply(params.get("indexes"), analyze=params.get("analyze", True),
+                                  extra=_intent_sql(), progress=job.progress)
+    return {"applied": results}
+
+
+def _chat_job(params, job):
+    if not params.get("question"):
+        raise jobs.JobError("Missing 'question'")
+    return {"answer": _chat_answer(params["question"])}
+
+
+jobs.register_kind("chat", _chat_job, priority=1)
+jobs.register_kind("generate_doc", _generate_doc_job, priority=3)
+jobs.register_kind("generate_doc_column", _generate_doc_column_job, priority=3)
+jobs.register_kind("profile", _profile_job, priority=5)
+jobs.register_kind("generate_doc_batch", _generate_doc_batch_job, priority=6)
+jobs.register_kind("profile_catalog", _profile_catalog_job, priority=8)
+jobs.register_kind("data_quality", _data_quality_job, priority=8)
+jobs.register_kind("discover_relationships", _relationships_job, priority=8)
+jobs.register_kind("apply_indexes", _apply_indexes_job, priority=8)
+
+
+@app.route('/jobs/<kind>', methods=['POST'])
+def submit_job(kind):
+    """Queue a job of this kind with the JSON body as params; ?priority= overrides its default.
+
+    Returns 202 with the job id; an identical pending or running job is
+    returned instead of queueing a second one.
+    """
+    params = request.get_json(silent=True) or {}
+    try:
+        job_id, deduplicated = jobs.submit(kind, params, priority=request.args.get("priority", type=int))
+    except jobs.JobError as e:
+        return jsonify({"error": str(e), "kinds": jobs.kinds()}), 400
+    return jsonify({"job_id": job_id, "kind": kind, "deduplicated": deduplicated}), 202
+
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Recent jobs, newest first (?status=, ?limit=)."""
+    return jsonify({
+        "jobs": jobs.list_jobs(request.args.get("status"), request.args.get("limit", 50, type=int)),
+        "kinds": jobs.kinds(),
+    })
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status, progress and (once done) result of a job."""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a pending job, or ask a running one to stop."""
+    status = jobs.cancel(job_id)
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({"job_id": job_id, "status": status})
+
 
 # --- User settings (profile + notifications) ---
 @app.route('/settings', methods=['GET'])
@@ -218,16 +810,113 @@ def generate_sql_endpoint():
         return jsonify({"error": "Missing 'query' in request body"}), 400
 
     # Build schema description
-    tables = database.get_tables()
+    links = relationships.get_relationships()
     schema_lines = []
-    for t in tables:
-        cols = database.get_table_info(t)
+    for t, cols in database.get_schema().items():
         col_defs = [f"{c['name']} {c['type']}" for c in cols]
+        col_defs += [f"FOREIGN KEY ({r['column']}) REFERENCES {r['ref_table']}({r['ref_column']})"
+                     for r in links if r["table"] == t]
         schema_lines.append(f"CREATE TABLE {t} ({', '.join(col_defs)});")
     schema = "\n".join(schema_lines)
 
-    sql = ai.generate_sql(data['query'], schema)
+    sql = ai.generate_sql(data['query'], schema, relationships=links)
+    index_advisor.record(sql, source="generated")
     return jsonify({"sql": sql})
 
+
+@app.route('/index-advisor', methods=['GET'])
+def index_recommendations():
+    """Indexes that would turn the recorded queries' full scans and temp sorts into index lookups."""
+    return jsonify({
+        "recommendations": index_advisor.advise(_intent_sql()),
+        "applied": index_advisor.applied(),
+    })
+
+
+@app.route('/index-advisor/apply', methods=['POST'])
+def apply_indexes():
+    """Create recommended indexes and report query timings before and after.
+
+    Optional JSON body: {"indexes": [name, ...], "analyze": bool}; all recommendations by default.
+    """
+    data = request.get_json(silent=True) or {}
+    results = index_advisor.apply(data.get("indexes"), analyze=data.get("analyze", True), extra=_intent_sql())
+    return jsonify({"applied": results})
+
+
+@app.route('/index-advisor/<name>', methods=['DELETE'])
+def drop_index(name):
+    """Drop an index created by the advisor."""
+    if not index_advisor.drop(name):
+        return jsonify({"error": "Index not found"}), 404
+    return jsonify({"dropped": name})
+
+
+def _intent_sql():
+    """The fixed queries of the SQL intents, which the advisor considers even before they run."""
+    return [intent["sql"] for intent in ai.SQL_INTENTS]
+
+@app.route('/query', methods=['POST'])
+def run_query():
+    """Run read-only SQL and stream the rows as NDJSON, columnar JSON lines or CSV.
+
+    Body: sql, params, format (ndjson|csv|columnar), max_rows, timeout_ms, and for
+    keyset pagination key, page_size and cursor. NDJSON and columnar output
+    end with a {"_meta": ...} line (row count, truncation, next_cursor,
+    error); the next cursor is also sent as the X-Next-Cursor header. CSV
+    has nowhere to put that line, so it is read to the end (at most
+    max_rows) before responding: an error is a 400, and truncation and the
+    row count go in the X-Truncated and X-Row-Count headers.
+
+    Results come from query_cache unless the request sends
+    `Cache-Control: no-cache` or `X-Cache-Bypass: 1`; X-Cache reports
+    hit, miss or bypass.
+    """
+    data = request.get_json() or {}
+    fmt = data.get("format", "ndjson")
+    if fmt not in streaming.ENCODERS:
+        return jsonify({"error": f"Unsupported format: {fmt}"}), 400
+    try:
+        bypass = (
+            request.headers.get("X-Cache-Bypass") == "1"
+            or "no-cache" in request.headers.get("Cache-Control", "")
+        )
+        result = query_cache.execute(
+            data.get("sql"),
+            bypass=bypass,
+            params=data.get("params"),
+            max_rows=data.get("max_rows"),
+            timeout_ms=data.get("timeout_ms"),
+            key=data.get("key"),
+            cursor=data.get("cursor"),
+            page_size=data.get("page_size"),
+        )
+    except (query_runner.QueryError, TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    index_advisor.record(data.get("sql"), data.get("params"))
+
+    headers = {"X-Cache": result.cache}
+    if result.info["next_cursor"]:
+        headers["X-Next-Cursor"] = result.info["next_cursor"]
+    if fmt == "csv":
+        body = list(streaming.csv_lines(result.columns, result.chunks()))
+        if result.info["error"]:
+            return jsonify({"error": result.info["error"], "rows": result.info["rows"]}), 400
+        headers["X-Truncated"] = "1" if result.info["truncated"] else "0"
+        headers["X-Row-Count"] = str(result.info["rows"])
+        return Response(body, mimetype=streaming.MIMETYPES[fmt], headers=headers)
+
+    def generate():
+        yield from streaming.ENCODERS[fmt](result.columns, result.chunks())
+        yield json.dumps({"_meta": {"columns": result.columns, **result.info}}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype=streaming.MIMETYPES[fmt], headers=headers)
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="DataSage AI backend")
+    parser.add_argument("--skip-init", action="store_true",
+                        help="do not initialize the database; wait for another process to do it")
+    args = parser.parse_args()
+    startup.start(skip_init=args.skip_init or None)
     app.run(host='0.0.0.0', port=5001, debug=False)
\ No newline at end of file
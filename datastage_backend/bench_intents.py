@@ -0,0 +1,74 @@
+"""Micro-benchmark: per-question intent matching cost as the intent catalog grows.
+
+Compares the compiled IntentMatcher with the substring `in` checks it
+replaced. Run with `python bench_intents.py [--repeat N]`.
+"""
+import argparse
+import random
+import string
+import time
+
+from intents import IntentMatcher
+
+CATALOG_SIZES = (10, 100, 1000, 5000)
+QUESTIONS = [
+    "how many customers do we have?",
+    "which states have the most customers",
+    "what tables are in the database",
+    "show me the email of the newest customer in texas",
+    "something the catalog does not know about at all",
+]
+
+
+def _phrase(rng):
+    words = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+             for _ in range(rng.randint(1, 3))]
+    return " ".join(words)
+
+
+def build_catalog(size, seed=7):
+    rng = random.Random(seed)
+    return [
+        {"name": f"intent_{i}", "any": [_phrase(rng) for _ in range(3)], "answer": f"answer {i}"}
+        for i in range(size // 3 + 1)
+    ]
+
+
+def _naive_match(intents, question):
+    q = question.strip().lower()
+    for intent in intents:
+        if any(p in q for p in intent["any"]):
+            return intent
+    return None
+
+
+def _time_per_question(fn, questions, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for q in questions:
+            fn(q)
+    return (time.perf_counter() - started) / (repeat * len(questions)) * 1e6
+
+
+def run(repeat=200):
+    rows = []
+    for size in CATALOG_SIZES:
+        catalog = build_catalog(size)
+        phrases = sum(len(i["any"]) for i in catalog)
+        matcher = IntentMatcher(catalog)
+        compile_started = time.perf_counter()
+        matcher.match("")
+        compile_ms = (time.perf_counter() - compile_started) * 1000
+        compiled_us = _time_per_question(matcher.best, QUESTIONS, repeat)
+        naive_us = _time_per_question(lambda q: _naive_match(catalog, q), QUESTIONS, repeat)
+        rows.append((phrases, compile_ms, compiled_us, naive_us))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200, help="passes over the question set")
+    args = parser.parse_args()
+    print(f"{'phrases':>8} {'compile ms':>11} {'compiled us/q':>14} {'naive us/q':>11}")
+    for phrases, compile_ms, compiled_us, naive_us in run(args.repeat):
+        print(f"{phrases:>8} {compile_ms:>11.1f} {compiled_us:>14.1f} {naive_us:>11.1f}")
@@ -0,0 +1,153 @@
+"""Route benchmark: latency percentiles, throughput and peak RSS of the API on a synthetic catalog.
+
+Builds a scratch database (demo tables, the customers CSV and
+create_demo_db.create_synthetic_db tables), then drives each route through
+the Flask test client from a pool of threads at every requested concurrency
+level. Results go to a JSON file so runs can be compared in CI. Run with
+`python bench_routes.py [--tables N --columns M --rows R] [--concurrency 1,4,8]`.
+"""
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import platform
+import resource
+import sqlite3
+import tempfile
+import time
+
+import create_demo_db
+import database
+import startup
+
+DEFAULT_OUTPUT = "bench_results.json"
+CHAT_QUESTIONS = ("how many customers do we have?", "which states have the most customers", "what tables are there")
+SQL_QUESTIONS = ("count customers", "customers by state", "top cities")
+
+
+def _routes(tables):
+    """(name, method, path(i), json body(i)) for every benchmarked route; i is the request number."""
+    return [
+        ("extract", "GET", lambda i: "/extract", None),
+        ("profile", "GET", lambda i: f"/profile/{tables[i % len(tables)]}", None),
+        ("chat", "POST", lambda i: "/chat", lambda i: {"question": CHAT_QUESTIONS[i % len(CHAT_QUESTIONS)]}),
+        ("generate_sql", "POST", lambda i: "/generate-sql", lambda i: {"query": SQL_QUESTIONS[i % len(SQL_QUESTIONS)]}),
+        ("generate_doc", "GET", lambda i: f"/generate-doc/{tables[i % len(tables)]}", None),
+    ]
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def peak_rss_kb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage // 1024 if platform.system() == "Darwin" else usage  # bytes on macOS, KiB on Linux
+
+
+def prepare(db_path, tables, columns, rows, skew, seed):
+    """Point the backend at a fresh scratch database and fill it; returns the synthetic table names."""
+    database.DB_PATH = db_path
+    startup.MANIFEST_PATH = os.path.join(os.path.dirname(db_path), "startup_manifest.json")
+    # Startup first: create_demo_db has its own, older customers layout.
+    startup.start(skip_init=False, background=False)
+    create_demo_db.create_demo_db(db_path)
+    return create_demo_db.create_synthetic_db(db_path, tables, columns, rows, skew, seed=seed)
+
+
+def run_route(app, route, concurrency, requests):
+    name, method, path, body = route
+    clients = [app.test_client() for _ in range(concurrency)]
+    headers = {"X-DataSage-Source": "default"}
+
+    def one(i):
+        client = clients[i % concurrency]
+        started = time.perf_counter()
+        response = client.open(path(i), method=method, json=body(i) if body else None, headers=headers)
+        response.get_data()
+        return (time.perf_counter() - started) * 1000, response.status_code < 400
+
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - started
+    latencies = sorted(ms for ms, _ in outcomes)
+    return {
+        "route": name,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": sum(1 for _, ok in outcomes if not ok),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(latencies[-1], 3),
+        "throughput_rps": round(requests / wall, 1),
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def run(tables=10, columns=12, rows=10000, skew=1.1, seed=42, concurrency=(1, 4, 8), requests=200,
+        routes=None, db_path=None):
+    """Build the scratch catalog, benchmark every route at every concurrency and return the report dict."""
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="datasage-bench-"), "bench.db")
+    setup_started = time.perf_counter()
+    names = prepare(db_path, tables, columns, rows, skew, seed)
+    setup_ms = round((time.perf_counter() - setup_started) * 1000, 1)
+
+    import app as app_module  # after prepare(), so nothing touches the real database first
+    selected = [r for r in _routes(names) if not routes or r[0] in routes]
+    results = []
+    for route in selected:
+        run_route(app_module.app, route, 1, 1)  # warm-up: caches and pooled connections
+        for level in concurrency:
+            results.append(run_route(app_module.app, route, level, requests))
+    return {
+        "config": {
+            "tables": tables, "columns": columns, "rows": rows, "skew": skew, "seed": seed,
+            "concurrency": list(concurrency), "requests": requests, "database": db_path,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "setup_ms": setup_ms,
+        "results": results,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tables", type=int, default=10, help="synthetic tables")
+    parser.add_argument("--columns", type=int, default=12, help="columns per synthetic table")
+    parser.add_argument("--rows", type=int, default=10000, help="rows per synthetic table")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent for categorical values")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", default="1,4,8", help="comma-separated thread counts")
+    parser.add_argument("--requests", type=int, default=200, help="requests per route and concurrency level")
+    parser.add_argument("--routes", default="", help="comma-separated subset of routes to run")
+    parser.add_argument("--db", default=None, help="scratch database path (default: a temp dir)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="where to write the JSON report")
+    args = parser.parse_args()
+    report = run(
+        args.tables, args.columns, args.rows, args.skew, args.seed,
+        concurrency=[int(c) for c in args.concurrency.split(",") if c],
+        requests=args.requests,
+        routes=[r for r in args.routes.split(",") if r],
+        db_path=args.db,
+    )
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"{'route':<14} {'conc':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'errors':>6} {'rss MiB':>8}")
+    for r in report["results"]:
+        print(f"{r['route']:<14} {r['concurrency']:>4} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+              f"{r['p99_ms']:>9.2f} {r['throughput_rps']:>9.1f} {r['errors']:>6} {r['peak_rss_kb'] / 1024:>8.1f}")
+    print(f"setup {report['setup_ms']:.0f} ms, report written to {args.output}")
@@ -0,0 +1,169 @@
+"""Catalog-wide profiling on a process pool.
+
+Every table of the current source becomes one task; tables wider than
+WIDE_TABLE_COLUMNS are split into column groups of GROUP_COLUMNS so a single
+wide table can use several cores. Each worker process opens one read-only
+connection and runs profiler.profile_columns on its tasks, taking numeric
+columns from the memory-mapped column snapshots (building them if needed).
+The parent merges the groups back into /profile payloads and saves them in
+the profile cache, fingerprinted before profiling started so later writes
+still mark them stale.
+
+Run it nightly with `python catalog_profiler.py [--workers N] [--source NAME]`.
+"""
+import argparse
+import concurrent.futures
+import multiprocessing
+import os
+import sqlite3
+import time
+
+import database
+import profile_cache
+import profiler
+import sources
+from database import quote_identifier
+
+# Worker processes when the caller does not ask for a number: one per core.
+DEFAULT_WORKERS = int(os.environ.get("DATASAGE_PROFILE_WORKERS") or 0) or os.cpu_count() or 1
+# Upper bound on any requested count, so one request cannot fork hundreds of processes.
+MAX_WORKERS = max(int(os.environ.get("DATASAGE_PROFILE_MAX_WORKERS") or 0) or 2 * (os.cpu_count() or 1), DEFAULT_WORKERS)
+WIDE_TABLE_COLUMNS = 64
+GROUP_COLUMNS = 32
+
+_worker_pool = None
+
+
+def _init_worker(path):
+    global _worker_pool
+    _worker_pool = database.ConnectionPool(path, readonly=True)
+
+
+def _profile_task(table_name, group, columns, tag):
+    started = time.perf_counter()
+    conn = _worker_pool.reader()
+    # Snapshots are files next to the database: any worker (or the web process) maps them without copying.
+    snapshots = profiler.numeric_snapshots(conn, table_name, columns, tag=tag, db_path=_worker_pool.path)
+    row_count, stats = profiler.profile_columns(conn, table_name, columns, snapshots)
+    return table_name, group, row_count, stats, (time.perf_counter() - started) * 1000
+
+
+def _split(columns):
+    if len(columns) <= WIDE_TABLE_COLUMNS:
+        return profiler.column_groups(columns)
+    groups = []
+    for start in range(0, len(columns), GROUP_COLUMNS):
+        groups += profiler.column_groups(columns[start:start + GROUP_COLUMNS])
+    return groups
+
+
+def _estimated_rows(conn, table_name):
+    try:
+        return conn.execute(f"SELECT MAX(rowid) FROM {quote_identifier(table_name)}").fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return 0  # WITHOUT ROWID table
+
+
+def profile_catalog(tables=None, workers=None, progress=None):
+    """Profile every table (or the given ones) of the current source and save the results.
+
+    workers defaults to DEFAULT_WORKERS and is clamped to MAX_WORKERS and to
+    one per task; anything but a positive integer raises ValueError.
+    progress(done, total, message), if given, is called as each task
+    finishes; an exception it raises stops the run. Returns a summary with
+    the worker count, wall time and per-table timings.
+    """
+    if workers is not None and (isinstance(workers, bool) or not isinstance(workers, int) or workers < 1):
+        raise ValueError("workers must be a positive integer")
+    started = time.perf_counter()
+    schema = database.get_schema()
+    tables = [t for t in (tables or schema) if t in schema and schema[t]]
+    conn = database.read_connection()
+    fingerprints = {t: profile_cache.fingerprint(t) for t in tables}
+    tasks = []
+    groups = {}
+    for table_name in tables:
+        split = _split(schema[table_name])
+        groups[table_name] = len(split)
+        cost = _estimated_rows(conn, table_name) or 1
+        tasks += [(cost * len(cols), table_name, i, cols) for i, cols in enumerate(split)]
+    # Longest tasks first, so one big table does not start last and finish alone.
+    tasks.sort(key=lambda task: -task[0])
+    workers = min(workers or DEFAULT_WORKERS, MAX_WORKERS, len(tasks) or 1)
+
+    partial = {t: {"row_count": 0, "stats": {}, "cpu_ms": 0.0, "done": 0} for t in tables}
+    saved = {}
+    errors = {}
+    if tasks:
+        # spawn, not fork: the parent is usually a threaded web server.
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(os.path.abspath(database.get_pool().path),),
+        )
+        try:
+            futures = {
+                executor.submit(_profile_task, table_name, group, cols, fingerprints[table_name]): table_name
+                for _, table_name, group, cols in tasks
+            }
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                table_name = futures[future]
+                try:
+                    _, _, row_count, stats, ms = future.result()
+                except Exception as e:
+                    errors.setdefault(table_name, str(e))
+                    # The table will not be saved: drop what its groups produced and ignore the rest.
+                    partial.pop(table_name, None)
+                else:
+                    merged = partial.get(table_name)
+                    if merged is not None:
+                        merged["row_count"] = row_count
+                        merged["stats"].update(stats)
+                        merged["cpu_ms"] += ms
+                        merged["done"] += 1
+                        if merged["done"] == groups[table_name]:
+                            saved[table_name] = _save(table_name, schema[table_name], merged, fingerprints[table_name])
+                if progress is not None:
+                    progress(done, len(tasks), table_name)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+    return {
+        "source": sources.current(),
+        "workers": workers,
+        "tasks": len(tasks),
+        "tables": saved,
+        "errors": errors,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+def _save(table_name, columns, merged, fp):
+    col_names, sample_rows = database.get_table_preview(table_name)
+    stats = {c["name"]: merged["stats"][c["name"]] for c in columns}
+    profile = {
+        "table": table_name,
+        "columns": columns,
+        "row_count": merged["row_count"],
+        "sample": [dict(zip(col_names, row)) for row in sample_rows],
+        "statistics": stats,
+    }
+    cpu_ms = round(merged["cpu_ms"], 2)
+    profile_cache.store(table_name, fp, profile, cpu_ms)
+    return {"row_count": merged["row_count"], "columns": len(columns), "cpu_ms": cpu_ms}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=None, help=f"worker processes (default {DEFAULT_WORKERS})")
+    parser.add_argument("--source", default=sources.DEFAULT_SOURCE, help="data source to profile")
+    parser.add_argument("tables", nargs="*", help="tables to profile (default: all)")
+    args = parser.parse_args()
+    with sources.use(args.source):
+        summary = profile_catalog(args.tables or None, args.workers)
+    for table_name, info in summary["tables"].items():
+        print(f"{table_name:<32} {info['row_count']:>10} rows {info['columns']:>5} cols {info['cpu_ms']:>10.1f} ms")
+    for table_name, error in summary["errors"].items():
+        print(f"{table_name:<32} error: {error}")
+    print(f"{len(summary['tables'])} tables, {summary['tasks']} tasks on {summary['workers']} workers "
+          f"in {summary['duration_ms']:.0f} ms")
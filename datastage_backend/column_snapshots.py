@@ -0,0 +1,382 @@
+"""Columnar snapshots: numeric columns extracted into sorted, memory-mapped typed arrays.
+
+A snapshot file holds one column's numeric values, sorted, as a raw array
+(int64 when every value is an integer, float64 otherwise) after a small JSON
+header with the tag it was built at, the null and non-numeric counts and the
+mean and sum of squared deviations from it. The tag is the column signature
+plus the table's change-tracking version, so a snapshot is valid exactly
+until the table is written to or its columns change.
+
+Values are read in order from SQLite (ORDER BY) and written in FETCH_SIZE
+batches, so a build never holds a column in Python. Files are written to a
+temporary name and renamed into place, and read
+through mmap, so every process (request threads, catalog_profiler workers)
+shares the same page-cache copy without parsing or copying it. Because the
+values are sorted, min/max and quantiles are index lookups, histograms are a
+bisect per bin edge, and distinct/top values come from run boundaries found
+by mapping operator.ne over two views of the buffer.
+"""
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import mmap
+import operator
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+import database
+import sketches
+from database import quote_identifier
+
+ENABLED = os.environ.get("DATASAGE_SNAPSHOTS", "1") != "0"
+SNAPSHOT_DIR = os.environ.get("DATASAGE_SNAPSHOT_DIR")  # default: .datasage_snapshots next to the database
+FETCH_SIZE = 5000
+FORMAT_VERSION = 2
+# Snapshots kept mapped by this process, least recently used dropped first.
+MAX_OPEN = 256
+HISTOGRAM_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+_HEADER = struct.Struct("<Q")
+# Room left in the header for the count and moments, which are only known once the values are written.
+_HEADER_SLACK = 256
+
+_lock = threading.Lock()
+_open = OrderedDict()  # file path -> Snapshot mapped by this process
+_stats = {"hits": 0, "loaded": 0, "built": 0, "build_ms": 0.0}
+
+
+class Snapshot:
+    """One mapped column snapshot; `values` is a zero-copy memoryview of the sorted array."""
+
+    def __init__(self, path, meta, values, mapped):
+        self.path = path
+        self.meta = meta
+        self.values = values
+        self._mapped = mapped
+        self._runs = None
+
+    @property
+    def count(self):
+        return self.meta["count"]
+
+    @property
+    def nulls(self):
+        return self.meta["nulls"]
+
+    @property
+    def usable(self):
+        """False when the column also holds text or blobs, which the snapshot leaves out."""
+        return self.meta["non_numeric"] == 0
+
+    def _run_bounds(self):
+        """Start offsets of each run of equal values, plus the end."""
+        if self._runs is None:
+            v = self.values
+            starts = itertools.compress(itertools.count(1), map(operator.ne, v[1:], v))
+            self._runs = [0, *starts, len(v)] if len(v) else [0]
+        return self._runs
+
+    def distinct(self):
+        return len(self._run_bounds()) - 1
+
+    def top_values(self, k):
+        bounds = self._run_bounds()
+        lengths = list(map(operator.sub, bounds[1:], bounds))
+        top = heapq.nlargest(k, range(len(lengths)), key=lengths.__getitem__)
+        return [{"value": self.values[bounds[i]], "count": lengths[i]} for i in top]
+
+    def mean(self):
+        return self.meta["mean"] if self.count else None
+
+    def stddev(self):
+        n = self.count
+        return math.sqrt(self.meta["m2"] / (n - 1)) if n > 1 else None
+
+    def quantile(self, q):
+        """Linearly interpolated quantile, q in [0, 1]."""
+        n = self.count
+        if not n:
+            return None
+        pos = q * (n - 1)
+        lo = int(pos)
+        hi = min(lo + 1, n - 1)
+        return self.values[lo] + (self.values[hi] - self.values[lo]) * (pos - lo)
+
+    def histogram(self, bins=20, low=None, high=None):
+        """[{"low", "high", "count"}] over equal-width bins (the last bin includes high)."""
+        v = self.values
+        if not len(v):
+            return []
+        low = v[0] if low is None else low
+        high = v[-1] if high is None else high
+        if high <= low:
+            return [{"low": low, "high": high, "count": bisect_right(v, high) - bisect_left(v, low)}]
+        width = (high - low) / bins
+        edges = [low + width * i for i in range(bins)] + [high]
+        positions = [bisect_left(v, e) for e in edges[:-1]] + [bisect_right(v, high)]
+        return [
+            {"low": edges[i], "high": edges[i + 1], "count": positions[i + 1] - positions[i]}
+            for i in range(bins)
+        ]
+
+    def profile_stats(self, top_k):
+        """The profiler's numeric column stats, computed from the snapshot."""
+        avg = self.mean()
+        stddev = self.stddev()
+        return {
+            "min": self.values[0] if self.count else None,
+            "max": self.values[-1] if self.count else None,
+            "avg": round(avg, 2) if avg is not None else None,
+            "stddev": round(stddev, 2) if stddev is not None else None,
+            "distinct": self.distinct(),
+            "nulls": self.nulls,
+            "top_values": self.top_values(top_k),
+        }
+
+
+def snapshot_dir(db_path=None):
+    """Directory of the snapshots of db_path (default: the current source's database)."""
+    path = os.path.abspath(db_path or database.get_pool().path)
+    base = SNAPSHOT_DIR or os.path.join(os.path.dirname(path), ".datasage_snapshots")
+    return os.path.join(base, hashlib.sha1(path.encode("utf-8")).hexdigest()[:12])
+
+
+def _file_name(table_name, column):
+    digest = hashlib.sha1(json.dumps([table_name, column]).encode("utf-8")).hexdigest()[:16]
+    return f"{digest}.col"
+
+
+def table_tag(table_name, columns=None):
+    """Column signature plus change-tracking version; changes whenever the snapshot would."""
+    columns = columns if columns is not None else database.get_table_info(table_name)
+    shape = json.dumps([(c["name"], c["type"]) for c in columns])
+    digest = hashlib.sha1(shape.encode("utf-8")).hexdigest()[:12]
+    return f"{digest}:{database.get_table_version(table_name)}"
+
+
+def open_snapshot(path):
+    """Map a snapshot file; returns None if it is missing or unreadable."""
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size:
+                return None
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    (header_len,) = _HEADER.unpack_from(mapped, 0)
+    meta = json.loads(mapped[_HEADER.size:_HEADER.size + header_len])
+    if meta.get("format") != FORMAT_VERSION or meta.get("byteorder") != sys.byteorder:
+        return None
+    offset = meta["offset"]
+    itemsize = array(meta["typecode"]).itemsize
+    view = memoryview(mapped)[offset:offset + meta["count"] * itemsize].cast(meta["typecode"])
+    return Snapshot(path, meta, view, mapped)
+
+
+def _write(path, meta, typecode, batches):
+    """Write a snapshot from sorted batches of values.
+
+    The header records their count and moments, so it is written last, into
+    space reserved ahead of the array.
+    """
+    header = dict(meta, format=FORMAT_VERSION, byteorder=sys.byteorder, typecode=typecode,
+                  count=0, mean=0.0, m2=0.0, offset=0)
+    offset = _HEADER.size + len(json.dumps(header).encode("utf-8")) + _HEADER_SLACK
+    offset += -offset % 8  # align the array to 8 bytes
+    moments = sketches.Moments()
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.seek(offset)
+        for batch in batches:
+            values = array(typecode, batch)
+            moments.update_values(values)
+            values.tofile(f)
+        header.update(count=moments.n, mean=moments.mean, m2=moments.m2, offset=offset)
+        raw = json.dumps(header).encode("utf-8")
+        f.seek(0)
+        f.write(_HEADER.pack(len(raw)))
+        f.write(raw)
+    os.replace(tmp, path)
+
+
+def _sorted_batches(cur):
+    while True:
+        rows = cur.fetchmany(FETCH_SIZE)
+        if not rows:
+            return
+        yield [row[0] for row in rows]
+
+
+def build(conn, table_name, columns, tag, directory):
+    """Write a snapshot of each of columns (names) of table_name into directory; returns their paths.
+
+    One aggregate scan counts each column's nulls, floats and non-numeric
+    values; then each column's numbers are read sorted.
+    """
+    started = time.perf_counter()
+    qt = quote_identifier(table_name)
+    exprs = []
+    for column in columns:
+        q = quote_identifier(column)
+        exprs += [f"COUNT(*) - COUNT({q})", f"SUM(typeof({q}) = 'real')", f"SUM(typeof({q}) IN ('text', 'blob'))"]
+    counts = conn.execute(f"SELECT {', '.join(exprs)} FROM {qt}").fetchone()
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for i, column in enumerate(columns):
+        nulls, floats, non_numeric = (n or 0 for n in counts[3 * i:3 * i + 3])
+        q = quote_identifier(column)
+        cur = conn.execute(f"SELECT {q} FROM {qt} WHERE typeof({q}) IN ('integer', 'real') ORDER BY {q}")
+        meta = {
+            "table": table_name,
+            "column": column,
+            "tag": tag,
+            "nulls": nulls,
+            "non_numeric": non_numeric,
+            "built_at": time.time(),
+        }
+        paths[column] = os.path.join(directory, _file_name(table_name, column))
+        _write(paths[column], meta, "d" if floats else "q", _sorted_batches(cur))
+    with _lock:
+        _stats["built"] += len(columns)
+        _stats["build_ms"] += (time.perf_counter() - started) * 1000
+    return paths
+
+
+def _remember(path, snap):
+    with _lock:
+        _open[path] = snap
+        _open.move_to_end(path)
+        while len(_open) > MAX_OPEN:
+            _open.popitem(last=False)
+
+
+def get(table_name, columns, tag=None, conn=None, db_path=None, build_missing=True):
+    """{column: Snapshot} for the given numeric column names, valid at tag.
+
+    Snapshots that are missing or built at another tag are rebuilt in one
+    scan when build_missing is set, otherwise left out. tag defaults to
+    table_tag(table_name); processes without the source registry, such as
+    catalog_profiler workers, pass tag, conn and db_path explicitly.
+    """
+    if not columns:
+        return {}
+    tag = tag or table_tag(table_name)
+    directory = snapshot_dir(db_path)
+    found = {}
+    stale = []
+    for column in columns:
+        path = os.path.join(directory, _file_name(table_name, column))
+        with _lock:
+            snap = _open.get(path)
+            if snap is not None and snap.meta["tag"] == tag:
+                _open.move_to_end(path)
+                _stats["hits"] += 1
+                found[column] = snap
+                continue
+        snap = open_snapshot(path)
+        if snap is not None and snap.meta["tag"] == tag:
+            with _lock:
+                _stats["loaded"] += 1
+            _remember(path, snap)
+            found[column] = snap
+        else:
+            stale.append(column)
+    if stale and build_missing:
+        for column, path in build(conn or database.read_connection(), table_name, stale, tag, directory).items():
+            snap = open_snapshot(path)
+            if snap is not None:
+                _remember(path, snap)
+                found[column] = snap
+    return found
+
+
+def _sql_distribution(table_name, column, bins, low, high):
+    """distribution() computed with SQL, over the column's numeric values."""
+    conn = database.read_connection()
+    q = quote_identifier(column)
+    qt = quote_identifier(table_name)
+    numeric = f"typeof({q}) IN ('integer', 'real')"
+    count, nulls, non_numeric, lo, hi, mean = conn.execute(
+        f"SELECT SUM({numeric}), COUNT(*) - COUNT({q}), SUM(typeof({q}) IN ('text', 'blob')), "
+        f"MIN(CASE WHEN {numeric} THEN {q} END), MAX(CASE WHEN {numeric} THEN {q} END), "
+        f"AVG(CASE WHEN {numeric} THEN {q} END) FROM {qt}"
+    ).fetchone()
+    count = count or 0
+    stddev = None
+    if count > 1:
+        m2 = conn.execute(f"SELECT SUM(({q} - ?) * ({q} - ?)) FROM {qt} WHERE {numeric}", (mean, mean)).fetchone()[0]
+        stddev = math.sqrt(m2 / (count - 1))
+    quantiles = {}
+    for quantile in HISTOGRAM_QUANTILES:
+        if not count:
+            quantiles[str(quantile)] = None
+            continue
+        pos = quantile * (count - 1)
+        pair = [row[0] for row in conn.execute(
+            f"SELECT {q} FROM {qt} WHERE {numeric} ORDER BY {q} LIMIT 2 OFFSET ?", (int(pos),)
+        )]
+        quantiles[str(quantile)] = pair[0] + (pair[-1] - pair[0]) * (pos - int(pos))
+    histogram = []
+    if count:
+        low = lo if low is None else low
+        high = hi if high is None else high
+        in_range = f"{numeric} AND {q} >= ? AND {q} <= ?"
+        if high <= low:
+            n = conn.execute(f"SELECT COUNT(*) FROM {qt} WHERE {in_range}", (low, high)).fetchone()[0]
+            histogram = [{"low": low, "high": high, "count": n}]
+        else:
+            width = (high - low) / bins
+            counts = dict(conn.execute(
+                f"SELECT MIN(CAST(({q} - ?) / ? AS INTEGER), ?), COUNT(*) FROM {qt} WHERE {in_range} GROUP BY 1",
+                (low, width, bins - 1, low, high),
+            ))
+            edges = [low + width * i for i in range(bins)] + [high]
+            histogram = [{"low": edges[i], "high": edges[i + 1], "count": counts.get(i, 0)} for i in range(bins)]
+    return {
+        "count": count,
+        "nulls": nulls,
+        "non_numeric": non_numeric or 0,
+        "min": lo,
+        "max": hi,
+        "mean": mean,
+        "stddev": stddev,
+        "quantiles": quantiles,
+        "bins": histogram,
+        "snapshot": None,
+    }
+
+
+def distribution(table_name, column, bins=20, low=None, high=None):
+    """Count, range, mean, stddev, quantiles and an equal-width histogram of a numeric column.
+
+    Read from the column's snapshot when snapshots are enabled and the column
+    holds only numbers, otherwise computed with SQL.
+    """
+    snap = get(table_name, [column]).get(column) if ENABLED else None
+    if snap is None or not snap.usable:
+        return _sql_distribution(table_name, column, bins, low, high)
+    return {
+        "count": snap.count,
+        "nulls": snap.nulls,
+        "non_numeric": snap.meta["non_numeric"],
+        "min": snap.values[0] if snap.count else None,
+        "max": snap.values[-1] if snap.count else None,
+        "mean": snap.mean(),
+        "stddev": snap.stddev(),
+        "quantiles": {str(q): snap.quantile(q) for q in HISTOGRAM_QUANTILES},
+        "bins": snap.histogram(bins, low, high),
+        "snapshot": {"tag": snap.meta["tag"], "built_at": snap.meta["built_at"]},
+    }
+
+
+def stats():
+    with _lock:
+        return {**_stats, "build_ms": round(_stats["build_ms"], 2), "mapped": len(_open), "enabled": ENABLED}
@@ -3,6 +3,7 @@ import json
 import os
 
 CONNECTION_PATH = os.path.join(os.path.dirname(__file__), "connection_config.json")
+SOURCES_PATH = os.path.join(os.path.dirname(__file__), "sources.json")
 
 def save_connection(config):
     """Save connection config (type, host, port, username, database)."""
@@ -21,3 +22,21 @@ def get_connection():
             return json.load(f)
     except (json.JSONDecodeError, OSError):
         return None
+
+def save_sources(sources):
+    """Save registered data sources ({name: config}, see sources.py)."""
+    try:
+        with open(SOURCES_PATH, "w", encoding="utf-8") as f:
+            json.dump(sources, f, indent=2)
+    except OSError:
+        pass
+
+def get_sources():
+    """Return saved data sources ({name: config}), empty if none."""
+    if not os.path.isfile(SOURCES_PATH):
+        return {}
+    try:
+        with open(SOURCES_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError):
+        return {}
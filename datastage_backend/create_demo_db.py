@@ -1,10 +1,31 @@
+import argparse
+import bisect
+import itertools
+import random
 import sqlite3
-from database import DB_PATH
+from database import DB_PATH, quote_identifier
 
+# Column kinds used by the synthetic generator, with their share of the columns.
+TYPE_MIX = (
+  ("category", "TEXT", 0.25),
+  ("text", "TEXT", 0.15),
+  ("email", "TEXT", 0.05),
+  ("date", "TEXT", 0.10),
+  ("count", "INTEGER", 0.20),
+  ("amount", "REAL", 0.20),
+  ("flag", "INTEGER", 0.05),
+)
+WORDS = (
+  "alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india",
+  "juliet", "kilo", "lima", "mike", "november", "oscar", "papa", "quebec", "romeo",
+  "sierra", "tango", "uniform", "victor", "whiskey", "xray", "yankee", "zulu",
+)
+INSERT_BATCH = 5000
 
-def create_demo_db():
+
+def create_demo_db(path=DB_PATH):
   """Create simple demo tables for training in the existing SQLite DB."""
-  conn = sqlite3.connect(DB_PATH)
+  conn = sqlite3.connect(path)
   cursor = conn.cursor()
 
   cursor.execute(
@@ -58,7 +79,99 @@ def create_demo_db():
   conn.close()
 
 
+class _Zipf:
+  """Draws ranks 0..n-1 with probability proportional to 1 / (rank + 1) ** skew."""
+
+  def __init__(self, n, skew, rng):
+    self.rng = rng
+    self.cumulative = list(itertools.accumulate(1.0 / (k + 1) ** skew for k in range(n)))
+
+  def __call__(self):
+    return bisect.bisect(self.cumulative, self.rng.random() * self.cumulative[-1])
+
+
+def _column_plan(columns, rng):
+  kinds = [kind for kind, _, _ in TYPE_MIX]
+  weights = [share for _, _, share in TYPE_MIX]
+  types = {kind: col_type for kind, col_type, _ in TYPE_MIX}
+  plan = []
+  for i in range(columns):
+    kind = rng.choices(kinds, weights)[0]
+    plan.append((f"{kind}_{i}", kind, types[kind]))
+  return plan
+
+
+def _value_maker(kind, skew, null_rate, rng):
+  if kind == "category":
+    cardinality = rng.choice((5, 20, 100, 1000))
+    pick = _Zipf(cardinality, skew, rng)
+    labels = [f"{WORDS[k % len(WORDS)]}_{k}" for k in range(cardinality)]
+    make = lambda: labels[pick()]
+  elif kind == "text":
+    make = lambda: " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 6)))
+  elif kind == "email":
+    domains = _Zipf(len(WORDS), skew, rng)
+    make = lambda: f"{rng.choice(WORDS)}.{rng.randint(1, 99999)}@{WORDS[domains()]}.com"
+  elif kind == "date":
+    make = lambda: f"20{rng.randint(15, 25)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+  elif kind == "count":
+    pick = _Zipf(10000, skew, rng)
+    make = pick
+  elif kind == "amount":
+    make = lambda: round(rng.lognormvariate(3, 1.2), 2)
+  else:
+    make = lambda: int(rng.random() < 0.3)
+  if not null_rate:
+    return make
+  return lambda: None if rng.random() < null_rate else make()
+
+
+def create_synthetic_db(path=DB_PATH, tables=10, columns=12, rows=10000, skew=1.1,
+                        null_rate=0.05, seed=42, prefix="synthetic"):
+  """Create tables synthetic_0..N-1 with an id plus M typed columns and R rows each.
+
+  Columns follow TYPE_MIX (categories, free text, emails, dates, counts,
+  amounts, flags); categorical and count values are Zipf-distributed with
+  the given skew, amounts are log-normal and null_rate of values are NULL.
+  Existing synthetic tables are replaced. Returns the table names.
+  """
+  rng = random.Random(seed)
+  conn = sqlite3.connect(path)
+  names = []
+  try:
+    for t in range(tables):
+      name = f"{prefix}_{t}"
+      plan = _column_plan(columns, rng)
+      makers = [_value_maker(kind, skew, null_rate, rng) for _, kind, _ in plan]
+      col_defs = ", ".join(f"{quote_identifier(col)} {col_type}" for col, _, col_type in plan)
+      conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(name)}")
+      conn.execute(f"CREATE TABLE {quote_identifier(name)} (id INTEGER PRIMARY KEY, {col_defs})")
+      insert = (
+        f"INSERT INTO {quote_identifier(name)} ({', '.join(quote_identifier(c) for c, _, _ in plan)}) "
+        f"VALUES ({', '.join('?' for _ in plan)})"
+      )
+      for start in range(0, rows, INSERT_BATCH):
+        batch = [[make() for make in makers] for _ in range(min(INSERT_BATCH, rows - start))]
+        conn.executemany(insert, batch)
+      conn.commit()
+      names.append(name)
+  finally:
+    conn.close()
+  return names
+
+
 if __name__ == "__main__":
-  create_demo_db()
+  parser = argparse.ArgumentParser(description="Create the demo tables, optionally with a synthetic catalog.")
+  parser.add_argument("--db", default=DB_PATH, help="SQLite file to write")
+  parser.add_argument("--tables", type=int, default=0, help="synthetic tables to generate")
+  parser.add_argument("--columns", type=int, default=12, help="columns per synthetic table")
+  parser.add_argument("--rows", type=int, default=10000, help="rows per synthetic table")
+  parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent for categorical values")
+  parser.add_argument("--seed", type=int, default=42)
+  args = parser.parse_args()
+  create_demo_db(args.db)
   print("Demo database created successfully!")
+  if args.tables:
+    names = create_synthetic_db(args.db, args.tables, args.columns, args.rows, args.skew, seed=args.seed)
+    print(f"Created {len(names)} synthetic tables with {args.columns} columns and {args.rows} rows each.")
 
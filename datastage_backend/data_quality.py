@@ -0,0 +1,374 @@
+"""Data-quality scanner: column rules evaluated chunk by chunk, with per-column scores.
+
+Tables are read in rowid order, CHUNK_SIZE rows at a time. Each chunk is
+turned into column arrays and every rule runs over a whole array at once
+(precompiled regexes mapped over the values, str.strip over the text, and so
+on). The rules that apply depend on the column:
+
+  nulls         every column
+  pattern       email, phone and zip/postal columns, by name
+  whitespace    text values with leading or trailing whitespace
+  out_of_range  numeric columns: non-numbers, and values outside RANGES
+  duplicates    key-like columns (id, <table>_id) that SQLite does not keep unique
+
+Violation counts are accumulated per column in _ds_quality_columns, and
+_ds_quality_checkpoints remembers the last rowid scanned (both in the
+source's state database, see sources.state_path), so an incremental run
+only reads rows appended since. Runs fall back to a full rescan when
+the table's columns changed or rows were removed past the checkpoint; use
+full=True after updating existing rows. Duplicates are counted with one
+GROUP BY per key column per run, since new rows can repeat old keys.
+
+A column's score is the mean pass rate of its rules; rules whose violation
+rate is over ALERT_RATES are reported as alerts.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import time
+
+import database
+import profiler
+import settings_store
+from database import quote_identifier
+
+QUALITY_TABLE = f"{database.INTERNAL_PREFIX}quality_columns"
+CHECKPOINT_TABLE = f"{database.INTERNAL_PREFIX}quality_checkpoints"
+CHUNK_SIZE = 5000
+
+PATTERNS = {
+    "email": re.compile(r"[A-Za-z0-9._%+'-]+@[A-Za-z0-9-]+(\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}"),
+    "phone": re.compile(r"(\+?1[ .-]?)?(\(\d{3}\)|\d{3})[ .-]?\d{3}[ .-]?\d{4}|\+\d[\d .-]{6,18}\d"),
+    "zip": re.compile(r"\d{5}(-\d{4})?"),
+}
+# Column-name keywords -> (low, high) accepted for numeric columns; None is unbounded.
+RANGES = {
+    "age": (0, 150),
+    "percent": (0, 100),
+    "latitude": (-90, 90),
+    "longitude": (-180, 180),
+    "salary": (0, None),
+    "price": (0, None),
+    "amount": (0, None),
+    "quantity": (0, None),
+    "count": (0, None),
+}
+# Violation rate above which a rule raises an alert.
+ALERT_RATES = {"nulls": 0.2, "pattern": 0.01, "whitespace": 0.01, "out_of_range": 0.01, "duplicates": 0.0}
+
+
+def _pattern_for(name):
+    name = name.lower()
+    if "email" in name:
+        return "email"
+    if "phone" in name or "mobile" in name:
+        return "phone"
+    if "zip" in name or "postal" in name:
+        return "zip"
+    return None
+
+
+def _range_for(name):
+    words = name.lower().split("_")
+    return next((bounds for keyword, bounds in RANGES.items() if keyword in words), None)
+
+
+def _unique_columns(conn, table_name):
+    """Columns SQLite already keeps unique: the rowid alias and single-column unique indexes."""
+    unique = set()
+    qt = quote_identifier(table_name)
+    for _, name, col_type, _, _, pk in conn.execute(f"PRAGMA table_info({qt})").fetchall():
+        if pk == 1 and col_type.upper() == "INTEGER":
+            unique.add(name)
+    for _, index, is_unique, _, _ in conn.execute(f"PRAGMA index_list({qt})").fetchall():
+        if is_unique:
+            cols = conn.execute(f"PRAGMA index_info({quote_identifier(index)})").fetchall()
+            if len(cols) == 1:
+                unique.add(cols[0][2])
+    return unique
+
+
+def column_rules(conn, table_name, columns, ranges=None, keys=None):
+    """{column: {"pattern", "range", "numeric", "key"}} describing which rules apply.
+
+    ranges ({column: (low, high)}) and keys (column names) override the
+    name-based defaults.
+    """
+    unique = _unique_columns(conn, table_name)
+    singular = table_name.lower()[:-1] if table_name.lower().endswith("s") else table_name.lower()
+    own_key = f"{singular}_id"
+    rules = {}
+    for col in columns:
+        name = col["name"]
+        numeric = profiler.is_numeric_type(col["type"])
+        key = name in keys if keys is not None else name.lower() in ("id", own_key)
+        rules[name] = {
+            "pattern": _pattern_for(name),
+            "range": tuple((ranges or {}).get(name) or ()) or (_range_for(name) if numeric else None),
+            "numeric": numeric,
+            "key": key and name not in unique,
+        }
+    return rules
+
+
+def _empty_counts():
+    return {"rows": 0, "nulls": 0, "checked": 0, "pattern": 0, "whitespace": 0, "out_of_range": 0, "duplicates": 0}
+
+
+def _check_values(values, rule, counts):
+    """Apply the column's rules to one chunk of values, adding to counts."""
+    counts["rows"] += len(values)
+    nulls = values.count(None)
+    counts["nulls"] += nulls
+    present = [v for v in values if v is not None]
+    texts = [v for v in present if isinstance(v, str)]
+    if texts:
+        counts["whitespace"] += sum(map(str.__ne__, texts, map(str.strip, texts)))
+    pattern = rule["pattern"]
+    if pattern and present:
+        strings = [s.strip() for s in map(str, present)]
+        counts["checked"] += len(strings)
+        counts["pattern"] += len(strings) - sum(map(bool, map(PATTERNS[pattern].fullmatch, strings)))
+    if rule["numeric"] and present:
+        numbers = [v for v in present if isinstance(v, (int, float))]
+        bad = len(present) - len(numbers)
+        low, high = rule["range"] or (None, None)
+        if low is not None:
+            bad += sum(1 for v in numbers if v < low)
+        if high is not None:
+            bad += sum(1 for v in numbers if v > high)
+        counts["out_of_range"] += bad
+
+
+def _duplicates(conn, table_name, column, checkpoint):
+    """Rows after checkpoint whose value already appeared in an earlier row."""
+    qc = quote_identifier(column)
+    row = conn.execute(
+        f"""SELECT COALESCE(SUM(added - (first_rowid > ?)), 0) FROM (
+                SELECT SUM(rowid > ?) AS added, MIN(rowid) AS first_rowid
+                FROM {quote_identifier(table_name)} WHERE {qc} IS NOT NULL
+                GROUP BY {qc} HAVING COUNT(*) > 1
+            )""",
+        (checkpoint, checkpoint),
+    ).fetchone()
+    return row[0]
+
+
+def _rule_rates(counts, rule):
+    """Violation rate per applicable rule."""
+    rows = counts["rows"]
+    present = rows - counts["nulls"]
+    rates = {"nulls": counts["nulls"] / rows if rows else 0.0}
+    if not rule["numeric"]:
+        rates["whitespace"] = counts["whitespace"] / present if present else 0.0
+    if rule["pattern"]:
+        rates["pattern"] = counts["pattern"] / counts["checked"] if counts["checked"] else 0.0
+    if rule["numeric"]:
+        rates["out_of_range"] = counts["out_of_range"] / present if present else 0.0
+    if rule["key"]:
+        rates["duplicates"] = counts["duplicates"] / present if present else 0.0
+    return rates
+
+
+def _column_report(name, counts, rule):
+    rates = _rule_rates(counts, rule)
+    return {
+        "column": name,
+        "score": round(sum(1 - r for r in rates.values()) / len(rates), 4),
+        "rules": {rule_name: round(rate, 4) for rule_name, rate in rates.items()},
+        "counts": counts,
+        "alerts": [rule_name for rule_name, rate in rates.items() if rate > ALERT_RATES[rule_name]],
+        "pattern": rule["pattern"],
+        "range": rule["range"],
+    }
+
+
+def _ensure_tables(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {QUALITY_TABLE} (
+            table_name TEXT NOT NULL,
+            column_name TEXT NOT NULL,
+            score REAL NOT NULL,
+            alerts INTEGER NOT NULL,
+            report TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (table_name, column_name)
+        )
+    """)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+            table_name TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            last_rowid INTEGER,
+            rows INTEGER NOT NULL,
+            scanned_at REAL NOT NULL
+        )
+    """)
+
+
+def _fingerprint(columns, rules):
+    material = json.dumps([[c["name"], c["type"]] for c in columns] + [rules], sort_keys=True, default=str)
+    return hashlib.sha1(material.encode("utf-8")).hexdigest()[:16]
+
+
+def _stored(conn, table_name):
+    """(checkpoint row, {column: counts}) from the last run, or (None, {})."""
+    try:
+        checkpoint = conn.execute(
+            f"SELECT fingerprint, last_rowid, rows FROM {CHECKPOINT_TABLE} WHERE table_name = ?", (table_name,)
+        ).fetchone()
+        rows = conn.execute(
+            f"SELECT column_name, report FROM {QUALITY_TABLE} WHERE table_name = ?", (table_name,)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return None, {}
+    return checkpoint, {name: json.loads(report)["counts"] for name, report in rows}
+
+
+def _rowid_count(conn, table_name, last_rowid):
+    """Rows at or before last_rowid, or None for WITHOUT ROWID tables."""
+    try:
+        return conn.execute(
+            f"SELECT COUNT(*) FROM {quote_identifier(table_name)} WHERE rowid <= ?", (last_rowid,)
+        ).fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+
+
+def _iter_chunks(conn, table_name, names, after, chunk_size):
+    """Yield (rows, last_rowid) after rowid `after`, in rowid order."""
+    select = ", ".join(quote_identifier(n) for n in names)
+    qt = quote_identifier(table_name)
+    while True:
+        rows = conn.execute(
+            f"SELECT rowid, {select} FROM {qt} WHERE rowid > ? ORDER BY rowid LIMIT ?", (after, chunk_size)
+        ).fetchall()
+        if not rows:
+            return
+        after = rows[-1][0]
+        yield rows, after
+
+
+def _iter_all(conn, table_name, names, chunk_size):
+    """WITHOUT ROWID tables: one pass with fetchmany, no checkpoint."""
+    select = ", ".join(quote_identifier(n) for n in names)
+    cursor = conn.execute(f"SELECT NULL, {select} FROM {quote_identifier(table_name)}")
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield rows, None
+
+
+def scan(table_name, full=False, ranges=None, keys=None, chunk_size=CHUNK_SIZE):
+    """Scan table_name (only rows added since the last run unless full) and store the column scores.
+
+    ranges and keys override the default rules (see column_rules). Returns
+    the table report (see report()) plus scan details.
+    """
+    started = time.perf_counter()
+    columns = database.get_table_info(table_name)
+    names = [c["name"] for c in columns]
+    conn = database.read_connection()
+    rules = column_rules(conn, table_name, columns, ranges, keys)
+    fp = _fingerprint(columns, rules)
+    checkpoint, previous = _stored(database.state_connection(), table_name)
+    has_rowid = _rowid_count(conn, table_name, 0) is not None
+    # Only valid while every row counted last time is still there.
+    incremental = (
+        not full and has_rowid and checkpoint is not None and checkpoint[0] == fp
+        and checkpoint[1] is not None and set(previous) == set(names)
+        and _rowid_count(conn, table_name, checkpoint[1]) == checkpoint[2]
+    )
+    after = checkpoint[1] if incremental else 0
+    counts = {n: dict(previous[n]) if incremental else _empty_counts() for n in names}
+    chunks = _iter_chunks(conn, table_name, names, after, chunk_size) if has_rowid else \
+        _iter_all(conn, table_name, names, chunk_size)
+    scanned = 0
+    last_rowid = after
+    for rows, last in chunks:
+        scanned += len(rows)
+        last_rowid = last
+        for name, values in zip(names, list(zip(*rows))[1:]):
+            _check_values(values, rules[name], counts[name])
+    if scanned and has_rowid:
+        for name in names:
+            if rules[name]["key"]:
+                counts[name]["duplicates"] += _duplicates(conn, table_name, name, after)
+
+    now = time.time()
+    reports = [_column_report(name, counts[name], rules[name]) for name in names]
+    with database.state_write_connection() as wconn:
+        _ensure_tables(wconn)
+        wconn.execute(f"DELETE FROM {QUALITY_TABLE} WHERE table_name = ?", (table_name,))
+        wconn.executemany(
+            f"INSERT INTO {QUALITY_TABLE} VALUES (?, ?, ?, ?, ?, ?)",
+            [(table_name, r["column"], r["score"], len(r["alerts"]), json.dumps(r, default=str), now)
+             for r in reports],
+        )
+        wconn.execute(
+            f"INSERT OR REPLACE INTO {CHECKPOINT_TABLE} VALUES (?, ?, ?, ?, ?)",
+            (table_name, fp, last_rowid if has_rowid else None, counts[names[0]]["rows"] if names else 0, now),
+        )
+    result = _table_report(table_name, reports, now)
+    result["scan"] = {
+        "incremental": incremental,
+        "rows_scanned": scanned,
+        "from_rowid": after if has_rowid else None,
+        "checkpoint": last_rowid if has_rowid else None,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+    return result
+
+
+def _table_report(table_name, reports, scanned_at):
+    return {
+        "table": table_name,
+        "score": round(sum(r["score"] for r in reports) / len(reports), 4) if reports else None,
+        "rows": reports[0]["counts"]["rows"] if reports else 0,
+        "scanned_at": scanned_at,
+        "columns": {r["column"]: r for r in reports},
+        "alerts": [{"column": r["column"], "rule": rule} for r in reports for rule in r["alerts"]],
+    }
+
+
+def report(table_name):
+    """The stored scores for table_name, or None if it has not been scanned."""
+    try:
+        rows = database.state_connection().execute(
+            f"SELECT report, updated_at FROM {QUALITY_TABLE} WHERE table_name = ?", (table_name,)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return None
+    if not rows:
+        return None
+    order = {c["name"]: i for i, c in enumerate(database.get_table_info(table_name))}
+    reports = sorted((json.loads(r) for r, _ in rows), key=lambda r: order.get(r["column"], len(order)))
+    return _table_report(table_name, reports, max(at for _, at in rows))
+
+
+def summary():
+    """Score and alert count of every scanned table in the current source."""
+    try:
+        rows = database.state_connection().execute(
+            f"SELECT table_name, AVG(score), MAX(updated_at), SUM(alerts) "
+            f"FROM {QUALITY_TABLE} GROUP BY table_name ORDER BY table_name"
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return []
+    schema = database.get_schema()
+    return [
+        {
+            "table": table_name,
+            "score": round(score, 4),
+            "scanned_at": scanned_at,
+            "alerts": alerts,
+        }
+        for table_name, score, scanned_at, alerts in rows
+        if table_name in schema
+    ]
+
+
+def alerts_enabled():
+    return settings_store.notification_enabled("dataQualityAlerts")
@@ -1,25 +1,518 @@
 import sqlite3
 import os
 import csv
+import hashlib
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import metrics
 
 DB_PATH = "datasage.db"
 CUSTOMERS_CSV_PATH = os.environ.get("CUSTOMERS_CSV_PATH") or os.path.join(
     os.path.dirname(__file__), "customers.csv"
 )
 
+# Connection tuning applied to every pooled connection.
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 16000
+MMAP_SIZE = 256 * 1024 * 1024
+# Pooled connections idle for longer than this are pinged before reuse.
+HEALTH_CHECK_INTERVAL = 30.0
+# Released read connections kept open per pool for the next request; extra ones are closed.
+MAX_IDLE_READERS = int(os.environ.get("DATASAGE_MAX_IDLE_READERS") or 16)
+# Tables starting with this prefix hold DataSage bookkeeping and are hidden from the catalog.
+INTERNAL_PREFIX = "_ds_"
+# Tables listed here have DataSage's triggers switched off (see trigger_guard).
+SUSPENDED_TRIGGERS = f"{INTERNAL_PREFIX}suspended_triggers"
+# Rows per executemany batch when importing the customers CSV.
+CSV_CHUNK_SIZE = 5000
+CUSTOMER_COLUMNS = (
+    "customer_id", "first_name", "last_name", "phone", "email",
+    "street", "city", "state", "zip_code",
+)
+
 
-def _nullable(s):
-    """Convert 'NULL' or empty string to None for SQLite."""
-    if s is None or (isinstance(s, str) and s.strip().upper() in ("", "NULL")):
-        return None
-    return s.strip() if isinstance(s, str) else s
+class ConnectionPool:
+    """Read connections from a bounded idle queue plus a single serialized writer for one SQLite file.
+
+    A thread keeps the reader it checked out until release(); app.py releases
+    them when each request ends (see release_connections), while background
+    threads keep theirs for their lifetime. A readonly pool opens the file
+    with mode=ro and query_only, and has no writer.
+    """
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._writer = None
+        self._writer_used = 0.0
+        self._readers = {}  # thread ident -> checked-out connection
+        self._idle = queue.LifoQueue(maxsize=MAX_IDLE_READERS)  # (connection, last used)
+        self._probe = None
+        self._probe_lock = threading.Lock()
+        self.catalog = SchemaCatalog(self)
+        self._stats = {
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "read_checkouts": 0,
+            "reader_reuses": 0,
+            "write_checkouts": 0,
+            "write_wait_ms": 0.0,
+            "health_checks": 0,
+            "health_failures": 0,
+        }
+
+    def _connect(self):
+        if self.readonly:
+            conn = sqlite3.connect(
+                Path(self.path).absolute().as_uri() + "?mode=ro", uri=True,
+                timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                factory=metrics.connection_factory(),
+            )
+            conn.execute("PRAGMA query_only = ON")
+        else:
+            conn = sqlite3.connect(
+                self.path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                factory=metrics.connection_factory(),
+            )
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        with self._lock:
+            self._stats["connections_opened"] += 1
+        return conn
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._stats["connections_closed"] += 1
+
+    def _healthy(self, conn, last_used):
+        """Ping a connection that has been idle too long; False means it must be replaced."""
+        if time.monotonic() - last_used < HEALTH_CHECK_INTERVAL:
+            return True
+        with self._lock:
+            self._stats["health_checks"] += 1
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            with self._lock:
+                self._stats["health_failures"] += 1
+            return False
+
+    def _prune_dead_readers(self):
+        alive = {t.ident for t in threading.enumerate()}
+        with self._lock:
+            dead = [ident for ident in self._readers if ident not in alive]
+            conns = [self._readers.pop(ident) for ident in dead]
+        for conn in conns:
+            self._close(conn)
+
+    def _checkout(self):
+        """An idle connection (most recently released first), or a new one."""
+        while True:
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if self._healthy(conn, last_used):
+                with self._lock:
+                    self._stats["reader_reuses"] += 1
+                return conn
+            self._close(conn)
+
+    def reader(self):
+        """Return this thread's read connection, checking one out on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and not self._healthy(conn, self._local.last_used):
+            with self._lock:
+                self._readers.pop(threading.get_ident(), None)
+            self._close(conn)
+            conn = None
+        if conn is None:
+            self._prune_dead_readers()
+            conn = self._checkout()
+            self._local.conn = conn
+            with self._lock:
+                self._readers[threading.get_ident()] = conn
+            _thread_pools().add(self)
+        self._local.last_used = time.monotonic()
+        with self._lock:
+            self._stats["read_checkouts"] += 1
+        return conn
+
+    def release(self):
+        """Give this thread's read connection back to the idle queue (closed if the queue is full)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._lock:
+            self._readers.pop(threading.get_ident(), None)
+        try:
+            conn.set_progress_handler(None, 0)
+            conn.set_authorizer(None)
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait((conn, time.monotonic()))
+        except (sqlite3.Error, queue.Full):
+            self._close(conn)
+
+    @contextmanager
+    def writer(self):
+        """Yield the shared writer connection; commits on success, rolls back on error."""
+        if self.readonly:
+            raise sqlite3.OperationalError("Read-only connection pool has no writer")
+        started = time.perf_counter()
+        with self._write_lock:
+            with self._lock:
+                self._stats["write_checkouts"] += 1
+                self._stats["write_wait_ms"] += (time.perf_counter() - started) * 1000
+            if self._writer is not None and not self._healthy(self._writer, self._writer_used):
+                self._close(self._writer)
+                self._writer = None
+            if self._writer is None:
+                self._writer = self._connect()
+                self._writer.execute("PRAGMA journal_mode = WAL")
+                self._writer.execute("PRAGMA synchronous = NORMAL")
+            conn = self._writer
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self._writer_used = time.monotonic()
+
+    def data_version(self):
+        """PRAGMA data_version of a connection that never writes, so it moves on every commit to the file."""
+        with self._probe_lock:
+            if self._probe is None:
+                self._probe = self._connect()
+            return self._probe.execute("PRAGMA data_version").fetchone()[0]
+
+    def stats(self):
+        self._prune_dead_readers()
+        with self._lock:
+            stats = dict(self._stats)
+            stats["open_readers"] = len(self._readers)
+        stats["idle_readers"] = self._idle.qsize()
+        stats["writer_open"] = self._writer is not None
+        stats["write_wait_ms"] = round(stats["write_wait_ms"], 3)
+        stats["path"] = self.path
+        stats["schema_version"] = self.catalog.version
+        stats["catalog_rebuilds"] = self.catalog.rebuilds
+        return stats
+
+    def close(self):
+        with self._lock:
+            conns = list(self._readers.values())
+            self._readers.clear()
+        while True:
+            try:
+                conns.append(self._idle.get_nowait()[0])
+            except queue.Empty:
+                break
+        for conn in conns:
+            self._close(conn)
+        with self._write_lock:
+            if self._writer is not None:
+                self._close(self._writer)
+                self._writer = None
+        with self._probe_lock:
+            if self._probe is not None:
+                self._close(self._probe)
+                self._probe = None
+        self._local = threading.local()
+
+
+class SchemaCatalog:
+    """Columns of every table, loaded in one query and rebuilt only when PRAGMA schema_version changes."""
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._lock = threading.Lock()
+        self._version = None
+        self._tables = {}
+        self.rebuilds = 0
+
+    def tables(self):
+        """Return {table: [column dicts]} in sqlite_master order; treat it as read-only."""
+        conn = self._pool.reader()
+        version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        with self._lock:
+            if version == self._version:
+                return self._tables
+        rows = conn.execute(
+            """SELECT m.name, p.name, p.type, p."notnull", p.pk
+               FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS p
+               WHERE m.type = 'table' AND substr(m.name, 1, ?) != ?
+               ORDER BY m.rowid, p.cid""",
+            (len(INTERNAL_PREFIX), INTERNAL_PREFIX),
+        ).fetchall()
+        tables = {}
+        for table, name, col_type, notnull, pk in rows:
+            tables.setdefault(table, []).append({
+                "name": name,
+                "type": col_type,
+                "nullable": not notnull,
+                "primary_key": bool(pk)
+            })
+        with self._lock:
+            self._version = version
+            self._tables = tables
+            self.rebuilds += 1
+        return tables
+
+    @property
+    def version(self):
+        return self._version
+
+
+def get_pool():
+    """Return the read/write pool of the current data source (see sources.py)."""
+    import sources
+    return sources.get().pool()
+
+
+def get_readonly_pool():
+    """Return the read-only pool of the current data source, used to run untrusted SQL."""
+    import sources
+    return sources.get().readonly_pool()
+
+
+def read_connection():
+    """Pooled read connection, the calling thread's until release_connections(); do not close it."""
+    return get_pool().reader()
+
+
+_checkouts = threading.local()
+
+
+def _thread_pools():
+    pools = getattr(_checkouts, "pools", None)
+    if pools is None:
+        pools = _checkouts.pools = set()
+    return pools
+
+
+def release_connections():
+    """Give back every read connection the calling thread checked out; app.py calls it after each request."""
+    pools = _thread_pools()
+    while pools:
+        pools.pop().release()
+
+
+def write_connection():
+    """Context manager around the single serialized writer connection."""
+    return get_pool().writer()
+
+
+def state_connection():
+    """Read connection to the file holding DataSage's own tables for the current source."""
+    import sources
+    return sources.get().state_pool().reader()
+
+
+def state_write_connection():
+    """Writer for DataSage's own tables of the current source; other sources are never written."""
+    import sources
+    return sources.get().state_pool().writer()
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+def get_schema():
+    """Return {table: [column dicts]} for every table, cached until the schema changes."""
+    return get_pool().catalog.tables()
+
+
+def quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _quote_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+_tracked = {}
+_tracked_lock = threading.Lock()
+_source_seen = {}  # non-default source file -> (data_version, file signature, version)
+_bulk_write_hooks = []
+
+
+def trigger_guard(table_name):
+    """WHEN condition for DataSage's triggers on table_name: false while a bulk write suspends them.
+
+    Suspending them is a row in SUSPENDED_TRIGGERS, written inside the bulk
+    write's own transaction, so unlike dropping the triggers it leaves
+    PRAGMA schema_version alone and nobody else ever sees them off.
+    """
+    return f"NOT EXISTS (SELECT 1 FROM {SUSPENDED_TRIGGERS} WHERE table_name = {_quote_literal(table_name)})"
+
+
+def ensure_trigger_guard(conn):
+    """Create the table trigger_guard reads; call it before creating a guarded trigger."""
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {SUSPENDED_TRIGGERS} (table_name TEXT PRIMARY KEY)")
+
+
+def guarded_triggers(conn, names):
+    """The triggers among names that exist and carry trigger_guard (older installs must be recreated)."""
+    placeholders = ", ".join("?" for _ in names)
+    rows = conn.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({placeholders})", list(names)
+    )
+    return {name for name, sql in rows if SUSPENDED_TRIGGERS in sql}
+
+
+def on_bulk_write(hook):
+    """Register hook(conn, table_name), called in a bulk write's transaction to redo what the
+    suspended triggers would have done per row."""
+    _bulk_write_hooks.append(hook)
+    return hook
+
+
+def ensure_change_tracking(table_name):
+    """Install insert/update/delete triggers that bump table_name's row in _ds_table_versions.
+
+    Only the default source is tracked this way (see get_table_version).
+    Checked once per schema version; (re)installing the triggers also bumps
+    the version, so data written while they were missing is never trusted.
+    """
+    pool = get_pool()
+    schema_version = pool.reader().execute("PRAGMA schema_version").fetchone()[0]
+    with _tracked_lock:
+        if _tracked.get((pool.path, table_name)) == schema_version:
+            return
+    versions = f"{INTERNAL_PREFIX}table_versions"
+    names = {op: f"{INTERNAL_PREFIX}track_{table_name}_{op}" for op in ("ins", "upd", "del")}
+    if len(guarded_triggers(pool.reader(), names.values())) < len(names):
+        with write_connection() as conn:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {versions} (
+                    table_name TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            ensure_trigger_guard(conn)
+            bump = (
+                f"UPDATE {versions} SET version = version + 1 "
+                f"WHERE table_name = {_quote_literal(table_name)};"
+            )
+            for op, event in (("ins", "INSERT"), ("upd", "UPDATE"), ("del", "DELETE")):
+                conn.execute(f"DROP TRIGGER IF EXISTS {quote_identifier(names[op])}")
+                conn.execute(
+                    f"CREATE TRIGGER {quote_identifier(names[op])} AFTER {event} ON {quote_identifier(table_name)} "
+                    f"WHEN {trigger_guard(table_name)} BEGIN {bump} END"
+                )
+            conn.execute(
+                f"INSERT INTO {versions} (table_name, version) VALUES (?, 1) "
+                "ON CONFLICT(table_name) DO UPDATE SET version = version + 1",
+                (table_name,),
+            )
+        schema_version = pool.reader().execute("PRAGMA schema_version").fetchone()[0]
+    with _tracked_lock:
+        _tracked[(pool.path, table_name)] = schema_version
+
+
+def _file_signature(path):
+    parts = []
+    for suffix in ("", "-wal"):
+        try:
+            st = os.stat(path + suffix)
+        except OSError:
+            continue
+        parts.append(f"{st.st_size}:{st.st_mtime_ns}")
+    return "/".join(parts)
+
+
+def _source_version(pool):
+    """Change counter shared by every table of a non-default source, kept in the default database.
+
+    The source itself is never written to. Its counter in
+    _ds_source_versions is bumped when the file's signature (size and mtime
+    of the database and its WAL) differs from the recorded one, or when this
+    process's probe has seen a commit (PRAGMA data_version) since last time.
+    """
+    import sources
+    data_version = pool.data_version()
+    signature = _file_signature(pool.path)
+    with _tracked_lock:
+        seen = _source_seen.get(pool.path)
+    if seen is not None and seen[:2] == (data_version, signature):
+        return seen[2]
+    table = f"{INTERNAL_PREFIX}source_versions"
+    with sources.use(sources.DEFAULT_SOURCE), write_connection() as conn:
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(path TEXT PRIMARY KEY, signature TEXT NOT NULL, version INTEGER NOT NULL)"
+        )
+        row = conn.execute(f"SELECT signature, version FROM {table} WHERE path = ?", (pool.path,)).fetchone()
+        version = row[1] if row else 0
+        if row is None or row[0] != signature or (seen is not None and seen[0] != data_version):
+            version += 1
+            conn.execute(f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?)", (pool.path, signature, version))
+    with _tracked_lock:
+        _source_seen[pool.path] = (data_version, signature, version)
+    return version
+
+
+def get_table_version(table_name):
+    """Return the change counter for table_name.
+
+    In the default source that is the table's own counter, installing change
+    tracking if needed. Other sources get no triggers or tables (they may be
+    read-only, and are not ours to change): every table shares the source's
+    counter from _source_version.
+    """
+    import sources
+    if sources.current() != sources.DEFAULT_SOURCE:
+        return _source_version(get_pool())
+    ensure_change_tracking(table_name)
+    row = read_connection().execute(
+        f"SELECT version FROM {INTERNAL_PREFIX}table_versions WHERE table_name = ?",
+        (table_name,),
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def track_all_tables():
+    """Install change tracking on every table of the current (default) source.
+
+    Run at startup, so query results read from these tables are checked
+    against their own counters rather than against every commit to the file.
+    """
+    for table_name in get_schema():
+        ensure_change_tracking(table_name)
 
 
 def init_db():
+    """Create sample tables, insert demo data and load the customers CSV."""
+    init_schema()
+    load_customers_from_csv()
+
+
+def init_schema():
     """Create sample tables and insert demo data."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    with write_connection() as conn:
+        _init_schema(conn.cursor())
+
 
+def _init_schema(cursor):
     # Employees table
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS employees (
@@ -75,134 +568,236 @@ def init_db():
             ]
         )
 
-    # Load customers from CSV (training dataset) if file exists
-    load_customers_from_csv(conn, cursor)
 
-    conn.commit()
-    conn.close()
+def _ensure_ingest_tables(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {INTERNAL_PREFIX}ingest_state (
+            source TEXT PRIMARY KEY,
+            size INTEGER,
+            mtime_ns INTEGER,
+            sha256 TEXT,
+            rows INTEGER,
+            loaded_at REAL
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {INTERNAL_PREFIX}customer_hashes (
+            customer_id INTEGER PRIMARY KEY,
+            row_hash INTEGER NOT NULL
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {INTERNAL_PREFIX}customers_stage (
+            customer_id INTEGER PRIMARY KEY,
+            first_name TEXT, last_name TEXT, phone TEXT, email TEXT,
+            street TEXT, city TEXT, state TEXT, zip_code TEXT,
+            row_hash INTEGER NOT NULL
+        )
+    """)
+
+
+def _suspend_triggers(conn, table_name):
+    """Switch DataSage's own triggers on table_name off for the rest of conn's transaction."""
+    ensure_trigger_guard(conn)
+    conn.execute(f"INSERT OR IGNORE INTO {SUSPENDED_TRIGGERS} (table_name) VALUES (?)", (table_name,))
+
+
+def _resume_triggers(conn, table_name):
+    """Switch the triggers back on and do once, for the whole write, what they would have done per row.
+
+    That is one change-counter bump plus whatever the on_bulk_write hooks
+    redo (the full-text index and the chat facts register theirs).
+    """
+    conn.execute(f"DELETE FROM {SUSPENDED_TRIGGERS} WHERE table_name = ?", (table_name,))
+    versions = f"{INTERNAL_PREFIX}table_versions"
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (versions,)).fetchone():
+        conn.execute(f"UPDATE {versions} SET version = version + 1 WHERE table_name = ?", (table_name,))
+    for hook in _bulk_write_hooks:
+        hook(conn, table_name)
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _row_hash(values):
+    data = "\x1f".join("" if v is None else str(v) for v in values).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big", signed=True)
+
+
+def _iter_customer_chunks(path, chunk_size=CSV_CHUNK_SIZE):
+    """Stream the customers CSV as lists of normalized rows, each ending with its row hash."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None) or []
+        positions = [header.index(c) if c in header else None for c in CUSTOMER_COLUMNS]
+        id_pos, text_pos = positions[0], positions[1:]
+        chunk = []
+        for row in reader:
+            if not row:
+                continue
+            width = len(row)
+            values = [int(row[id_pos]) if id_pos is not None and id_pos < width else 0]
+            for pos in text_pos:
+                # 'NULL' and blank fields become None, everything else is stripped.
+                v = row[pos].strip() if pos is not None and pos < width else ""
+                values.append(None if not v or v.upper() == "NULL" else v)
+            values.append(_row_hash(values))
+            chunk.append(values)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
 
 
-def load_customers_from_csv(conn=None, cursor=None):
-    """Load customers from CSV into the customers table."""
+def load_customers_from_csv(conn=None, cursor=None, incremental=True, force=False):
+    """Load customers from CSV in one chunked transaction, skipping files already imported.
+
+    Incremental loads upsert changed rows and delete removed ones.
+    Returns a summary dict, or None when there is no CSV.
+    """
     if not os.path.isfile(CUSTOMERS_CSV_PATH):
-        return
-    own_conn = False
+        return None
     if conn is None:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        own_conn = True
+        with write_connection() as conn:
+            return load_customers_from_csv(conn, conn.cursor(), incremental, force)
+    started = time.perf_counter()
+    _ensure_ingest_tables(cursor)
+    source = os.path.abspath(CUSTOMERS_CSV_PATH)
+    st = os.stat(CUSTOMERS_CSV_PATH)
+    cursor.execute(
+        f"SELECT size, mtime_ns, sha256 FROM {INTERNAL_PREFIX}ingest_state WHERE source = ?",
+        (source,),
+    )
+    state = cursor.fetchone()
+    summary = {"mode": "incremental" if incremental else "full", "skipped": False}
+    if state and not force and state[0] == st.st_size and state[1] == st.st_mtime_ns:
+        summary["skipped"] = True
+        return summary
+    sha256 = _file_sha256(CUSTOMERS_CSV_PATH)
+    if state and not force and state[2] == sha256:
+        cursor.execute(
+            f"UPDATE {INTERNAL_PREFIX}ingest_state SET size = ?, mtime_ns = ? WHERE source = ?",
+            (st.st_size, st.st_mtime_ns, source),
+        )
+        summary["skipped"] = True
+        return summary
+
+    cols = ", ".join(CUSTOMER_COLUMNS)
+    marks = ", ".join("?" for _ in CUSTOMER_COLUMNS)
+    if conn.in_transaction:
+        conn.commit()
+    # Durability is relaxed only for the load itself; a crash mid-import just reruns it.
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -65536")
     try:
-        cursor.execute("DELETE FROM customers")
-        with open(CUSTOMERS_CSV_PATH, "r", encoding="utf-8", newline="") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                cursor.execute(
-                    """INSERT INTO customers (
-                        customer_id, first_name, last_name, phone, email, street, city, state, zip_code
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (
-                        int(row.get("customer_id", 0)),
-                        _nullable(row.get("first_name")),
-                        _nullable(row.get("last_name")),
-                        _nullable(row.get("phone")),
-                        _nullable(row.get("email")),
-                        _nullable(row.get("street")),
-                        _nullable(row.get("city")),
-                        _nullable(row.get("state")),
-                        _nullable(row.get("zip_code")),
-                    ),
+        conn.execute("BEGIN")
+        # Per-row triggers on customers would fire for every loaded row; their work is redone once at the end.
+        _suspend_triggers(conn, "customers")
+        rows = 0
+        if incremental:
+            stage = f"{INTERNAL_PREFIX}customers_stage"
+            hashes = f"{INTERNAL_PREFIX}customer_hashes"
+            cursor.execute(f"DELETE FROM {stage}")
+            for chunk in _iter_customer_chunks(CUSTOMERS_CSV_PATH):
+                cursor.executemany(
+                    f"INSERT OR REPLACE INTO {stage} ({cols}, row_hash) VALUES ({marks}, ?)", chunk
+                )
+                rows += len(chunk)
+            updates = ", ".join(f"{c} = excluded.{c}" for c in CUSTOMER_COLUMNS[1:])
+            cursor.execute(f"""
+                INSERT INTO customers ({cols})
+                SELECT {cols} FROM {stage} AS s
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {hashes} AS h
+                    WHERE h.customer_id = s.customer_id AND h.row_hash = s.row_hash
+                )
+                ON CONFLICT(customer_id) DO UPDATE SET {updates}
+            """)
+            summary["changed"] = cursor.rowcount
+            cursor.execute(
+                f"DELETE FROM customers WHERE customer_id NOT IN (SELECT customer_id FROM {stage})"
+            )
+            summary["deleted"] = cursor.rowcount
+            cursor.execute(f"DELETE FROM {hashes}")
+            cursor.execute(f"INSERT INTO {hashes} SELECT customer_id, row_hash FROM {stage}")
+            cursor.execute(f"DELETE FROM {stage}")
+        else:
+            cursor.execute("DELETE FROM customers")
+            cursor.execute(f"DELETE FROM {INTERNAL_PREFIX}customer_hashes")
+            for chunk in _iter_customer_chunks(CUSTOMERS_CSV_PATH):
+                cursor.executemany(
+                    f"INSERT INTO customers ({cols}) VALUES ({marks})", [r[:-1] for r in chunk]
                 )
-        if own_conn:
-            conn.commit()
+                cursor.executemany(
+                    f"INSERT INTO {INTERNAL_PREFIX}customer_hashes VALUES (?, ?)",
+                    [(r[0], r[-1]) for r in chunk],
+                )
+                rows += len(chunk)
+            summary["changed"] = rows
+        _resume_triggers(conn, "customers")
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {INTERNAL_PREFIX}ingest_state VALUES (?, ?, ?, ?, ?, ?)",
+            (source, st.st_size, st.st_mtime_ns, sha256, rows, time.time()),
+        )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
     finally:
-        if own_conn:
-            conn.close()
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    summary["rows"] = rows
+    summary["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return summary
 
 
 def get_db_connection():
-    return sqlite3.connect(DB_PATH)
+    """Open a standalone (unpooled) connection to the current source; the caller must close it."""
+    return sqlite3.connect(get_pool().path, factory=metrics.connection_factory())
 
 def get_tables():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return tables
+    return list(get_schema())
 
 def get_table_info(table_name):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns = cursor.fetchall()
-    # columns: (cid, name, type, notnull, default, pk)
-    result = []
-    for col in columns:
-        result.append({
-            "name": col[1],
-            "type": col[2],
-            "nullable": not col[3],
-            "primary_key": bool(col[5])
-        })
-    conn.close()
-    return result
+    return list(get_schema().get(table_name, []))
 
 def get_table_preview(table_name, limit=5):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    cursor = read_connection().cursor()
     cursor.execute(f"SELECT * FROM {table_name} LIMIT ?", (limit,))
     rows = cursor.fetchall()
     col_names = [description[0] for description in cursor.description]
-    conn.close()
     return col_names, rows
 
+def get_column_samples(table_name, column_names, limit=20, per_column=10):
+    """Return {column: [str values]} of up to per_column non-null values from the first limit rows.
+
+    All columns are sampled from one scan of the table.
+    """
+    select = ", ".join(quote_identifier(c) for c in column_names)
+    rows = read_connection().execute(
+        f"SELECT {select} FROM {quote_identifier(table_name)} LIMIT ?", (limit,)
+    ).fetchall()
+    samples = {c: [] for c in column_names}
+    lists = [samples[c] for c in column_names]
+    for row in rows:
+        for values, v in zip(lists, row):
+            if v is not None and len(values) < per_column:
+                values.append(str(v))
+    return samples
+
 def get_table_stats(table_name):
-    """Return row count and basic stats for numeric columns."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-    row_count = cursor.fetchone()[0]
-
-    # Get column info
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns = cursor.fetchall()
-    stats = {}
-    for col in columns:
-        col_name = col[1]
-        col_type = col[2].upper()
-        # For numeric columns, compute min, max, avg
-        if "INT" in col_type or "REAL" in col_type or "FLOAT" in col_type or "DOUBLE" in col_type:
-            cursor.execute(f"SELECT MIN({col_name}), MAX({col_name}), AVG({col_name}) FROM {table_name}")
-            min_val, max_val, avg_val = cursor.fetchone()
-            stats[col_name] = {"min": min_val, "max": max_val, "avg": round(avg_val, 2) if avg_val else None}
-        else:
-            # For text columns, count distinct
-            cursor.execute(f"SELECT COUNT(DISTINCT {col_name}) FROM {table_name}")
-            distinct = cursor.fetchone()[0]
-            stats[col_name] = {"distinct": distinct}
-    conn.close()
-    return row_count, stats
+    """Return row count and per-column stats, computed in one table scan (see profiler)."""
+    import profiler
+    return profiler.profile_table(table_name)
 
 
 def get_chat_facts():
-    """Return a small dict of facts for the chatbot fallback (no OpenAI)."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    facts = {}
-    try:
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
-        tables = [row[0] for row in cursor.fetchall()]
-        facts["tables"] = tables
-        if "customers" in tables:
-            cursor.execute("SELECT COUNT(*) FROM customers")
-            facts["customer_count"] = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(DISTINCT state) FROM customers WHERE state IS NOT NULL")
-            facts["customer_states"] = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(DISTINCT city) FROM customers WHERE city IS NOT NULL")
-            facts["customer_cities"] = cursor.fetchone()[0]
-            cursor.execute("SELECT state FROM customers WHERE state IS NOT NULL GROUP BY state ORDER BY COUNT(*) DESC LIMIT 5")
-            facts["top_states"] = [row[0] for row in cursor.fetchall()]
-    except Exception:
-        pass
-    conn.close()
-    return facts
\ No newline at end of file
+    """Return a small dict of facts for the chatbot fallback (no OpenAI), read from the facts store."""
+    import facts_store
+    return facts_store.get_facts()
@@ -0,0 +1,168 @@
+"""Memoized documentation: in-memory LRU with TTL in front of a SQLite-backed doc store.
+
+Docs are keyed by a hash of the table name, its column names and types, the
+column being documented (if any) and the sampled values the generator saw.
+Concurrent requests for the same key share one generation (single-flight),
+and docs for tables whose columns changed are dropped when the schema
+version moves.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import database
+
+STORE_TABLE = f"{database.INTERNAL_PREFIX}doc_store"
+LRU_SIZE = 512
+TTL_SECONDS = 3600
+
+_lru = OrderedDict()
+_lru_lock = threading.Lock()
+_inflight = {}
+_inflight_lock = threading.Lock()
+_schema_states = {}  # pool path -> {"version", "signatures"}
+_stats = {"memory_hits": 0, "store_hits": 0, "generated": 0, "shared": 0, "invalidated": 0}
+
+
+def doc_key(table_name, columns, column_name=None, samples=None):
+    """Hash of everything the generated doc depends on."""
+    material = json.dumps(
+        [table_name, column_name, [(c["name"], c.get("type")) for c in columns], samples or []],
+        default=str,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _ensure_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {STORE_TABLE} (
+            doc_key TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            column_name TEXT,
+            doc TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {STORE_TABLE}_table ON {STORE_TABLE} (table_name)")
+
+
+def _lru_get(key):
+    with _lru_lock:
+        entry = _lru.get(key)
+        if entry is None:
+            return None
+        if entry[3] < time.monotonic():
+            del _lru[key]
+            return None
+        _lru.move_to_end(key)
+        return entry[2]
+
+
+def _lru_put(key, table_name, column_name, doc):
+    with _lru_lock:
+        _lru[key] = (table_name, column_name, doc, time.monotonic() + TTL_SECONDS)
+        _lru.move_to_end(key)
+        while len(_lru) > LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+def _store_get(key):
+    try:
+        row = database.state_connection().execute(
+            f"SELECT doc FROM {STORE_TABLE} WHERE doc_key = ?", (key,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None  # store not created yet
+    return row[0] if row else None
+
+
+def _store_put(key, table_name, column_name, doc):
+    with database.state_write_connection() as conn:
+        _ensure_table(conn)
+        conn.execute(
+            f"INSERT OR REPLACE INTO {STORE_TABLE} VALUES (?, ?, ?, ?, ?)",
+            (key, table_name, column_name, doc, time.time()),
+        )
+
+
+def invalidate(table_name):
+    """Drop every cached and stored doc for table_name."""
+    with _lru_lock:
+        for key in [k for k, entry in _lru.items() if entry[0] == table_name]:
+            del _lru[key]
+    try:
+        with database.state_write_connection() as conn:
+            conn.execute(f"DELETE FROM {STORE_TABLE} WHERE table_name = ?", (table_name,))
+    except sqlite3.OperationalError:
+        pass
+    _stats["invalidated"] += 1
+
+
+def _check_schema():
+    """Invalidate docs of tables whose column signature changed since the last schema version seen."""
+    schema = database.get_schema()
+    pool = database.get_pool()
+    version = pool.catalog.version
+    _schema_state = _schema_states.setdefault(pool.path, {"version": None, "signatures": {}})
+    if version == _schema_state["version"]:
+        return
+    signatures = {
+        table: json.dumps([(c["name"], c["type"]) for c in cols]) for table, cols in schema.items()
+    }
+    previous = _schema_state["signatures"]
+    if _schema_state["version"] is not None:
+        for table in set(previous) | set(signatures):
+            if previous.get(table) != signatures.get(table):
+                invalidate(table)
+    _schema_state["version"] = version
+    _schema_state["signatures"] = signatures
+
+
+def get_or_generate(key, table_name, column_name, generate):
+    """Return (doc, source) where source is memory, store, generated or shared."""
+    _check_schema()
+    doc = _lru_get(key)
+    if doc is not None:
+        _stats["memory_hits"] += 1
+        return doc, "memory"
+    doc = _store_get(key)
+    if doc is not None:
+        _stats["store_hits"] += 1
+        _lru_put(key, table_name, column_name, doc)
+        return doc, "store"
+
+    with _inflight_lock:
+        flight = _inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = {"event": threading.Event(), "doc": None, "error": None}
+            _inflight[key] = flight
+    if not leader:
+        flight["event"].wait()
+        if flight["error"] is not None:
+            raise flight["error"]
+        _stats["shared"] += 1
+        return flight["doc"], "shared"
+    try:
+        doc = generate()
+        _store_put(key, table_name, column_name, doc)
+        _lru_put(key, table_name, column_name, doc)
+        flight["doc"] = doc
+        _stats["generated"] += 1
+        return doc, "generated"
+    except Exception as e:
+        flight["error"] = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        flight["event"].set()
+
+
+def stats():
+    with _lru_lock:
+        size = len(_lru)
+    return {**_stats, "lru_entries": size}
@@ -0,0 +1,187 @@
+"""Chat facts maintained incrementally by triggers on the customers table.
+
+Per-state and per-city counts live in summary tables that customers'
+insert/update/delete triggers keep current; triggers on those summary
+tables in turn keep the distinct counts in a single totals row. Reading
+the facts is therefore a handful of primary-key/index lookups regardless
+of how many customers there are.
+
+The store belongs to the built-in database's training data: it is only
+installed in the default source, and other sources (which may well have a
+customers table of their own) are never given its tables or triggers.
+"""
+import sqlite3
+import threading
+
+import database
+import sources
+
+PREFIX = database.INTERNAL_PREFIX
+TOTALS = f"{PREFIX}customer_totals"
+STATES = f"{PREFIX}customer_states"
+CITIES = f"{PREFIX}customer_cities"
+TRIGGERS = (
+    f"{PREFIX}facts_customers_ins",
+    f"{PREFIX}facts_customers_del",
+    f"{PREFIX}facts_customers_upd_state",
+    f"{PREFIX}facts_customers_upd_city",
+    f"{PREFIX}facts_states_ins",
+    f"{PREFIX}facts_states_del",
+    f"{PREFIX}facts_cities_ins",
+    f"{PREFIX}facts_cities_del",
+)
+
+_lock = threading.Lock()
+_checked_version = {}
+
+
+def _count_sql(table, key, value, delta):
+    if delta > 0:
+        return (
+            f"INSERT INTO {table} ({key}, n) SELECT {value}, 1 WHERE {value} IS NOT NULL "
+            f"ON CONFLICT({key}) DO UPDATE SET n = n + 1;"
+        )
+    return (
+        f"UPDATE {table} SET n = n - 1 WHERE {key} = {value}; "
+        f"DELETE FROM {table} WHERE {key} = {value} AND n <= 0;"
+    )
+
+
+def _fill(conn):
+    """Recompute the summary tables and the totals row from customers."""
+    for table, key in ((STATES, "state"), (CITIES, "city")):
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(
+            f"INSERT INTO {table} ({key}, n) SELECT {key}, COUNT(*) FROM customers "
+            f"WHERE {key} IS NOT NULL GROUP BY {key}"
+        )
+    conn.execute(f"""
+        INSERT OR REPLACE INTO {TOTALS} (id, customers, states, cities) VALUES (
+            1,
+            (SELECT COUNT(*) FROM customers),
+            (SELECT COUNT(*) FROM {STATES}),
+            (SELECT COUNT(*) FROM {CITIES})
+        )
+    """)
+
+
+@database.on_bulk_write
+def rebuild(conn, table_name):
+    """Recompute the summaries after a bulk write to table_name that bypassed the triggers."""
+    if table_name == "customers" and conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (TOTALS,)
+    ).fetchone():
+        _fill(conn)
+
+
+def install(conn):
+    """(Re)build the summary tables from customers and create the triggers that maintain them."""
+    for name in TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TOTALS} (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            customers INTEGER NOT NULL,
+            states INTEGER NOT NULL,
+            cities INTEGER NOT NULL
+        )
+    """)
+    for table, key in ((STATES, "state"), (CITIES, "city")):
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ({key} TEXT PRIMARY KEY, n INTEGER NOT NULL)"
+        )
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_n ON {table} (n)")
+    _fill(conn)
+    database.ensure_trigger_guard(conn)
+    guard = database.trigger_guard("customers")
+    t = dict(zip(("ins", "del", "upd_state", "upd_city", "s_ins", "s_del", "c_ins", "c_del"), TRIGGERS))
+    conn.execute(f"""
+        CREATE TRIGGER {t['ins']} AFTER INSERT ON customers WHEN {guard} BEGIN
+            UPDATE {TOTALS} SET customers = customers + 1 WHERE id = 1;
+            {_count_sql(STATES, 'state', 'NEW.state', 1)}
+            {_count_sql(CITIES, 'city', 'NEW.city', 1)}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER {t['del']} AFTER DELETE ON customers WHEN {guard} BEGIN
+            UPDATE {TOTALS} SET customers = customers - 1 WHERE id = 1;
+            {_count_sql(STATES, 'state', 'OLD.state', -1)}
+            {_count_sql(CITIES, 'city', 'OLD.city', -1)}
+        END
+    """)
+    for name, table, key in ((t["upd_state"], STATES, "state"), (t["upd_city"], CITIES, "city")):
+        conn.execute(f"""
+            CREATE TRIGGER {name} AFTER UPDATE OF {key} ON customers
+            WHEN OLD.{key} IS NOT NEW.{key} AND {guard} BEGIN
+                {_count_sql(table, key, f'OLD.{key}', -1)}
+                {_count_sql(table, key, f'NEW.{key}', 1)}
+            END
+        """)
+    for ins, dele, table, column in (
+        (t["s_ins"], t["s_del"], STATES, "states"),
+        (t["c_ins"], t["c_del"], CITIES, "cities"),
+    ):
+        conn.execute(
+            f"CREATE TRIGGER {ins} AFTER INSERT ON {table} BEGIN "
+            f"UPDATE {TOTALS} SET {column} = {column} + 1 WHERE id = 1; END"
+        )
+        conn.execute(
+            f"CREATE TRIGGER {dele} AFTER DELETE ON {table} BEGIN "
+            f"UPDATE {TOTALS} SET {column} = {column} - 1 WHERE id = 1; END"
+        )
+
+
+def _existing(conn, names):
+    placeholders = ", ".join("?" for _ in names)
+    return {row[0] for row in conn.execute(
+        f"SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN ({placeholders})", names
+    )}
+
+
+def ensure_installed():
+    """Install the facts store if customers exists and its triggers are missing (checked once per schema version).
+
+    A no-op unless the current source is the default one.
+    """
+    if sources.current() != sources.DEFAULT_SOURCE:
+        return
+    pool = database.get_pool()
+    conn = pool.reader()
+    version = conn.execute("PRAGMA schema_version").fetchone()[0]
+    with _lock:
+        if _checked_version.get(pool.path) == version:
+            return
+    if "customers" in database.get_schema():
+        # The triggers on the summary tables are never suspended, so only customers' need the guard.
+        found = database.guarded_triggers(conn, TRIGGERS[:4]) | _existing(conn, TRIGGERS[4:])
+        if len(found) != len(TRIGGERS):
+            with database.write_connection() as wconn:
+                install(wconn)
+            version = conn.execute("PRAGMA schema_version").fetchone()[0]
+    with _lock:
+        _checked_version[pool.path] = version
+
+
+def get_facts():
+    """Return the chatbot facts dict (tables, customer counts, top states) from the summary tables.
+
+    Sources other than the default one only get their table list.
+    """
+    facts = {"tables": [t for t in database.get_schema() if not t.startswith("sqlite_")]}
+    if "customers" not in facts["tables"] or sources.current() != sources.DEFAULT_SOURCE:
+        return facts
+    ensure_installed()
+    conn = database.read_connection()
+    try:
+        customers, states, cities = conn.execute(
+            f"SELECT customers, states, cities FROM {TOTALS} WHERE id = 1"
+        ).fetchone()
+        facts["customer_count"] = customers
+        facts["customer_states"] = states
+        facts["customer_cities"] = cities
+        facts["top_states"] = [
+            row[0] for row in conn.execute(f"SELECT state FROM {STATES} ORDER BY n DESC LIMIT 5")
+        ]
+    except (sqlite3.Error, TypeError):
+        pass
+    return facts
@@ -0,0 +1,387 @@
+"""Index advisor: covering-index recommendations from EXPLAIN QUERY PLAN of the observed workload.
+
+The workload is every query shape (query_cache.normalize) run through /query
+or produced by /generate-sql, kept in memory per source with one example
+statement and an execution count, plus the SQL intents' fixed queries.
+
+For each shape the advisor reads EXPLAIN QUERY PLAN with an authorizer
+installed, which reports exactly which columns of which tables the
+statement reads. Plans with a full `SCAN` of a table (not through a
+covering index) or a `USE TEMP B-TREE` sort get an index on that table:
+equality columns first, then GROUP BY / ORDER BY columns, then range
+columns, then the rest of the columns read so the index covers the query
+when that stays within MAX_INDEX_COLUMNS. The estimated benefit compares
+rows read (and sorted) before and after, from sqlite_stat1 when ANALYZE
+has run and from fixed selectivities otherwise.
+
+apply() creates the chosen indexes (named _ds_idx_*, so drop() can only
+remove the advisor's own), runs ANALYZE on their tables and reports each
+affected query's best-of-TIMING_RUNS time and plan before and after.
+"""
+import hashlib
+import math
+import re
+import sqlite3
+import threading
+import time
+
+import database
+import query_cache
+from database import quote_identifier
+
+INDEX_PREFIX = f"{database.INTERNAL_PREFIX}idx_"
+MAX_SHAPES = 500
+MAX_INDEX_COLUMNS = 6
+# Share of rows kept by one equality / range condition when sqlite_stat1 has nothing better.
+EQ_SELECTIVITY = 0.1
+RANGE_SELECTIVITY = 0.25
+TIMING_RUNS = 3
+TIMING_TIMEOUT_MS = 5000
+
+_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\S+)(?: AS \S+)?(.*)$")
+_lock = threading.Lock()
+_workload = {}  # pool path -> {shape: {"sql", "params", "count", "sources", "last_at"}}
+
+
+def record(sql, params=None, source="query"):
+    """Note one execution of a SELECT; other statements are ignored."""
+    sql = (sql or "").strip().rstrip(";").strip()
+    if not sql:
+        return
+    shape, _ = query_cache.normalize(sql)
+    if not shape.startswith(("select ", "with ")):
+        return
+    path = database.get_pool().path
+    with _lock:
+        shapes = _workload.setdefault(path, {})
+        entry = shapes.get(shape)
+        if entry is None:
+            if len(shapes) >= MAX_SHAPES:
+                del shapes[min(shapes, key=lambda s: (shapes[s]["count"], shapes[s]["last_at"]))]
+            entry = shapes[shape] = {"sql": sql, "params": params, "count": 0, "sources": set()}
+        entry["count"] += 1
+        entry["sources"].add(source)
+        entry["last_at"] = time.time()
+
+
+def workload(extra=()):
+    """[{"shape", "sql", "params", "count", "sources"}] of the current source, plus extra SQL (source "intent")."""
+    with _lock:
+        shapes = {
+            shape: dict(entry, sources=sorted(entry["sources"]))
+            for shape, entry in _workload.get(database.get_pool().path, {}).items()
+        }
+    for sql in extra:
+        shape, _ = query_cache.normalize(sql)
+        if shape not in shapes:
+            shapes[shape] = {"sql": sql, "params": None, "count": 0, "sources": ["intent"]}
+    return [{"shape": shape, **entry} for shape, entry in shapes.items()]
+
+
+def clear():
+    with _lock:
+        _workload.pop(database.get_pool().path, None)
+
+
+def explain(conn, sql, params=None):
+    """(plan detail lines, {table: set of columns read}) of sql."""
+    reads = {}
+
+    def authorize(action, arg1, arg2, db_name, trigger):
+        if action == sqlite3.SQLITE_READ and arg1 and arg2:
+            reads.setdefault(arg1, set()).add(arg2)
+        return sqlite3.SQLITE_OK
+
+    conn.set_authorizer(authorize)
+    try:
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or []).fetchall()
+    finally:
+        conn.set_authorizer(None)
+    return [row[3] for row in rows], reads
+
+
+def _problems(plan, schema):
+    """{table: [plan lines]} for full scans, and [lines] for temp B-tree sorts."""
+    scans = {}
+    sorts = []
+    for line in plan:
+        match = _SCAN_RE.match(line)
+        if match and match.group(1) in schema and "COVERING INDEX" not in match.group(2):
+            scans.setdefault(match.group(1), []).append(line)
+        elif line.startswith("USE TEMP B-TREE"):
+            sorts.append(line)
+    return scans, sorts
+
+
+def _unquote(token):
+    if token[:1] in ('"', "`", "[") and len(token) > 1:
+        return token[1:-1].replace('""', '"').replace("``", "`")
+    return token
+
+
+def column_roles(shape, columns):
+    """{"eq", "range", "group", "order"} lists of the given columns, by where they appear in shape."""
+    by_lower = {c.lower(): c for c in columns}
+    tokens = shape.split(" ")
+    roles = {"eq": [], "range": [], "group": [], "order": []}
+    clause = None
+    for i, token in enumerate(tokens):
+        nxt = tokens[i + 1] if i + 1 < len(tokens) else ""
+        if token in ("where", "on"):
+            clause = "where"
+        elif token in ("group", "order") and nxt == "by":
+            clause = token
+        elif token in ("having", "limit", "union", "select", "from", "join", "window"):
+            clause = None
+        column = by_lower.get(_unquote(token).lower())
+        if column is None or clause is None:
+            continue
+        prev = tokens[i - 1] if i else ""
+        if clause == "where":
+            if nxt in ("=", "in", "is") or prev == "=":
+                role = "eq"
+            elif nxt in ("<", ">", "between") or prev in ("<", ">"):
+                role = "range"
+            else:
+                continue
+        else:
+            role = clause
+        if column not in roles[role]:
+            roles[role].append(column)
+    return roles
+
+
+def _index_columns(roles, read, all_columns):
+    """(key columns, covering columns) for an index serving roles; covering is None if it would be too wide."""
+    keys = list(roles["eq"])
+    ordered = roles["group"] or roles["order"]
+    for column in ordered + roles["range"]:
+        if column not in keys:
+            keys.append(column)
+    rest = [c for c in all_columns if c in read and c not in keys]
+    if len(keys) + len(rest) <= MAX_INDEX_COLUMNS:
+        return keys, keys + rest
+    return keys, None
+
+
+def index_name(table_name, columns):
+    name = f"{INDEX_PREFIX}{table_name}_{'_'.join(columns)}"
+    name = re.sub(r"\W", "_", name)
+    if len(name) > 60:
+        digest = hashlib.sha1(name.encode("utf-8")).hexdigest()[:8]
+        name = f"{name[:51]}_{digest}"
+    return name
+
+
+def _existing_indexes(conn, table_name):
+    """[[columns]] of the indexes on table_name."""
+    indexes = []
+    for row in conn.execute(f"PRAGMA index_list({quote_identifier(table_name)})").fetchall():
+        info = conn.execute(f"PRAGMA index_info({quote_identifier(row[1])})").fetchall()
+        indexes.append([r[2] for r in sorted(info)])
+    return indexes
+
+
+def _table_stats(conn, table_name):
+    """(row count, {column: avg rows per value}) from sqlite_stat1, else an exact count and no column stats."""
+    per_value = {}
+    rows = None
+    try:
+        stats = conn.execute("SELECT idx, stat FROM sqlite_stat1 WHERE tbl = ?", (table_name,)).fetchall()
+    except sqlite3.OperationalError:
+        stats = []
+    for idx, stat in stats:
+        numbers = [int(n) for n in stat.split() if n.isdigit()]
+        if numbers:
+            rows = numbers[0]
+        if idx and len(numbers) > 1:
+            info = conn.execute(f"PRAGMA index_info({quote_identifier(idx)})").fetchall()
+            if info:
+                first = min(info)[2]
+                per_value[first] = min(numbers[1], per_value.get(first, numbers[1]))
+    if rows is None:
+        rows = conn.execute(f"SELECT COUNT(*) FROM {quote_identifier(table_name)}").fetchone()[0]
+    return rows, per_value
+
+
+def _estimate(rows, per_value, roles, keys, covering, n_columns, sorted_before):
+    """(rows read before, rows read after) in row-equivalents, sorting counted as n log2 n."""
+    rows = max(rows, 1)
+    before = rows * (1 + (math.log2(rows) if sorted_before else 0))
+    selectivity = 1.0
+    seek = []
+    for column in keys:
+        if column in roles["eq"]:
+            selectivity *= per_value[column] / rows if column in per_value else EQ_SELECTIVITY
+            seek.append(column)
+        else:
+            break
+    if len(seek) < len(keys) and keys[len(seek)] in roles["range"]:
+        selectivity *= RANGE_SELECTIVITY
+    matched = max(rows * selectivity, 1)
+    # A covering index holds only its own columns; otherwise each match also reads its table row.
+    width = len(covering) / max(n_columns, 1) if covering else 1 + len(keys) / max(n_columns, 1)
+    ordered = roles["group"] or roles["order"]
+    sort_avoided = not ordered or keys[len(seek):len(seek) + len(ordered)] == ordered
+    after = matched * width * (1 + (0 if sort_avoided or not sorted_before else math.log2(matched)))
+    return round(before), round(after)
+
+
+def _merge_prefixes(recommendations):
+    """Fold each recommendation into a wider one on the same table whose columns it prefixes."""
+    recommendations.sort(key=lambda r: -len(r["columns"]))
+    kept = []
+    for rec in recommendations:
+        wider = next((k for k in kept if k["table"] == rec["table"]
+                      and k["columns"][:len(rec["columns"])] == rec["columns"]), None)
+        if wider is None:
+            kept.append(rec)
+            continue
+        wider["reasons"] += [r for r in rec["reasons"] if r not in wider["reasons"]]
+        wider["queries"] += rec["queries"]
+        wider["executions"] += rec["executions"]
+        wider["rows_read"]["before"] += rec["rows_read"]["before"]
+        wider["rows_read"]["after"] += rec["rows_read"]["after"]
+    return kept
+
+
+def advise(extra=()):
+    """Index recommendations for the current workload, best first.
+
+    Each is {"index", "table", "columns", "covering", "sql", "reasons",
+    "queries", "executions", "rows_read": {"before", "after"},
+    "estimated_benefit"}; estimated_benefit is the share of rows read (and
+    sorted) the index saves for the queries it serves.
+    """
+    schema = database.get_schema()
+    conn = database.read_connection()
+    found = {}
+    stats = {}
+    for entry in workload(extra):
+        try:
+            plan, reads = explain(conn, entry["sql"], entry["params"])
+        except (sqlite3.Error, ValueError):
+            continue  # the table or column is gone, or the params no longer fit
+        scans, sorts = _problems(plan, schema)
+        targets = set(scans)
+        if sorts and len(reads) == 1:
+            targets |= set(reads)
+        for table_name in targets:
+            if table_name not in schema or table_name.startswith(database.INTERNAL_PREFIX):
+                continue
+            all_columns = [c["name"] for c in schema[table_name]]
+            roles = column_roles(entry["shape"], reads.get(table_name, ()))
+            # An INTEGER PRIMARY KEY is the rowid, which every index entry already carries.
+            pk = [c for c in schema[table_name] if c["primary_key"]]
+            rowid = pk[0]["name"] if len(pk) == 1 and (pk[0]["type"] or "").upper() == "INTEGER" else None
+            read = reads.get(table_name, set()) - {rowid}
+            keys, covering = _index_columns(roles, read, all_columns)
+            if not keys:
+                continue  # nothing to seek or order on; an index would not avoid the scan
+            columns = covering or keys
+            if any(existing[:len(columns)] == columns for existing in _existing_indexes(conn, table_name)):
+                continue
+            if table_name not in stats:
+                stats[table_name] = _table_stats(conn, table_name)
+            rows, per_value = stats[table_name]
+            before, after = _estimate(rows, per_value, roles, keys, covering, len(all_columns), bool(sorts))
+            name = index_name(table_name, columns)
+            rec = found.get(name)
+            if rec is None:
+                rec = found[name] = {
+                    "index": name,
+                    "table": table_name,
+                    "columns": columns,
+                    "covering": covering is not None,
+                    "sql": (f"CREATE INDEX {quote_identifier(name)} ON {quote_identifier(table_name)} "
+                            f"({', '.join(quote_identifier(c) for c in columns)})"),
+                    "reasons": [],
+                    "queries": [],
+                    "executions": 0,
+                    "rows_read": {"before": 0, "after": 0},
+                }
+            for reason in scans.get(table_name, []) + sorts:
+                if reason not in rec["reasons"]:
+                    rec["reasons"].append(reason)
+            rec["queries"].append({"shape": entry["shape"], "sql": entry["sql"], "params": entry["params"],
+                                   "count": entry["count"], "sources": entry["sources"]})
+            weight = max(entry["count"], 1)
+            rec["executions"] += entry["count"]
+            rec["rows_read"]["before"] += before * weight
+            rec["rows_read"]["after"] += after * weight
+    recommendations = _merge_prefixes(list(found.values()))
+    for rec in recommendations:
+        before = rec["rows_read"]["before"]
+        rec["estimated_benefit"] = round(1 - rec["rows_read"]["after"] / before, 3) if before else 0.0
+    recommendations.sort(key=lambda r: r["rows_read"]["after"] - r["rows_read"]["before"])
+    return recommendations
+
+
+def _time_query(conn, sql, params):
+    """Best wall time in ms of running sql to completion, or None if it exceeds TIMING_TIMEOUT_MS."""
+    best = None
+    for _ in range(TIMING_RUNS):
+        deadline = time.monotonic() + TIMING_TIMEOUT_MS / 1000
+        conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, 10000)
+        started = time.perf_counter()
+        try:
+            cur = conn.execute(sql, params or [])
+            while cur.fetchmany(1000):
+                pass
+        except sqlite3.OperationalError:
+            return None
+        finally:
+            conn.set_progress_handler(None, 0)
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 3)
+
+
+def apply(indexes=None, analyze=True, extra=(), progress=None):
+    """Create the recommended indexes (all, or those named in indexes) and time their queries.
+
+    Returns [{"index", "sql", "table", "queries": [{"shape", "before_ms",
+    "after_ms", "plan_before", "plan_after"}]}].
+    """
+    chosen = [r for r in advise(extra) if indexes is None or r["index"] in indexes]
+    conn = database.read_connection()
+    results = []
+    for n, rec in enumerate(chosen):
+        queries = [
+            {"shape": q["shape"], "before_ms": _time_query(conn, q["sql"], q["params"]),
+             "plan_before": explain(conn, q["sql"], q["params"])[0]}
+            for q in rec["queries"]
+        ]
+        started = time.perf_counter()
+        with database.write_connection() as wconn:
+            wconn.execute(rec["sql"].replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1))
+            if analyze:
+                wconn.execute(f"ANALYZE {quote_identifier(rec['table'])}")
+        build_ms = round((time.perf_counter() - started) * 1000, 2)
+        for q, source in zip(queries, rec["queries"]):
+            q["after_ms"] = _time_query(conn, source["sql"], source["params"])
+            q["plan_after"] = explain(conn, source["sql"], source["params"])[0]
+        results.append({"index": rec["index"], "table": rec["table"], "sql": rec["sql"],
+                        "build_ms": build_ms, "queries": queries})
+        if progress is not None:
+            progress(n + 1, len(chosen), rec["index"])
+    return results
+
+
+def applied():
+    """[{"index", "table", "sql"}] of the indexes the advisor created in the current source."""
+    rows = database.read_connection().execute(
+        "SELECT name, tbl_name, sql FROM sqlite_master WHERE type = 'index' AND substr(name, 1, ?) = ? "
+        "ORDER BY name",
+        (len(INDEX_PREFIX), INDEX_PREFIX),
+    ).fetchall()
+    return [{"index": name, "table": table_name, "sql": sql} for name, table_name, sql in rows]
+
+
+def drop(name):
+    """Drop an advisor-created index; returns False when there is no such index."""
+    if not name.startswith(INDEX_PREFIX) or name not in {i["index"] for i in applied()}:
+        return False
+    with database.write_connection() as conn:
+        conn.execute(f"DROP INDEX {quote_identifier(name)}")
+    return True
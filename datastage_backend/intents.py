@@ -0,0 +1,143 @@
+"""Compiled intent matching: every phrase of every intent goes into one Aho-Corasick automaton.
+
+An intent is plain data:
+
+    {"name": "customer_count",
+     "exact": ["hi"],                         # whole-question matches
+     "any": ["how many customer", "total customer"],  # any phrase is enough
+     "all": [["count"], ["customer"]],        # one phrase from every group
+     "weight": 1.0,                           # per matched phrase, for scoring
+     "priority": 0,                           # lower wins before score is compared
+     ...}                                     # anything else is passed through
+
+Phrases match as substrings of the lower-cased question, like the `in`
+checks they replace; punctuation counts as a space, so a phrase with a
+leading or trailing space (" join ") only matches at a word boundary. A question is scanned once no matter how many intents
+are registered; only intents with at least one phrase hit are evaluated.
+Matches are ranked by priority, then score, then registration order.
+"""
+import re
+import threading
+
+_NON_WORD = re.compile(r"\W+")
+
+
+def _words(text):
+    """text lower-cased with every run of non-word characters turned into one space."""
+    return _NON_WORD.sub(" ", text.lower())
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher; find() yields pattern ids for each occurrence."""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for pid, pattern in enumerate(patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                state = nxt
+            self.out[state].append(pid)
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def find(self, text):
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                yield from out[state]
+
+
+class IntentMatcher:
+    """Registry of intents compiled lazily into a single automaton."""
+
+    def __init__(self, intents=()):
+        self._intents = []
+        self._lock = threading.Lock()
+        self._compiled = None
+        for intent in intents:
+            self.register(intent)
+
+    def register(self, intent):
+        """Add an intent (see module docstring); invalidates the compiled automaton."""
+        if "name" not in intent:
+            raise ValueError("Intent needs a 'name'")
+        with self._lock:
+            self._intents.append(intent)
+            self._compiled = None
+
+    def __len__(self):
+        return len(self._intents)
+
+    def _compile(self):
+        with self._lock:
+            if self._compiled is not None:
+                return self._compiled
+            phrases = {}
+            targets = []  # phrase id -> [(intent index, group index or None)]
+            exact = {}
+            for idx, intent in enumerate(self._intents):
+                for text in intent.get("exact", ()):
+                    exact.setdefault(text.lower(), []).append(idx)
+                groups = [(None, intent.get("any", ()))]
+                groups += list(enumerate(intent.get("all", ())))
+                for group, group_phrases in groups:
+                    for phrase in group_phrases:
+                        phrase = _words(phrase)
+                        if not phrase.strip():
+                            continue
+                        pid = phrases.setdefault(phrase, len(phrases))
+                        if pid == len(targets):
+                            targets.append([])
+                        targets[pid].append((idx, group))
+            self._compiled = (AhoCorasick(list(phrases)), targets, exact, list(self._intents))
+            return self._compiled
+
+    def match(self, text):
+        """Return [(intent, score)] for every matching intent, best first."""
+        automaton, targets, exact, intents = self._compile()
+        text = (text or "").strip().lower()
+        scores = {}
+        groups_hit = {}
+        any_hit = set()
+        for idx in exact.get(text, ()):
+            any_hit.add(idx)
+            scores[idx] = scores.get(idx, 0.0) + intents[idx].get("weight", 1.0)
+        for pid in automaton.find(f" {_words(text)} "):
+            for idx, group in targets[pid]:
+                scores[idx] = scores.get(idx, 0.0) + intents[idx].get("weight", 1.0)
+                if group is None:
+                    any_hit.add(idx)
+                else:
+                    groups_hit.setdefault(idx, set()).add(group)
+        matched = []
+        for idx, score in scores.items():
+            all_groups = intents[idx].get("all", ())
+            if idx in any_hit or (all_groups and len(groups_hit.get(idx, ())) == len(all_groups)):
+                matched.append((idx, score))
+        matched.sort(key=lambda m: (intents[m[0]].get("priority", 0), -m[1], m[0]))
+        return [(intents[idx], score) for idx, score in matched]
+
+    def best(self, text):
+        """Return the top matching intent, or None."""
+        matches = self.match(text)
+        return matches[0][0] if matches else None
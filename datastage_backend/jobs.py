@@ -0,0 +1,403 @@
+"""In-process background jobs: a bounded thread pool fed by a priority queue, with state in SQLite.
+
+A job is a registered kind (see register_kind) plus JSON params. submit()
+returns a job id straight away; identical jobs (same kind, source and
+params) that are still pending or running are deduplicated to the existing
+id. Lower priority numbers run first. Handlers receive (params, job) and
+report progress with job.progress(done, total, message). Jobs run against
+the data source that was current when they were submitted. A cancellation
+request takes effect at the next progress report, or sooner inside SQL: the
+worker's connection to the job's source gets a SQLite progress handler that
+aborts once the job is cancelled, and cancel() interrupts the statement in
+flight.
+
+Job rows live in _ds_jobs in their own SQLite file (JOBS_DB_PATH, next to
+the built-in database by default), which several processes may share; the
+heartbeats and progress updates never touch a database whose query results
+are cached. A worker claims a pending row by setting its owner (this
+process) with a conditional UPDATE, and a heartbeat thread refreshes
+heartbeat_at on the rows its process is running. On the first use after a
+start, pending jobs are queued again (the claim keeps two processes from
+running one job), and running jobs whose heartbeat is older than
+HEARTBEAT_TIMEOUT are marked as interrupted; the heartbeat thread repeats
+that check, so the jobs of a process that dies later are recovered too.
+Cancelling a job this process is not running goes through its row: a
+pending row is marked cancelled (so no process claims it), and a running
+one is flagged for its owner, whose heartbeat thread stops it.
+"""
+import hashlib
+import itertools
+import json
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+import database
+import sources
+
+JOB_TABLE = f"{database.INTERNAL_PREFIX}jobs"
+# Job state file; by default datasage_jobs.db next to database.DB_PATH.
+JOBS_DB_PATH = os.environ.get("DATASAGE_JOBS_DB")
+MAX_WORKERS = 4
+DEFAULT_PRIORITY = 5
+# Progress is written to SQLite at most this often per job (the final update always is).
+PROGRESS_INTERVAL = 0.5
+# Seconds between heartbeats, and without one before another process treats a running job as dead.
+HEARTBEAT_INTERVAL = 10.0
+HEARTBEAT_TIMEOUT = 60.0
+# SQLite VM instructions between cancellation checks inside a job's statements.
+CANCEL_CHECK_STEPS = 10000
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_kinds = {}
+_queue = queue.PriorityQueue()
+_seq = itertools.count()
+_lock = threading.Lock()
+_active = {}  # job id -> Job, for jobs that are pending or running
+_by_key = {}  # dedupe key -> job id
+_workers = []
+_heartbeat = []
+_recovered = False
+_pool = None
+_pool_lock = threading.Lock()
+_stats = {"submitted": 0, "deduplicated": 0, "done": 0, "failed": 0, "cancelled": 0}
+
+
+class JobError(Exception):
+    """The job cannot run with these params; the message is stored as the job's error."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler by job.progress() once the job has been cancelled."""
+
+
+def register_kind(kind, handler, priority=DEFAULT_PRIORITY):
+    """Make kind available to submit(); handler(params, job) returns a JSON-serializable result."""
+    _kinds[kind] = {"handler": handler, "priority": priority}
+
+
+def kinds():
+    return sorted(_kinds)
+
+
+class Job:
+    """A pending or running job; handlers report through progress()."""
+
+    def __init__(self, job_id, kind, source, params, key, priority):
+        self.id = job_id
+        self.kind = kind
+        self.source = source
+        self.params = params
+        self.key = key
+        self.priority = priority
+        self.status = "pending"
+        self.cancel_requested = False
+        self.conn = None  # the worker's connection to the job's source while it runs
+        self._last_write = 0.0
+
+    def progress(self, done, total=None, message=None):
+        """Record progress (a fraction when total is given); raises JobCancelled if cancelled."""
+        if self.cancel_requested:
+            raise JobCancelled()
+        fraction = done / total if total else done
+        now = time.monotonic()
+        if now - self._last_write >= PROGRESS_INTERVAL or (total and done >= total):
+            self._last_write = now
+            _update(self.id, progress=round(min(max(fraction, 0.0), 1.0), 4), message=message)
+
+
+def _ensure_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {JOB_TABLE} (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            source TEXT NOT NULL,
+            params TEXT NOT NULL,
+            dedupe_key TEXT NOT NULL,
+            priority INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            result TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            owner TEXT,
+            heartbeat_at REAL,
+            cancel_requested INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {JOB_TABLE}_status ON {JOB_TABLE} (status, created_at)")
+
+
+def _jobs_pool():
+    """Pool on the job state file, whatever source the caller is using."""
+    global _pool
+    path = JOBS_DB_PATH or os.path.join(os.path.dirname(os.path.abspath(database.DB_PATH)), "datasage_jobs.db")
+    with _pool_lock:
+        if _pool is None or _pool.path != path:
+            if _pool is not None:
+                _pool.close()
+            _pool = database.ConnectionPool(path)
+        return _pool
+
+
+def _read():
+    return _jobs_pool().reader()
+
+
+def _write():
+    return _jobs_pool().writer()
+
+
+def _update(job_id, **fields):
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with _write() as conn:
+        conn.execute(f"UPDATE {JOB_TABLE} SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+
+def _row_dict(row, columns):
+    job = dict(zip(columns, row))
+    job["params"] = json.loads(job["params"])
+    if job["result"] is not None:
+        job["result"] = json.loads(job["result"])
+    del job["dedupe_key"]
+    return job
+
+
+def _expire(conn):
+    """Mark running jobs whose owner stopped sending heartbeats as interrupted."""
+    now = time.time()
+    conn.execute(
+        f"UPDATE {JOB_TABLE} SET status = 'interrupted', finished_at = ? "
+        "WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+        (now, now - HEARTBEAT_TIMEOUT),
+    )
+
+
+def _recover():
+    """Requeue pending jobs left by a previous process and interrupt running jobs whose heartbeat expired."""
+    global _recovered
+    with _lock:
+        if _recovered:
+            return
+        _recovered = True
+    with _write() as conn:
+        _ensure_table(conn)
+        _expire(conn)
+        pending = conn.execute(
+            f"SELECT id, kind, source, params, dedupe_key, priority FROM {JOB_TABLE} "
+            "WHERE status = 'pending' ORDER BY created_at"
+        ).fetchall()
+    for job_id, kind, source, params, key, priority in pending:
+        if kind not in _kinds:
+            _update(job_id, status="failed", error=f"Unknown job kind: {kind}", finished_at=time.time())
+            continue
+        _enqueue(Job(job_id, kind, source, json.loads(params), key, priority))
+
+
+def _track(job):
+    _active[job.id] = job
+    _by_key[job.key] = job.id
+
+
+def _enqueue(job):
+    with _lock:
+        _track(job)
+        while len(_workers) < MAX_WORKERS:
+            worker = threading.Thread(target=_run_worker, name=f"datasage-job-{len(_workers)}", daemon=True)
+            worker.start()
+            _workers.append(worker)
+        if not _heartbeat:
+            _heartbeat.append(threading.Thread(target=_run_heartbeat, name="datasage-job-heartbeat", daemon=True))
+            _heartbeat[0].start()
+    _queue.put((job.priority, next(_seq), job.id))
+
+
+def _stop(job):
+    """Ask a job to stop; the caller holds _lock."""
+    job.cancel_requested = True
+    if job.conn is not None:
+        job.conn.interrupt()
+
+
+def _run_heartbeat():
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        try:
+            with _write() as conn:
+                conn.execute(
+                    f"UPDATE {JOB_TABLE} SET heartbeat_at = ? WHERE owner = ? AND status = 'running'",
+                    (time.time(), OWNER),
+                )
+                _expire(conn)
+                flagged = conn.execute(
+                    f"SELECT id FROM {JOB_TABLE} WHERE owner = ? AND status = 'running' AND cancel_requested = 1",
+                    (OWNER,),
+                ).fetchall()
+        except sqlite3.Error:
+            continue  # retried on the next beat, well within HEARTBEAT_TIMEOUT
+        with _lock:  # cancelled from another process
+            for (job_id,) in flagged:
+                job = _active.get(job_id)
+                if job is not None and not job.cancel_requested:
+                    _stop(job)
+
+
+def submit(kind, params=None, priority=None):
+    """Queue a job in the current source; returns (job_id, deduplicated)."""
+    if kind not in _kinds:
+        raise JobError(f"Unknown job kind: {kind}")
+    _recover()
+    params = params or {}
+    source = sources.current()
+    key = hashlib.sha1(json.dumps([kind, source, params], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    if priority is None:
+        priority = _kinds[kind]["priority"]
+    with _lock:
+        existing = _by_key.get(key)
+        if existing is not None and existing in _active:
+            _stats["deduplicated"] += 1
+            return existing, True
+        _stats["submitted"] += 1
+        job = Job(uuid.uuid4().hex, kind, source, params, key, int(priority))
+        _track(job)  # claim the dedupe key before the row is written
+    with _write() as conn:
+        _ensure_table(conn)
+        conn.execute(
+            f"INSERT INTO {JOB_TABLE} (id, kind, source, params, dedupe_key, priority, status, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, 'pending', ?)",
+            (job.id, kind, source, json.dumps(params, default=str), key, job.priority, time.time()),
+        )
+    _enqueue(job)
+    return job.id, False
+
+
+def _finish(job, status, result=None, error=None):
+    fields = {"status": status, "finished_at": time.time(), "error": error}
+    if status == "done":
+        fields["progress"] = 1.0
+        fields["result"] = json.dumps(result, default=str)
+    _update(job.id, **fields)
+    with _lock:
+        _forget(job)
+        _stats[status if status in _stats else "failed"] += 1
+
+
+def _forget(job):
+    """Drop a job from this process's bookkeeping; the caller holds _lock."""
+    _active.pop(job.id, None)
+    if _by_key.get(job.key) == job.id:
+        del _by_key[job.key]
+
+
+def _claim(job):
+    """Mark the job's row as running in this process; False if it is no longer pending (another process has it)."""
+    now = time.time()
+    with _write() as conn:
+        cur = conn.execute(
+            f"UPDATE {JOB_TABLE} SET status = 'running', started_at = ?, owner = ?, heartbeat_at = ? "
+            "WHERE id = ? AND status = 'pending'",
+            (now, OWNER, now, job.id),
+        )
+        return cur.rowcount == 1
+
+
+def _run_worker():
+    while True:
+        _, _, job_id = _queue.get()
+        with _lock:
+            job = _active.get(job_id)
+            if job is None or job.cancel_requested:
+                continue  # cancelled while pending
+            job.status = "running"
+        if not _claim(job):
+            with _lock:
+                _forget(job)
+            continue
+        try:
+            with sources.use(job.source):
+                job.conn = database.read_connection()
+                job.conn.set_progress_handler(lambda: 1 if job.cancel_requested else 0, CANCEL_CHECK_STEPS)
+                result = _kinds[job.kind]["handler"](job.params, job)
+            _finish(job, "done", result=result)
+        except JobCancelled:
+            _finish(job, "cancelled")
+        except Exception as e:
+            if job.cancel_requested:  # most likely the interrupted statement
+                _finish(job, "cancelled")
+            else:
+                _finish(job, "failed", error=str(e) or type(e).__name__)
+        finally:
+            with _lock:  # after this, cancel() can no longer interrupt the connection's next job
+                conn, job.conn = job.conn, None
+            if conn is not None:
+                conn.set_progress_handler(None, 0)
+
+
+def cancel(job_id):
+    """Cancel a pending job now, or stop a running one (see the module docstring).
+
+    Returns the job's status afterwards, or None for an unknown job.
+    """
+    with _lock:
+        job = _active.get(job_id)
+        if job is not None:
+            _stop(job)
+            if job.status == "running":
+                return "cancelling"
+    # Pending (here or in any process) or running elsewhere: settle it through the row.
+    _recover()
+    with _write() as conn:
+        cancelled = conn.execute(
+            f"UPDATE {JOB_TABLE} SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'pending'",
+            (time.time(), job_id),
+        ).rowcount
+        flagged = not cancelled and conn.execute(
+            f"UPDATE {JOB_TABLE} SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,)
+        ).rowcount
+    if cancelled:
+        with _lock:
+            if job is not None:
+                _forget(job)
+            _stats["cancelled"] += 1
+        return "cancelled"
+    if flagged:
+        return "cancelling"
+    current = get(job_id)
+    return current["status"] if current else None
+
+
+def get(job_id):
+    """Return the stored job as a dict, or None."""
+    _recover()
+    cur = _read().execute(f"SELECT * FROM {JOB_TABLE} WHERE id = ?", (job_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return _row_dict(row, [d[0] for d in cur.description])
+
+
+def list_jobs(status=None, limit=50):
+    """Most recent jobs first, optionally filtered by status."""
+    _recover()
+    sql = f"SELECT * FROM {JOB_TABLE}"
+    params = []
+    if status:
+        sql += " WHERE status = ?"
+        params.append(status)
+    sql += " ORDER BY created_at DESC LIMIT ?"
+    params.append(limit)
+    cur = _read().execute(sql, params)
+    columns = [d[0] for d in cur.description]
+    return [_row_dict(row, columns) for row in cur.fetchall()]
+
+
+def stats():
+    with _lock:
+        return {**_stats, "active": len(_active), "queued": _queue.qsize(), "workers": len(_workers)}
@@ -0,0 +1,275 @@
+"""Request and SQL instrumentation, exported in the Prometheus text format.
+
+Every pooled connection is an InstrumentedConnection, whose cursors time
+each statement, labelled with its verb: the step to its first row and the
+draining of the rest separately, plus the rows fetched (counted per
+fetchmany()/fetchall() batch, never per row). Statements slower than
+DATASAGE_SLOW_QUERY_MS (unset = off) go to a slow-query log with their SQL
+and the chain of backend callers, which is only looked up while that log is
+on. Route timings come from the Flask hooks in app.py, and
+DATASAGE_PROFILING=1 lets a request ask for a cProfile summary.
+"""
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+import sqlite3
+from collections import deque
+
+# Histogram bucket upper bounds, in seconds.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_METRICS = os.environ.get("DATASAGE_SQL_METRICS", "1") != "0"
+SLOW_QUERY_MS = float(os.environ.get("DATASAGE_SLOW_QUERY_MS") or 0)
+SLOW_QUERY_LOG = os.environ.get("DATASAGE_SLOW_QUERY_LOG") or os.path.join(
+    os.path.dirname(__file__), "slow_queries.log"
+)
+SLOW_QUERY_KEEP = 100
+# ?profile=1 returns a cProfile summary instead of the response body; off unless enabled.
+PROFILING = os.environ.get("DATASAGE_PROFILING", "0") == "1"
+PROFILE_LINES = 40
+# Callers reported in the slow-query log.
+STACK_DEPTH = 5
+
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+_THIS_FILE = os.path.abspath(__file__)
+_lock = threading.Lock()
+_slow_queries = deque(maxlen=SLOW_QUERY_KEEP)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram, one series per label tuple."""
+
+    def __init__(self, name, help_text, label_names, buckets=BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        with _lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            items = sorted((labels, (list(s[0]), s[1], s[2])) for labels, s in self._series.items())
+        for labels, (counts, total, count) in items:
+            base = _labels(self.label_names, labels)
+            running = 0
+            for bound, n in zip(self.buckets, counts):
+                running += n
+                lines.append(f'{self.name}_bucket{{{base}{"," if base else ""}le="{bound}"}} {running}')
+            lines.append(f'{self.name}_bucket{{{base}{"," if base else ""}le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{base}}} {total}")
+            lines.append(f"{self.name}_count{{{base}}} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self._values = {}
+
+    def inc(self, labels, amount=1):
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with _lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{{{_labels(self.label_names, labels)}}} {value}" for labels, value in items]
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+http_duration = Histogram(
+    "datasage_http_request_duration_seconds", "Time to produce a response (streamed bodies excluded).",
+    ("method", "route", "status"),
+)
+sql_duration = Histogram(
+    "datasage_sql_statement_duration_seconds", "Time inside execute(): SQLite running the statement to its first row.",
+    ("verb",),
+)
+sql_drain_duration = Histogram(
+    "datasage_sql_drain_duration_seconds",
+    "Time from the first row until the statement was drained, closed or dropped, including the caller's work.",
+    ("verb",),
+)
+sql_rows = Counter(
+    "datasage_sql_rows_total", "Rows fetched with fetchmany()/fetchall(), or changed by a write.", ("verb",)
+)
+slow_total = Counter("datasage_sql_slow_statements_total", "Statements over the slow-query threshold.", ("caller",))
+
+
+def _caller_frames(frame):
+    """Backend functions on the stack above frame, innermost first, as module.function."""
+    callers = []
+    while frame is not None and len(callers) < STACK_DEPTH:
+        path = frame.f_code.co_filename
+        if path != _THIS_FILE and path.startswith(_BACKEND_DIR):
+            module = os.path.splitext(os.path.basename(path))[0]
+            callers.append(f"{module}.{frame.f_code.co_name}")
+        frame = frame.f_back
+    return callers
+
+
+def _verb(sql):
+    stripped = sql.lstrip()
+    return stripped[:stripped.find(" ")].upper() if " " in stripped else stripped.upper()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times each statement from execute() until it completes.
+
+    execute() steps the statement to its first row, which is timed on its
+    own; the rest is drain time. A statement completes when it returns no
+    rows, when fetchall() or an empty fetchmany() drains it, or when the
+    cursor is closed, reused or dropped. Iteration and fetchone() are left
+    to the C implementation, so rows read that way cost nothing extra and
+    are not counted.
+    """
+
+    # [sql, started, first row at, rows fetched, callers] of the statement in flight
+    _pending = None
+
+    def _finish(self):
+        pending = self._pending
+        if pending is None:
+            return
+        self._pending = None
+        sql, started, first, rows, callers = pending
+        now = time.perf_counter()
+        verb = (_verb(sql),)
+        sql_duration.observe(verb, first - started)
+        sql_drain_duration.observe(verb, now - first)
+        if rows:
+            sql_rows.inc(verb, rows)
+        if SLOW_QUERY_MS and (now - started) * 1000 >= SLOW_QUERY_MS:
+            _log_slow(sql, callers, now - started)
+
+    def _run(self, fn, sql, *args):
+        self._finish()
+        # The callers are taken here, where the statement is run, and only while the slow log is on.
+        callers = _caller_frames(sys._getframe()) if SLOW_QUERY_MS else None
+        started = time.perf_counter()
+        pending = self._pending = [sql, started, started, 0, callers]
+        try:
+            fn(sql, *args)
+        except BaseException:
+            pending[2] = time.perf_counter()
+            self._finish()
+            raise
+        pending[2] = time.perf_counter()
+        if self.description is None:
+            pending[3] = max(self.rowcount, 0)
+            self._finish()  # no rows to wait for
+        return self
+
+    def execute(self, sql, parameters=()):
+        return self._run(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self._run(super().executescript, sql_script)
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if rows:
+            if self._pending is not None:
+                self._pending[3] += len(rows)
+        else:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        if self._pending is not None:
+            self._pending[3] += len(rows)
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Covers the common conn.execute(...).fetchone() where the cursor is dropped mid-result.
+        self._finish()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors, including the ones behind conn.execute(), are InstrumentedCursors."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # The C implementations of these create a plain cursor, so route them explicitly.
+    def execute(self, sql, parameters=()):
+        return InstrumentedCursor(self).execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return InstrumentedCursor(self).executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return InstrumentedCursor(self).executescript(sql_script)
+
+
+def connection_factory():
+    """Connection class for sqlite3.connect(factory=...); plain connections when DATASAGE_SQL_METRICS=0."""
+    return InstrumentedConnection if SQL_METRICS else sqlite3.Connection
+
+
+def _log_slow(sql, stack, elapsed):
+    caller = stack[0] if stack else "unknown"
+    entry = {
+        "at": time.time(),
+        "ms": round(elapsed * 1000, 3),
+        "caller": caller,
+        "stack": stack,
+        "sql": " ".join(sql.split())[:2000],
+    }
+    slow_total.inc((caller,))
+    _slow_queries.append(entry)
+    try:
+        with open(SLOW_QUERY_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+    except OSError:
+        pass
+
+
+def slow_queries():
+    """The most recent slow statements, newest last."""
+    return list(_slow_queries)
+
+
+def render(gauges=None):
+    """All metrics in the Prometheus text format; gauges is {name: (help, {label tuple: value}, label names)}."""
+    lines = []
+    for metric in (http_duration, sql_duration, sql_drain_duration, sql_rows, slow_total):
+        lines += metric.render()
+    for name, (help_text, values, label_names) in (gauges or {}).items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        lines += [f"{name}{{{_labels(label_names, labels)}}} {value}" for labels, value in sorted(values.items())]
+    return "\n".join(lines) + "\n"
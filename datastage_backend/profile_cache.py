@@ -0,0 +1,132 @@
+"""Persistent profile cache with stale-while-revalidate refresh.
+
+Profiles are stored in the _ds_profile_cache table of the source's state
+database (see sources.state_path), keyed by table and a fingerprint of its
+columns plus its change-tracking version. A stale
+entry is served immediately while a background worker recomputes it.
+"""
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+import column_snapshots
+import database
+import profiler
+import sources
+
+CACHE_TABLE = f"{database.INTERNAL_PREFIX}profile_cache"
+
+_queue = queue.Queue()
+_pending = set()
+_pending_lock = threading.Lock()
+_worker = None
+_stats = {"hits": 0, "stale": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0}
+
+
+def _ensure_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CACHE_TABLE} (
+            table_name TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            profile TEXT NOT NULL,
+            computed_at REAL NOT NULL,
+            duration_ms REAL
+        )
+    """)
+
+
+def fingerprint(table_name):
+    """Return a string that changes whenever the table's columns or data change."""
+    return column_snapshots.table_tag(table_name)
+
+
+def _read(table_name):
+    try:
+        return database.state_connection().execute(
+            f"SELECT fingerprint, profile, computed_at FROM {CACHE_TABLE} WHERE table_name = ?",
+            (table_name,),
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None  # cache table not created yet
+
+
+def refresh(table_name):
+    """Recompute and store the profile for table_name; returns (profile, computed_at)."""
+    fp = fingerprint(table_name)
+    started = time.perf_counter()
+    profile = profiler.build_profile(table_name)
+    duration_ms = round((time.perf_counter() - started) * 1000, 2)
+    return profile, store(table_name, fp, profile, duration_ms)
+
+
+def store(table_name, fp, profile, duration_ms=None):
+    """Save a profile computed elsewhere under fingerprint fp (taken before profiling); returns computed_at."""
+    computed_at = time.time()
+    with database.state_write_connection() as conn:
+        _ensure_table(conn)
+        conn.execute(
+            f"INSERT OR REPLACE INTO {CACHE_TABLE} VALUES (?, ?, ?, ?, ?)",
+            (table_name, fp, json.dumps(profile, default=str), computed_at, duration_ms),
+        )
+    return computed_at
+
+
+def _run_worker():
+    while True:
+        source, table_name = _queue.get()
+        try:
+            with sources.use(source):
+                refresh(table_name)
+            _stats["refreshes"] += 1
+        except Exception:
+            _stats["refresh_errors"] += 1
+        finally:
+            with _pending_lock:
+                _pending.discard((source, table_name))
+            _queue.task_done()
+
+
+def schedule_refresh(table_name):
+    """Queue a background refresh (in the current source) unless one is already pending for this table."""
+    global _worker
+    job = (sources.current(), table_name)
+    with _pending_lock:
+        if job in _pending:
+            return False
+        _pending.add(job)
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_worker, name="profile-refresh", daemon=True)
+            _worker.start()
+    _queue.put(job)
+    return True
+
+
+def get_profile(table_name, force_refresh=False):
+    """Return (profile, cache_info) for table_name.
+
+    Fresh entries are returned as hits; stale ones are returned as-is and
+    refreshed in the background; missing ones (or force_refresh) are
+    computed synchronously.
+    """
+    row = None if force_refresh else _read(table_name)
+    if row is not None:
+        fp, payload, computed_at = row
+        if fp == fingerprint(table_name):
+            _stats["hits"] += 1
+            status = "hit"
+        else:
+            _stats["stale"] += 1
+            status = "stale"
+            schedule_refresh(table_name)
+        return json.loads(payload), {"status": status, "computed_at": computed_at}
+    _stats["misses"] += 1
+    profile, computed_at = refresh(table_name)
+    return profile, {"status": "miss", "computed_at": computed_at}
+
+
+def stats():
+    with _pending_lock:
+        pending = len(_pending)
+    return {**_stats, "pending_refreshes": pending}
@@ -0,0 +1,477 @@
+"""Table profiler.
+
+profile_table computes per-column statistics in one streaming pass over the
+table: row count, min/max/avg/stddev (variance taken around the mean, see
+sketches.Moments) and value frequencies. Frequencies are exact for columns
+declared unique and for columns with at most EXACT_DISTINCT_LIMIT distinct
+values; wider columns switch to a HyperLogLog and a Misra-Gries summary, and
+their stats carry error bounds. profile_table_approx samples tables too large to scan and
+scales what it saw to the whole table, with sampling error bounds.
+"""
+import heapq
+import itertools
+import math
+import random
+import sqlite3
+import time
+from collections import Counter
+
+import column_snapshots
+import database
+import sketches
+from database import quote_identifier
+
+TOP_K = 5
+# Distinct values counted exactly per column before it switches to sketches; bounds memory per column.
+EXACT_DISTINCT_LIMIT = 10000
+HEAVY_HITTERS = 256
+FREQUENCY_CHUNK_SIZE = 20000
+# Approximate mode: rows fetched per window, the fewest windows a row budget is spread over,
+# the quantiles reported and the z-score of the sampling error bounds (95%).
+CHUNK_SIZE = 5000
+MIN_WINDOWS = 64
+# Budgets used when the caller gives none (seconds for the time budget).
+DEFAULT_ROW_BUDGET = 200000
+DEFAULT_TIME_BUDGET = 2.0
+QUANTILES = (0.25, 0.5, 0.75, 0.95)
+Z_SCORE = 1.96
+SAMPLE_SIZE = 5
+# SQLite caps a result row at 2000 columns; wider tables are split into groups.
+MAX_COLUMNS = 1800
+
+
+def is_numeric_type(col_type):
+    col_type = (col_type or "").upper()
+    return "INT" in col_type or "REAL" in col_type or "FLOAT" in col_type or "DOUBLE" in col_type
+
+
+def _json_value(value):
+    if isinstance(value, bytes):
+        return value.hex()
+    return value
+
+
+def _sort_key(value):
+    """SQLite's ordering of mixed values: numbers, then text, then blobs."""
+    if isinstance(value, (int, float)):
+        return 0, value
+    return (1, value) if isinstance(value, str) else (2, value)
+
+
+def _numeric_stats(moments):
+    stddev = moments.stddev()
+    return {
+        "min": moments.min,
+        "max": moments.max,
+        "avg": round(moments.mean, 2) if moments.n else None,
+        "stddev": round(stddev, 2) if stddev is not None else None,
+    }
+
+
+class _Frequencies:
+    """Stats of one column from streamed values.
+
+    Value counts are exact up to EXACT_DISTINCT_LIMIT distinct values, then
+    sketched. Columns known to be unique skip counting and keep their TOP_K
+    smallest values. Numeric columns also get their moments.
+    """
+
+    def __init__(self, numeric=False, unique=False):
+        self.rows = 0
+        self.nulls = 0
+        self.unique = unique
+        self.smallest = []  # unique columns only
+        self.moments = sketches.Moments() if numeric else None
+        self.counts = Counter()
+        self.distinct = None  # HyperLogLog, once the column outgrows exact counting
+        self.heavy = None
+
+    def update_many(self, values):
+        chunk = Counter(values)
+        self.rows += len(values)
+        self.nulls += chunk.pop(None, 0)
+        if self.moments is not None:
+            self.moments.update_counts(chunk)
+        if self.unique:
+            self.smallest = heapq.nsmallest(TOP_K, itertools.chain(self.smallest, chunk), key=_sort_key)
+            return
+        if self.distinct is None:
+            self.counts.update(chunk)
+            if len(self.counts) <= EXACT_DISTINCT_LIMIT:
+                return
+            chunk, self.counts = self.counts, None
+            self.distinct = sketches.HyperLogLog()
+            self.heavy = sketches.MisraGries(HEAVY_HITTERS)
+        self.distinct.add_values(chunk)
+        self.heavy.update_counts(chunk)
+
+    def result(self):
+        stats = _numeric_stats(self.moments) if self.moments is not None else {}
+        if self.unique:
+            return {
+                **stats,
+                "distinct": self.rows - self.nulls,
+                "nulls": self.nulls,
+                "top_values": [{"value": _json_value(v), "count": 1} for v in self.smallest],
+            }
+        if self.distinct is None:
+            return {
+                **stats,
+                "distinct": len(self.counts),
+                "nulls": self.nulls,
+                "top_values": [{"value": _json_value(v), "count": n} for v, n in self.counts.most_common(TOP_K)],
+            }
+        bound = self.heavy.error_bound()
+        # Values counted at or below the bound may rank under values the summary dropped.
+        top = [(v, n) for v, n in self.heavy.top(TOP_K) if n > bound]
+        return {
+            **stats,
+            "distinct": min(self.distinct.estimate(), self.rows - self.nulls),
+            "nulls": self.nulls,
+            "top_values": [{"value": _json_value(v), "count": n} for v, n in top],
+            "error": {
+                "distinct_relative": self.distinct.relative_error(),
+                "top_values_count": bound,
+            },
+        }
+
+
+def unique_columns(conn, table_name, columns):
+    """Names of columns whose values are distinct by declaration: the rowid alias and single-column UNIQUE indexes."""
+    pk = [c for c in columns if c["primary_key"]]
+    names = {pk[0]["name"]} if len(pk) == 1 and (pk[0]["type"] or "").upper() == "INTEGER" else set()
+    for row in conn.execute(f"PRAGMA index_list({quote_identifier(table_name)})").fetchall():
+        if not row[2] or (len(row) > 4 and row[4]):  # not unique, or partial
+            continue
+        info = conn.execute(f"PRAGMA index_info({quote_identifier(row[1])})").fetchall()
+        if len(info) == 1 and info[0][2] is not None:
+            names.add(info[0][2])
+    return names
+
+
+def _frequencies(conn, table_name, columns):
+    """{column: _Frequencies} for columns, from one streaming read of the table."""
+    unique = unique_columns(conn, table_name, columns)
+    freqs = [_Frequencies(is_numeric_type(c["type"]), c["name"] in unique) for c in columns]
+    select = ", ".join(quote_identifier(c["name"]) for c in columns)
+    cur = conn.execute(f"SELECT {select} FROM {quote_identifier(table_name)}")
+    while True:
+        rows = cur.fetchmany(FREQUENCY_CHUNK_SIZE)
+        if not rows:
+            break
+        for freq, values in zip(freqs, zip(*rows)):
+            freq.update_many(values)
+    return {c["name"]: freq for c, freq in zip(columns, freqs)}
+
+
+def column_groups(columns):
+    """Split columns into groups that fit in one SELECT."""
+    return [columns[i:i + MAX_COLUMNS] for i in range(0, len(columns), MAX_COLUMNS)]
+
+
+def numeric_snapshots(conn, table_name, columns, tag=None, db_path=None):
+    """Columnar snapshots of the numeric columns (see column_snapshots), or {} when disabled."""
+    if not column_snapshots.ENABLED:
+        return {}
+    names = [c["name"] for c in columns if is_numeric_type(c["type"])]
+    found = column_snapshots.get(table_name, names, tag=tag, conn=conn, db_path=db_path)
+    return {name: snap for name, snap in found.items() if snap.usable}
+
+
+def profile_columns(conn, table_name, columns, snapshots=None):
+    """Profile the given columns; returns (row_count, stats).
+
+    Columns with a snapshot in snapshots ({name: Snapshot}) are computed from
+    it, the others from one streaming read of the table (see _Frequencies).
+    """
+    snapshots = snapshots or {}
+    scanned = [c for c in columns if c["name"] not in snapshots]
+    freqs = _frequencies(conn, table_name, scanned) if scanned else {}
+    if freqs:
+        row_count = next(iter(freqs.values())).rows
+    elif snapshots:
+        snap = next(iter(snapshots.values()))
+        row_count = snap.count + snap.nulls
+    else:
+        row_count = conn.execute(f"SELECT COUNT(*) FROM {quote_identifier(table_name)}").fetchone()[0]
+    stats = {}
+    for column in columns:
+        name = column["name"]
+        snap = snapshots.get(name)
+        stats[name] = snap.profile_stats(TOP_K) if snap is not None else freqs[name].result()
+    return row_count, stats
+
+
+def profile_table(table_name):
+    """Return (row_count, stats) for every column of table_name.
+
+    Numeric columns get min/max/avg/stddev, all columns get distinct, nulls
+    and top_values; numeric ones come from their columnar snapshots. Tables
+    wider than MAX_COLUMNS are profiled one column group at a time.
+    """
+    columns = database.get_table_info(table_name)
+    conn = database.read_connection()
+    row_count, stats = 0, {}
+    if not columns:
+        return row_count, stats
+    snapshots = numeric_snapshots(conn, table_name, columns)
+    for group in column_groups(columns):
+        row_count, group_stats = profile_columns(conn, table_name, group, snapshots)
+        stats.update(group_stats)
+    return row_count, stats
+
+
+def build_profile(table_name):
+    """Return the exact /profile/<table> payload: columns, row_count, sample and statistics."""
+    columns = database.get_table_info(table_name)
+    col_names, sample_rows = database.get_table_preview(table_name)
+    row_count, stats = profile_table(table_name)
+    return {
+        "table": table_name,
+        "columns": columns,
+        "row_count": row_count,
+        "sample": [dict(zip(col_names, row)) for row in sample_rows],
+        "statistics": stats
+    }
+
+
+class _ColumnSketch:
+    """Bounded-memory summary of one column, built from streamed values."""
+
+    def __init__(self, numeric):
+        self.numeric = numeric
+        self.rows = 0
+        self.nulls = 0
+        self.distinct = sketches.HyperLogLog()
+        self.heavy = sketches.MisraGries(HEAVY_HITTERS)
+        self.moments = sketches.Moments() if numeric else None
+        self.quantiles = sketches.KLL() if numeric else None
+
+    def update_many(self, values):
+        chunk = Counter(values)
+        self.rows += len(values)
+        self.nulls += chunk.pop(None, 0)
+        self.distinct.add_values(chunk)
+        self.heavy.update_counts(chunk)
+        if self.numeric:
+            self.moments.update_counts(chunk)
+            for x in values:
+                if isinstance(x, (int, float)):
+                    self.quantiles.update(x)
+
+    def result(self, row_count, complete):
+        """Stats of the rows seen; unless complete, counts are scaled to row_count.
+
+        Scaled counts and the mean get sampling-error half-widths at Z_SCORE;
+        distinct, min and max describe the sample only and are listed in
+        "sample_only" without a table-level bound.
+        """
+        seen = self.rows - self.nulls
+        bound = self.heavy.error_bound()
+        top = [(v, n) for v, n in self.heavy.top(TOP_K) if n > bound]
+        stats = {
+            "distinct": min(self.distinct.estimate(), seen),
+            "nulls": self.nulls,
+            "top_values": [{"value": _json_value(v), "count": n} for v, n in top],
+        }
+        error = {"distinct_relative": self.distinct.relative_error(), "top_values_count": bound}
+        if self.numeric:
+            m = self.moments
+            stddev = m.stddev()
+            stats = {
+                "min": m.min,
+                "max": m.max,
+                "avg": round(m.mean, 2) if m.n else None,
+                "stddev": round(stddev, 2) if stddev is not None else None,
+                **stats,
+                "quantiles": {
+                    f"p{int(q * 100)}": v
+                    for q, v in zip(QUANTILES, self.quantiles.quantiles(QUANTILES))
+                },
+            }
+            error["quantile_rank"] = self.quantiles.rank_error()
+        if not complete and self.rows:
+            n = self.rows
+            scale = row_count / n
+            fpc = math.sqrt(max(row_count - n, 0) / (row_count - 1)) if row_count > 1 else 0.0
+
+            def count_error(k):
+                """Half-width of the scaled count of something seen k times in n rows.
+
+                The proportion is Laplace smoothed so a value seen in none or
+                all of a small sample does not get a zero-width bound.
+                """
+                p = (k + 1) / (n + 2)
+                return round(Z_SCORE * math.sqrt(p * (1 - p) / n) * fpc * row_count)
+
+            stats["nulls"] = round(self.nulls * scale)
+            error["nulls"] = count_error(self.nulls)
+            # A value is only reported as frequent when its scaled count clears its own bound.
+            scaled = [(v, round(k * scale), round(bound * scale) + count_error(k)) for v, k in top]
+            scaled = [item for item in scaled if item[1] > item[2]]
+            stats["top_values"] = [{"value": _json_value(v), "count": n} for v, n, _ in scaled]
+            error["top_values_count"] = max((e for _, _, e in scaled), default=round(bound * scale) + count_error(0))
+            del error["distinct_relative"]
+            stats["sample_only"] = ["distinct"]
+            if self.numeric:
+                stats["sample_only"] += ["min", "max"]
+                if stddev is not None:
+                    error["avg"] = round(Z_SCORE * stddev / math.sqrt(self.moments.n) * fpc, 4)
+                # Dvoretzky-Kiefer-Wolfowitz bound on the sample's rank error, added to the sketch's.
+                dkw = math.sqrt(math.log(2 / 0.05) / (2 * max(self.moments.n, 1)))
+                error["quantile_rank"] = round(min(1.0, error["quantile_rank"] + dkw), 4)
+        stats["error"] = error
+        return stats
+
+
+def _rowid_span(conn, table_name):
+    """Return (min_rowid, max_rowid), (None, None) when empty, or None for WITHOUT ROWID tables."""
+    try:
+        return conn.execute(
+            f"SELECT MIN(rowid), MAX(rowid) FROM {quote_identifier(table_name)}"
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+
+
+def _window_starts(lo, hi, chunk_size, row_budget):
+    """(starts, width) of the rowid windows to read, in random order.
+
+    Without a row budget (or with one covering the span) the windows tile
+    the range. Otherwise the range is cut into at least MIN_WINDOWS equal
+    strata and each contributes one window at a random offset, so even a
+    tiny budget samples the whole table rather than its first rows.
+    """
+    span = hi - lo + 1
+    if not row_budget or row_budget >= span:
+        starts = list(range(lo, hi + 1, chunk_size))
+        width = chunk_size
+    else:
+        windows = max(math.ceil(row_budget / chunk_size), min(MIN_WINDOWS, row_budget))
+        step = span / windows
+        width = max(1, row_budget // windows)
+        starts = [
+            lo + int(i * step) + random.randrange(max(1, int(step) - width + 1))
+            for i in range(windows)
+        ]
+    random.shuffle(starts)
+    return starts, width
+
+
+def _iter_chunks(conn, table_name, bounds, chunk_size, row_budget):
+    """Yield (rows, rowid_width) chunks of a budgeted scan of a rowid table (see _window_starts)."""
+    lo, hi = bounds
+    if lo is None:
+        return
+    qt = quote_identifier(table_name)
+    starts, width = _window_starts(lo, hi, chunk_size, row_budget)
+    for start in starts:
+        end = min(start + width, hi + 1)
+        rows = conn.execute(
+            f"SELECT * FROM {qt} WHERE rowid >= ? AND rowid < ?", (start, end)
+        ).fetchall()
+        yield rows, end - start
+
+
+def _thinned_scan(conn, table_name, chunk_size, row_budget, deadline):
+    """Bernoulli sample a WITHOUT ROWID table in one pass: (rows, rows_read, complete).
+
+    There is no rowid to seek on and the row count is not known up front, so
+    the keep probability starts at 1 and halves, dropping the kept rows drawn
+    above it, whenever more than row_budget rows are kept. The scan stops at
+    deadline (a perf_counter time).
+    """
+    cursor = conn.execute(f"SELECT * FROM {quote_identifier(table_name)}")
+    p = 1.0
+    kept = []
+    read = 0
+    complete = False
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            complete = True
+            break
+        read += len(rows)
+        kept += [(u, row) for u, row in zip((random.random() for _ in rows), rows) if u < p]
+        while len(kept) > row_budget:
+            p /= 2
+            kept = [item for item in kept if item[0] < p]
+        if time.perf_counter() >= deadline:
+            break
+    return [row for _, row in kept], read, complete
+
+
+def _exact_approx_result(table_name, started):
+    """profile_table in profile_table_approx's shape, for scans that would read every row anyway."""
+    row_count, stats = profile_table(table_name)
+    col_names, rows = database.get_table_preview(table_name, limit=SAMPLE_SIZE)
+    return {
+        "row_count": row_count,
+        "row_count_exact": True,
+        "rows_scanned": row_count,
+        "complete": True,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        "sample": [dict(zip(col_names, row)) for row in rows],
+        "statistics": stats,
+    }
+
+
+def profile_table_approx(table_name, row_budget=None, time_budget=None, chunk_size=CHUNK_SIZE):
+    """Profile table_name from a sample of at most row_budget rows / time_budget seconds.
+
+    Each budget defaults to DEFAULT_ROW_BUDGET / DEFAULT_TIME_BUDGET. Returns
+    a dict with row_count (estimated from rowid density when the scan stopped
+    early; for a WITHOUT ROWID table, the rows read before the time budget ran
+    out), a reservoir sample, per-column statistics scaled to the table with
+    error bounds (see _ColumnSketch.result), and scan metadata (rows_scanned,
+    complete, elapsed_ms). With a row budget covering a rowid table, this is
+    the exact profile_table.
+    """
+    started = time.perf_counter()
+    row_budget = row_budget or DEFAULT_ROW_BUDGET
+    time_budget = time_budget or DEFAULT_TIME_BUDGET
+    columns = database.get_table_info(table_name)
+    conn = database.read_connection()
+    bounds = _rowid_span(conn, table_name)
+    span = bounds[1] - bounds[0] + 1 if bounds and bounds[0] is not None else 0
+    if bounds is not None and row_budget >= span:
+        return _exact_approx_result(table_name, started)
+    col_sketches = [_ColumnSketch(is_numeric_type(c["type"])) for c in columns]
+    sample = sketches.Reservoir(SAMPLE_SIZE)
+
+    def add(rows):
+        for row in rows:
+            sample.update(row)
+        for sketch, values in zip(col_sketches, zip(*rows)):
+            sketch.update_many(values)
+
+    if bounds is None:
+        rows, row_count, scanned_all = _thinned_scan(conn, table_name, chunk_size, row_budget, started + time_budget)
+        if rows:
+            add(rows)
+        rows_scanned = len(rows)
+        complete = rows_scanned == row_count
+    else:
+        rows_scanned = 0
+        rowid_scanned = 0
+        for rows, width in _iter_chunks(conn, table_name, bounds, chunk_size, row_budget):
+            add(rows)
+            rows_scanned += len(rows)
+            rowid_scanned += width
+            if rows_scanned >= row_budget or time.perf_counter() - started >= time_budget:
+                break
+        scanned_all = complete = rowid_scanned >= span
+        density = rows_scanned / rowid_scanned if rowid_scanned else 0
+        row_count = rows_scanned if complete else int(round(density * span))
+    col_names = [c["name"] for c in columns]
+    return {
+        "row_count": row_count,
+        "row_count_exact": scanned_all,
+        "rows_scanned": rows_scanned,
+        "complete": complete,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        "sample": [dict(zip(col_names, row)) for row in sample.items],
+        "statistics": {
+            c["name"]: sketch.result(row_count, complete) for c, sketch in zip(columns, col_sketches)
+        },
+    }
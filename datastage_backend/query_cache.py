@@ -0,0 +1,240 @@
+"""Result cache for /query, keyed on normalized SQL and the change counters of the tables it read.
+
+SQL is normalized into a shape (comments dropped, whitespace collapsed,
+keywords and identifiers lower-cased, literals replaced by ?) plus the list
+of literals, so formatting differences share an entry while different
+literal values do not. Each entry remembers the _ds_table_versions counter
+of every table the query read, taken in the same read transaction as the
+rows; a lookup re-reads the counters and drops the entry if any moved.
+Reading never installs tracking (startup tracks the default source's
+tables): when a table the query read has no counter, the entry instead
+remembers the pool's data_version (taken before the query ran) and is
+dropped after any commit to the file. Entries also keep the SQL of the
+tables they read, of those tables' triggers and of every view, so DDL
+elsewhere in the database does not drop them.
+Entries are evicted LRU once the cache holds more than MAX_BYTES of
+(estimated) row data.
+"""
+import functools
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import database
+import query_runner
+
+MAX_BYTES = 32 * 1024 * 1024
+# Results larger than this are streamed but not cached.
+MAX_ENTRY_BYTES = 4 * 1024 * 1024
+ROW_OVERHEAD = 64
+VALUE_OVERHEAD = 16
+
+_TOKEN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|$))
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<blob>[xX]'[0-9a-fA-F]*')
+  | (?P<quoted>"(?:[^"]|"")*"|`(?:[^`]|``)*`|\[[^\]]*\])
+  | (?P<number>(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?|0[xX][0-9a-fA-F]+)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<param>[?][0-9]*|[:@$][A-Za-z0-9_]+)
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+_state = {"bytes": 0}
+_stats = {"hits": 0, "misses": 0, "stale": 0, "bypassed": 0, "stored": 0, "evicted": 0, "uncacheable": 0}
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize(sql):
+    """Return (shape, literals) for sql; see the module docstring."""
+    shape = []
+    literals = []
+    for match in _TOKEN.finditer(sql.strip().rstrip(";")):
+        kind = match.lastgroup
+        text = match.group()
+        if kind in ("space", "comment"):
+            continue
+        if kind in ("string", "blob", "number"):
+            literals.append(text)
+            shape.append("?")
+        elif kind == "word":
+            shape.append(text.lower())
+        else:
+            shape.append(text)
+    return " ".join(shape), tuple(literals)
+
+
+def cache_key(sql, params=None, **options):
+    """Key for one execution: normalized SQL, its literals, the bound params and the runner options."""
+    shape, literals = normalize(sql or "")
+    material = json.dumps([shape, literals, params, sorted(options.items())], default=str)
+    return hashlib.sha1(material.encode("utf-8")).hexdigest()
+
+
+def _row_bytes(row):
+    size = ROW_OVERHEAD
+    for value in row:
+        size += VALUE_OVERHEAD + (len(value) if isinstance(value, (str, bytes)) else 8)
+    return size
+
+
+def _current_versions():
+    conn = database.read_connection()
+    try:
+        versions = dict(conn.execute(
+            f"SELECT table_name, version FROM {database.INTERNAL_PREFIX}table_versions"
+        ))
+    except sqlite3.OperationalError:
+        versions = {}
+    return versions, conn.execute("PRAGMA schema_version").fetchone()[0]
+
+
+def _table_schema(tables):
+    """(schema_version, {name: sql}) of tables, their triggers and every view, read in one statement."""
+    tables = list(tables)
+    marks = ", ".join("?" * len(tables))
+    version, schema = database.read_connection().execute(
+        "SELECT schema_version, (SELECT json_group_object(name, sql) FROM sqlite_master "
+        f"WHERE type = 'view' OR (type IN ('table', 'trigger') AND tbl_name IN ({marks}))) "
+        "FROM pragma_schema_version",
+        tables,
+    ).fetchone()
+    return version, json.loads(schema)
+
+
+class CachedResult:
+    """A cache hit, with the same interface as query_runner.QueryResult."""
+
+    def __init__(self, entry):
+        self.columns = entry["columns"]
+        self.info = dict(entry["info"])
+        self.cache = "hit"
+        self._rows = entry["rows"]
+
+    def chunks(self):
+        for start in range(0, len(self._rows), query_runner.FETCH_SIZE):
+            yield self._rows[start:start + query_runner.FETCH_SIZE]
+
+
+class _RecordingResult:
+    """A cache miss: streams the live result and stores it once it completes cleanly."""
+
+    def __init__(self, key, result, data_version):
+        self.columns = result.columns
+        self.info = result.info
+        self.cache = "miss"
+        self._key = key
+        self._result = result
+        self._data_version = data_version
+
+    def chunks(self):
+        rows = []
+        size = 0
+        for chunk in self._result.chunks():
+            if rows is not None:
+                size += sum(_row_bytes(row) for row in chunk)
+                if size > MAX_ENTRY_BYTES:
+                    rows = None
+                else:
+                    rows.extend(chunk)
+            yield chunk
+        result = self._result
+        if rows is None or result.info["error"]:
+            with _lock:
+                _stats["uncacheable"] += 1
+            return
+        schema_version, schema = _table_schema(result.versions)
+        if schema_version != result.schema_version:
+            with _lock:
+                _stats["uncacheable"] += 1  # DDL since the query ran: its schema is not the one it read
+            return
+        untracked = any(v is None for v in result.versions.values())
+        _put(self._key, {
+            "columns": result.columns,
+            "rows": rows,
+            "info": dict(result.info),
+            "versions": {t: v for t, v in result.versions.items() if v is not None},
+            "schema_version": result.schema_version,
+            "schema": schema,
+            "data_version": self._data_version if untracked else None,
+            "bytes": size,
+        })
+
+
+def _put(key, entry):
+    with _lock:
+        old = _cache.pop(key, None)
+        if old is not None:
+            _state["bytes"] -= old["bytes"]
+        _cache[key] = entry
+        _state["bytes"] += entry["bytes"]
+        _stats["stored"] += 1
+        while _state["bytes"] > MAX_BYTES and _cache:
+            _, evicted = _cache.popitem(last=False)
+            _state["bytes"] -= evicted["bytes"]
+            _stats["evicted"] += 1
+
+
+def _get(key):
+    with _lock:
+        entry = _cache.get(key)
+    if entry is None:
+        return None
+    versions, schema_version = _current_versions()
+    fresh = all(
+        versions.get(table) == version for table, version in entry["versions"].items()
+    ) and entry["data_version"] in (None, database.get_pool().data_version())
+    if fresh and schema_version != entry["schema_version"]:
+        schema_version, schema = _table_schema(entry["schema"])
+        fresh = schema == entry["schema"]
+        if fresh:
+            with _lock:
+                entry["schema_version"] = schema_version  # unrelated DDL: skip this comparison next time
+    with _lock:
+        if not fresh:
+            if _cache.get(key) is entry:
+                del _cache[key]
+                _state["bytes"] -= entry["bytes"]
+            _stats["stale"] += 1
+            return None
+        if key in _cache:
+            _cache.move_to_end(key)
+    return entry
+
+
+def execute(sql, params=None, bypass=False, **options):
+    """query_runner.execute with caching; the result's `cache` is hit, miss or bypass."""
+    if bypass:
+        with _lock:
+            _stats["bypassed"] += 1
+        result = query_runner.execute(sql, params, **options)
+        result.cache = "bypass"
+        return result
+    key = cache_key(sql, params, source=database.get_pool().path, **options)
+    entry = _get(key)
+    if entry is not None:
+        with _lock:
+            _stats["hits"] += 1
+        return CachedResult(entry)
+    with _lock:
+        _stats["misses"] += 1
+    # Taken before the query's snapshot, so a commit in between only makes the entry stale early.
+    data_version = database.get_pool().data_version()
+    return _RecordingResult(key, query_runner.execute(sql, params, **options), data_version)
+
+
+def clear():
+    with _lock:
+        _cache.clear()
+        _state["bytes"] = 0
+
+
+def stats():
+    with _lock:
+        return {**_stats, "entries": len(_cache), "bytes": _state["bytes"], "max_bytes": MAX_BYTES}
@@ -0,0 +1,226 @@
+"""Read-only execution of generated or user SQL.
+
+Queries run on the read-only pool (mode=ro, query_only) behind an authorizer
+that only permits reads, with a time limit enforced through SQLite's
+progress handler and a row limit enforced while fetching. The time limit
+counts only time spent inside SQLite, not time waiting on a slow client.
+Rows are fetched with fetchmany and handed out in chunks, so a large result
+never has to fit in memory. Passing a key column switches to keyset
+pagination: `WHERE key > last ORDER BY key LIMIT page_size` over the query,
+with an opaque cursor for the next page; a page that would end between two
+rows with the same key is rejected, since the next page would skip the rest.
+"""
+import sqlite3
+import time
+
+import database
+from database import quote_identifier
+from streaming import decode_cursor, encode_cursor
+
+MAX_ROWS = 100000
+DEFAULT_TIMEOUT_MS = 5000
+MAX_TIMEOUT_MS = 30000
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 10000
+FETCH_SIZE = 1000
+# The progress handler runs every this many SQLite VM instructions.
+PROGRESS_STEPS = 10000
+
+_ALLOWED_ACTIONS = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    sqlite3.SQLITE_RECURSIVE,
+}
+
+
+class QueryError(Exception):
+    """The SQL or its parameters were rejected; the message is safe to return to the client."""
+
+
+def _authorizer(tables):
+    """Authorizer that only permits reads and records every table the statement reads."""
+    def authorize(action, arg1, arg2, db_name, trigger):
+        if action not in _ALLOWED_ACTIONS:
+            return sqlite3.SQLITE_DENY
+        if action == sqlite3.SQLITE_READ and arg1:
+            tables.add(arg1)
+        return sqlite3.SQLITE_OK
+    return authorize
+
+
+def _release(conn):
+    conn.set_progress_handler(None, 0)
+    conn.set_authorizer(None)
+    if conn.in_transaction:
+        conn.rollback()
+
+
+def _clean_sql(sql):
+    sql = (sql or "").strip()
+    while sql.endswith(";"):
+        sql = sql[:-1].rstrip()
+    return sql
+
+
+class QueryResult:
+    """An executing query: columns are known, rows come from chunks(); info is filled in as it runs.
+
+    The query runs in one read transaction, so `versions` (the change counter
+    of every table it read, None for untracked tables) and `schema_version`
+    describe exactly the snapshot the rows come from.
+    """
+
+    def __init__(self, conn, cursor, columns, first, max_rows, key_index, paginated,
+                 versions=None, schema_version=None, deadline=None, budget=None):
+        self._conn = conn
+        # The progress handler reads deadline[0]; it is re-armed with what is left of budget before each fetch.
+        self._deadline = deadline or [float("inf")]
+        self._budget = budget
+        self.versions = versions or {}
+        self.schema_version = schema_version
+        self._cursor = cursor
+        self.columns = columns
+        self._first = first
+        self._max_rows = max_rows
+        self._key_index = key_index
+        self.info = {"rows": 0, "truncated": False, "next_cursor": None, "error": None}
+        if paginated:
+            # Pages are bounded by MAX_PAGE_SIZE, so read the whole page (plus one
+            # look-ahead row) up front to know the next cursor before streaming.
+            rows = first
+            while len(rows) <= max_rows:
+                more = self._fetch(FETCH_SIZE)
+                if not more:
+                    break
+                rows += more
+            self._finish()
+            self._cursor = None
+            if len(rows) > max_rows:
+                last, following = rows[max_rows - 1][key_index], rows[max_rows][key_index]
+                if last is None or last == following:
+                    raise QueryError(
+                        f"Key column {columns[key_index]!r} is not unique (or is NULL) at a page "
+                        "boundary; paginate on a unique, non-null key"
+                    )
+                rows = rows[:max_rows]
+                self.info["next_cursor"] = encode_cursor({"after": last})
+            self._first = rows
+
+    def _finish(self):
+        if self._cursor is None:
+            return
+        try:
+            self._cursor.close()
+        except sqlite3.Error:
+            pass
+        _release(self._conn)
+
+    def _fetch(self, size):
+        if self._budget is None:
+            return self._cursor.fetchmany(size)
+        started = time.monotonic()
+        self._deadline[0] = started + self._budget
+        try:
+            return self._cursor.fetchmany(size)
+        finally:
+            self._budget -= time.monotonic() - started
+
+    def chunks(self):
+        """Yield lists of row tuples until the result, row limit or time limit runs out."""
+        remaining = self._max_rows
+        rows = self._first
+        try:
+            while rows:
+                if len(rows) > remaining:
+                    rows = rows[:remaining]
+                    self.info["truncated"] = True
+                remaining -= len(rows)
+                self.info["rows"] += len(rows)
+                yield rows
+                if remaining <= 0 or self._cursor is None:
+                    if remaining <= 0 and self._cursor is not None and self._fetch(1):
+                        self.info["truncated"] = True
+                    break
+                rows = self._fetch(FETCH_SIZE)
+        except sqlite3.OperationalError as e:
+            self.info["error"] = "Query exceeded the time limit" if "interrupt" in str(e) else str(e)
+        finally:
+            self._first = None
+            self._finish()
+            self._cursor = None
+
+
+def execute(sql, params=None, max_rows=None, timeout_ms=None, key=None, cursor=None, page_size=None):
+    """Start a read-only query and return a QueryResult; raises QueryError for bad input."""
+    sql = _clean_sql(sql)
+    if not sql:
+        raise QueryError("Missing SQL")
+    if params is None:
+        params = []
+    if not isinstance(params, (list, tuple, dict)):
+        raise QueryError("params must be a list or an object")
+    max_rows = max(1, min(int(max_rows or MAX_ROWS), MAX_ROWS))
+    timeout_ms = max(1, min(float(timeout_ms or DEFAULT_TIMEOUT_MS), MAX_TIMEOUT_MS))
+
+    paginated = bool(key)
+    if paginated:
+        max_rows = max(1, min(int(page_size or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+        qkey = f"q.{quote_identifier(key)}"
+        named = isinstance(params, dict)
+        params = dict(params) if named else list(params)
+        wrapped = f"SELECT * FROM ({sql}) AS q"
+        if cursor:
+            try:
+                after = decode_cursor(cursor)["after"]
+            except (ValueError, KeyError, TypeError):
+                raise QueryError("Invalid cursor")
+            wrapped += f" WHERE {qkey} > " + (":_ds_after" if named else "?")
+            if named:
+                params["_ds_after"] = after
+            else:
+                params.append(after)
+        wrapped += f" ORDER BY {qkey} LIMIT " + (":_ds_limit" if named else "?")
+        if named:
+            params["_ds_limit"] = max_rows + 1
+        else:
+            params.append(max_rows + 1)
+        sql = wrapped
+
+    conn = database.get_readonly_pool().reader()
+    _release(conn)  # a result that was never consumed leaves its transaction and authorizer behind
+    conn.execute("BEGIN")
+    try:
+        all_versions = dict(conn.execute(
+            f"SELECT table_name, version FROM {database.INTERNAL_PREFIX}table_versions"
+        ))
+    except sqlite3.OperationalError:
+        all_versions = {}  # no table is tracked yet
+    schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+    tables = set()
+    started = time.monotonic()
+    deadline = [started + timeout_ms / 1000]
+    conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline[0] else 0, PROGRESS_STEPS)
+    conn.set_authorizer(_authorizer(tables))
+    try:
+        cur = conn.execute(sql, params)
+        columns = [d[0] for d in cur.description or []]
+        first = cur.fetchmany(FETCH_SIZE)
+    except (sqlite3.Error, ValueError, OverflowError) as e:
+        _release(conn)
+        message = str(e)
+        if "interrupt" in message:
+            message = "Query exceeded the time limit"
+        elif "not authorized" in message or "readonly" in message:
+            message = "Only read-only SELECT queries are allowed"
+        raise QueryError(message)
+    key_index = None
+    if paginated:
+        if key not in columns:
+            _release(conn)
+            raise QueryError(f"Key column {key!r} is not in the result")
+        key_index = columns.index(key)
+    versions = {t: all_versions.get(t) for t in tables if not t.startswith("sqlite_")}
+    budget = timeout_ms / 1000 - (time.monotonic() - started)
+    return QueryResult(conn, cur, columns, first, max_rows, key_index, paginated,
+                       versions, schema_version, deadline, budget)
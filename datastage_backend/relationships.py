@@ -0,0 +1,327 @@
+"""Relationship discovery: inferred foreign keys from column sketches, confirmed with exact SQL.
+
+1. One streaming pass per table builds, for every integer or text column, a
+   HyperLogLog (distinct count) and a one-permutation MinHash signature
+   (SIGNATURE_BINS bins, one hash per value).
+2. Key columns are those whose distinct count is close to their non-null
+   count. Candidate pairs (column -> key column) come from LSH banding of the
+   signatures, which finds columns drawing on the same values, plus names
+   that point at a key's table (orders.customer_id -> customers, or
+   employees.department -> departments). Pairs are ranked by the containment
+   estimated from the Jaccard similarity and the two distinct counts.
+3. Only the top MAX_CONFIRM candidates are checked exactly: the share of the
+   column's distinct values found in the key, and the key's uniqueness.
+
+Declared foreign keys (PRAGMA foreign_key_list) are always included. Results
+are stored in _ds_relationships of the current source's state database
+(see sources.state_path) and used by /extract, /chat and SQL generation.
+"""
+import itertools
+import sqlite3
+import time
+from collections import defaultdict
+
+import database
+import sketches
+from database import quote_identifier
+
+REL_TABLE = f"{database.INTERNAL_PREFIX}relationships"
+SIGNATURE_BINS = 128
+LSH_BANDS = 32  # of SIGNATURE_BINS // LSH_BANDS rows each: pairs above ~0.4 Jaccard collide
+HLL_PRECISION = 11
+FETCH_SIZE = 5000
+# A key column has at least this many distinct values per non-null value (estimated, then exact).
+KEY_RATIO = 0.95
+EXACT_KEY_RATIO = 0.99
+MIN_CONTAINMENT = 0.95
+# Integer columns without a name hint also need this much overlap, or any small counter would match an id.
+MIN_INTEGER_JACCARD = 0.5
+MAX_CONFIRM = 50
+
+_EMPTY = 1 << 64
+_BIN_BITS = SIGNATURE_BINS.bit_length() - 1
+
+
+class ColumnSignature:
+    """HLL plus one-permutation MinHash of a column's non-null values."""
+
+    def __init__(self, table_name, column, kind):
+        self.table = table_name
+        self.column = column
+        self.kind = kind
+        self.non_null = 0
+        self.hll = sketches.HyperLogLog(HLL_PRECISION)
+        self.bins = [_EMPTY] * SIGNATURE_BINS
+        self._distinct = None
+
+    def update_many(self, values):
+        present = [v for v in values if v is not None]
+        self.non_null += len(present)
+        bins = self.bins
+        hll = self.hll
+        mask = SIGNATURE_BINS - 1
+        for h in map(sketches.hash64, set(present)):
+            hll.add_hash(h)
+            i = h & mask
+            rest = h >> _BIN_BITS
+            if rest < bins[i]:
+                bins[i] = rest
+
+    @property
+    def distinct(self):
+        if self._distinct is None:
+            self._distinct = min(self.hll.estimate(), self.non_null)
+        return self._distinct
+
+    @property
+    def is_key(self):
+        return self.non_null > 1 and self.distinct >= KEY_RATIO * self.non_null
+
+    def jaccard(self, other):
+        """One-permutation MinHash estimate, ignoring bins empty in both."""
+        matches = used = 0
+        for a, b in zip(self.bins, other.bins):
+            if a == _EMPTY and b == _EMPTY:
+                continue
+            used += 1
+            matches += a == b
+        return matches / used if used else 0.0
+
+    def containment_in(self, other, jaccard):
+        """Estimated share of this column's distinct values that appear in other."""
+        if not self.distinct:
+            return 0.0
+        return min(1.0, jaccard * (self.distinct + other.distinct) / ((1 + jaccard) * self.distinct))
+
+
+def _kind(col_type):
+    col_type = (col_type or "").upper()
+    if "INT" in col_type:
+        return "integer"
+    if "CHAR" in col_type or "TEXT" in col_type or "CLOB" in col_type or not col_type:
+        return "text"
+    return None  # REAL, BLOB, dates with numeric affinity: not key material
+
+
+def table_signatures(conn, table_name, columns):
+    """Signatures of every integer/text column of table_name, from one scan."""
+    signatures = [ColumnSignature(table_name, c["name"], _kind(c["type"])) for c in columns if _kind(c["type"])]
+    if not signatures:
+        return []
+    select = ", ".join(quote_identifier(s.column) for s in signatures)
+    cur = conn.execute(f"SELECT {select} FROM {quote_identifier(table_name)}")
+    while True:
+        rows = cur.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        for signature, values in zip(signatures, zip(*rows)):
+            signature.update_many(values)
+    return signatures
+
+
+def _lsh_pairs(signatures):
+    """Pairs of signatures sharing at least one fully populated band."""
+    rows = SIGNATURE_BINS // LSH_BANDS
+    buckets = defaultdict(list)
+    for n, signature in enumerate(signatures):
+        for band in range(LSH_BANDS):
+            key = tuple(signature.bins[band * rows:(band + 1) * rows])
+            if _EMPTY not in key:
+                buckets[(band, key)].append(n)
+    pairs = set()
+    for members in buckets.values():
+        pairs.update(itertools.combinations(sorted(set(members)), 2))
+    return pairs
+
+
+def _singular(name):
+    name = name.lower()
+    return name[:-1] if name.endswith("s") else name
+
+
+def _name_hint(column, key):
+    """True when column's name points at key's table (customer_id -> customers.customer_id/id)."""
+    name = column.column.lower()
+    table = _singular(key.table)
+    key_name = key.column.lower()
+    hints = {f"{table}_{key_name}", f"{table}{key_name}"}
+    if key_name in ("id", f"{table}_id"):
+        hints |= {f"{table}_id", f"{table}id", table}
+    if key_name == "name":
+        hints.add(table)
+    return name in hints
+
+
+def candidates(signatures):
+    """(score, column, key, jaccard, containment, hinted) for plausible column -> key pairs, best first."""
+    keys = [s for s in signatures if s.is_key]
+    pairs = set()
+    for a, b in _lsh_pairs(signatures):
+        pairs.update(((a, b), (b, a)))
+    index = {id(s): n for n, s in enumerate(signatures)}
+    for key in keys:
+        for column in signatures:
+            if column is not key and _name_hint(column, key):
+                pairs.add((index[id(column)], index[id(key)]))
+    found = []
+    for a, b in pairs:
+        column, key = signatures[a], signatures[b]
+        if not key.is_key or column.kind != key.kind or not column.distinct:
+            continue
+        if column.table == key.table and column.column == key.column:
+            continue
+        hinted = _name_hint(column, key)
+        if column.is_key and column.kind == "integer" and not hinted:
+            continue  # unrelated id columns look alike; 1:1 integer links need a name hint
+        if column.distinct > 1.1 * key.distinct:
+            continue
+        jaccard = column.jaccard(key)
+        if column.kind == "integer" and not hinted and jaccard < MIN_INTEGER_JACCARD:
+            continue
+        containment = column.containment_in(key, jaccard)
+        score = containment + (0.5 if hinted else 0.0)
+        found.append((score, column, key, jaccard, containment, hinted))
+    found.sort(key=lambda c: (-c[0], c[1].table, c[1].column))
+    return found
+
+
+def _exact_containment(conn, column, key):
+    qc = quote_identifier(column.column)
+    qk = quote_identifier(key.column)
+    distinct, missing = conn.execute(
+        f"""SELECT COUNT(*), COALESCE(SUM(v NOT IN (SELECT {qk} FROM {quote_identifier(key.table)}
+                                                    WHERE {qk} IS NOT NULL)), 0)
+            FROM (SELECT DISTINCT {qc} AS v FROM {quote_identifier(column.table)} WHERE {qc} IS NOT NULL)"""
+    ).fetchone()
+    return (distinct - missing) / distinct if distinct else 0.0
+
+
+def _exact_key(conn, key):
+    qk = quote_identifier(key.column)
+    distinct, non_null = conn.execute(
+        f"SELECT COUNT(DISTINCT {qk}), COUNT({qk}) FROM {quote_identifier(key.table)}"
+    ).fetchone()
+    return non_null > 0 and distinct >= EXACT_KEY_RATIO * non_null
+
+
+def declared(conn, schema):
+    """Foreign keys declared in the schema, as relationship dicts."""
+    found = []
+    for table_name in schema:
+        for row in conn.execute(f"PRAGMA foreign_key_list({quote_identifier(table_name)})").fetchall():
+            ref_table, column, ref_column = row[2], row[3], row[4]
+            if ref_column is None:  # REFERENCES t without a column: its primary key
+                pk = [c["name"] for c in schema.get(ref_table, []) if c["primary_key"]]
+                ref_column = pk[0] if len(pk) == 1 else None
+            if ref_column:
+                found.append({"table": table_name, "column": column, "ref_table": ref_table,
+                              "ref_column": ref_column, "containment": None, "jaccard": None,
+                              "method": "declared"})
+    return found
+
+
+def _ensure_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {REL_TABLE} (
+            table_name TEXT NOT NULL,
+            column_name TEXT NOT NULL,
+            ref_table TEXT NOT NULL,
+            ref_column TEXT NOT NULL,
+            containment REAL,
+            jaccard REAL,
+            method TEXT NOT NULL,
+            discovered_at REAL NOT NULL,
+            PRIMARY KEY (table_name, column_name)
+        )
+    """)
+
+
+def discover(tables=None, max_confirm=MAX_CONFIRM, progress=None):
+    """Infer foreign keys across the current source (or among tables) and store them.
+
+    progress(done, total, message), if given, is called after each table is
+    sketched. Returns {"relationships", "candidates", "confirmed", timings}.
+    """
+    started = time.perf_counter()
+    schema = database.get_schema()
+    tables = [t for t in (tables or schema) if t in schema]
+    conn = database.read_connection()
+    signatures = []
+    for n, table_name in enumerate(tables):
+        signatures += table_signatures(conn, table_name, schema[table_name])
+        if progress is not None:
+            progress(n + 1, len(tables), table_name)
+    sketch_ms = (time.perf_counter() - started) * 1000
+
+    found = {(r["table"], r["column"]): r for r in declared(conn, {t: schema[t] for t in tables})}
+    ranked = [c for c in candidates(signatures) if (c[1].table, c[1].column) not in found]
+    keys_checked = {}
+    confirmed = 0
+    for score, column, key, jaccard, _, hinted in ranked[:max_confirm]:
+        if (column.table, column.column) in found:
+            continue  # a better-ranked key already matched this column
+        key_id = (key.table, key.column)
+        if key_id not in keys_checked:
+            keys_checked[key_id] = _exact_key(conn, key)
+        if not keys_checked[key_id]:
+            continue
+        confirmed += 1
+        containment = _exact_containment(conn, column, key)
+        if containment >= MIN_CONTAINMENT:
+            found[(column.table, column.column)] = {
+                "table": column.table, "column": column.column, "ref_table": key.table,
+                "ref_column": key.column, "containment": round(containment, 4),
+                "jaccard": round(jaccard, 4), "method": "name+sketch" if hinted else "sketch",
+            }
+
+    relationships = sorted(found.values(), key=lambda r: (r["table"], r["column"]))
+    now = time.time()
+    with database.state_write_connection() as wconn:
+        _ensure_table(wconn)
+        wconn.executemany(
+            f"DELETE FROM {REL_TABLE} WHERE table_name = ?", [(t,) for t in tables]
+        )
+        wconn.executemany(
+            f"INSERT OR REPLACE INTO {REL_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(r["table"], r["column"], r["ref_table"], r["ref_column"], r["containment"], r["jaccard"],
+              r["method"], now) for r in relationships],
+        )
+    return {
+        "relationships": relationships,
+        "columns_sketched": len(signatures),
+        "candidates": len(ranked),
+        "confirmed": confirmed,
+        "sketch_ms": round(sketch_ms, 2),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+def get_relationships():
+    """Stored relationships whose columns still exist, as dicts."""
+    try:
+        rows = database.state_connection().execute(
+            f"SELECT table_name, column_name, ref_table, ref_column, containment, jaccard, method, discovered_at "
+            f"FROM {REL_TABLE} ORDER BY table_name, column_name"
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return []
+    schema = database.get_schema()
+    columns = {(t, c["name"]) for t, cols in schema.items() for c in cols}
+    return [
+        {"table": t, "column": c, "ref_table": rt, "ref_column": rc, "containment": containment,
+         "jaccard": jaccard, "method": method, "discovered_at": at}
+        for t, c, rt, rc, containment, jaccard, method, at in rows
+        if (t, c) in columns and (rt, rc) in columns
+    ]
+
+
+def references():
+    """{(table, column): {"table", "column"}} of the stored relationships."""
+    return {(r["table"], r["column"]): {"table": r["ref_table"], "column": r["ref_column"]}
+            for r in get_relationships()}
+
+
+def describe(relationships):
+    """Short text form, e.g. "orders.customer_id -> customers.customer_id"."""
+    return [f"{r['table']}.{r['column']} -> {r['ref_table']}.{r['ref_column']}" for r in relationships]
+
@@ -0,0 +1,255 @@
+"""Schema-change detection: a per-table snapshot diffed incrementally into a change feed.
+
+check() first compares PRAGMA schema_version with the version seen last
+time, so polling an unchanged catalog costs one pragma read. When the
+version has moved, table definitions are compared by a hash of their
+sqlite_master SQL, and only tables whose SQL changed have PRAGMA table_info
+read, hashed and diffed column by column against the stored snapshot.
+Changes (table/column added, dropped, altered, table renamed) are appended
+to _ds_schema_changes with the time they were detected.
+
+The snapshots and feeds of every source live in the default database,
+keyed by source name; a watched source is only ever read. The first check
+of a source only records its baseline (possibly empty, so a first table
+added later is reported). A daemon thread polls the active source every
+POLL_SECONDS while the schemaChanges notification is enabled.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import database
+import settings_store
+import sources
+
+SNAPSHOT_TABLE = f"{database.INTERNAL_PREFIX}schema_snapshots"
+WATCHED_TABLE = f"{database.INTERNAL_PREFIX}schema_watched"
+CHANGES_TABLE = f"{database.INTERNAL_PREFIX}schema_changes"
+# Per-source snapshot table of earlier versions, replaced by SNAPSHOT_TABLE.
+_OLD_SNAPSHOT_TABLE = f"{database.INTERNAL_PREFIX}schema_snapshot"
+POLL_SECONDS = float(os.environ.get("DATASAGE_SCHEMA_POLL_SECONDS") or 60)
+# Column attributes compared when deciding a column was altered.
+COLUMN_FIELDS = ("type", "notnull", "default", "pk")
+
+_lock = threading.Lock()
+_versions = {}  # pool path -> schema_version the snapshot was last checked at
+_watcher = None
+_stats = {"checks": 0, "unchanged": 0, "diffs": 0, "tables_diffed": 0, "changes": 0, "watch_errors": 0}
+
+
+def _ensure_tables(conn):
+    conn.execute(f"DROP TABLE IF EXISTS {_OLD_SNAPSHOT_TABLE}")
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SNAPSHOT_TABLE} (
+            source TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            sql_hash TEXT NOT NULL,
+            info_hash TEXT NOT NULL,
+            columns TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (source, table_name)
+        )
+    """)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {WATCHED_TABLE} (source TEXT PRIMARY KEY, since REAL NOT NULL)")
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CHANGES_TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            detected_at REAL NOT NULL,
+            schema_version INTEGER NOT NULL,
+            change TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            column_name TEXT,
+            detail TEXT,
+            source TEXT NOT NULL DEFAULT 'default'
+        )
+    """)
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({CHANGES_TABLE})")}
+    if "source" not in columns:
+        conn.execute(f"ALTER TABLE {CHANGES_TABLE} ADD COLUMN source TEXT NOT NULL DEFAULT 'default'")
+
+
+def _hash(value):
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+
+def _table_info(conn, table_name):
+    """PRAGMA table_info as (hash, [column dicts]) in column order."""
+    columns = [
+        {"name": name, "type": col_type, "notnull": bool(notnull), "default": default, "pk": pk}
+        for _, name, col_type, notnull, default, pk in conn.execute(
+            f"PRAGMA table_info({database.quote_identifier(table_name)})"
+        ).fetchall()
+    ]
+    return _hash(json.dumps(columns, sort_keys=True, default=str)), columns
+
+
+def _diff_columns(table_name, before, after):
+    """(change, table, column, detail) tuples turning column list before into after."""
+    old = {c["name"]: c for c in before}
+    new = {c["name"]: c for c in after}
+    changes = []
+    for name, col in new.items():
+        if name not in old:
+            changes.append(("column_added", table_name, name, col))
+            continue
+        altered = {f: [old[name][f], col[f]] for f in COLUMN_FIELDS if old[name][f] != col[f]}
+        if altered:
+            changes.append(("column_altered", table_name, name, altered))
+    changes += [("column_dropped", table_name, name, col) for name, col in old.items() if name not in new]
+    return changes
+
+
+def _diff(conn, watched, source, version):
+    """Compare watched's sqlite_master with source's stored snapshot in conn, update it and return the changes."""
+    current = {
+        name: _hash(sql or "")
+        for name, sql in watched.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND substr(name, 1, ?) != ?",
+            (len(database.INTERNAL_PREFIX), database.INTERNAL_PREFIX),
+        ).fetchall()
+    }
+    stored = {
+        name: (sql_hash, info_hash, json.loads(columns))
+        for name, sql_hash, info_hash, columns in conn.execute(
+            f"SELECT table_name, sql_hash, info_hash, columns FROM {SNAPSHOT_TABLE} WHERE source = ?", (source,)
+        ).fetchall()
+    }
+    baseline = not conn.execute(f"SELECT 1 FROM {WATCHED_TABLE} WHERE source = ?", (source,)).fetchone()
+    now = time.time()
+    if baseline:
+        conn.execute(f"INSERT INTO {WATCHED_TABLE} VALUES (?, ?)", (source, now))
+    changes = []
+    added = {}
+    diffed = 0
+    for name, sql_hash in current.items():
+        previous = stored.get(name)
+        if previous is not None and previous[0] == sql_hash:
+            continue
+        diffed += 1
+        info_hash, columns = _table_info(watched, name)
+        conn.execute(
+            f"INSERT OR REPLACE INTO {SNAPSHOT_TABLE} VALUES (?, ?, ?, ?, ?, ?)",
+            (source, name, sql_hash, info_hash, json.dumps(columns, default=str), now),
+        )
+        if previous is None:
+            added[name] = (info_hash, columns)
+        elif previous[1] != info_hash:
+            changes += _diff_columns(name, previous[2], columns)
+    dropped = [name for name in stored if name not in current]
+    conn.executemany(
+        f"DELETE FROM {SNAPSHOT_TABLE} WHERE source = ? AND table_name = ?", [(source, n) for n in dropped]
+    )
+
+    # A dropped table and an added one with identical columns is reported as a rename.
+    for name in dropped:
+        renamed_to = next((n for n, (h, _) in added.items() if h == stored[name][1]), None)
+        if renamed_to is not None:
+            del added[renamed_to]
+            changes.append(("table_renamed", renamed_to, None, {"from": name}))
+        else:
+            changes.append(("table_dropped", name, None, {"columns": [c["name"] for c in stored[name][2]]}))
+    changes += [
+        ("table_added", name, None, {"columns": [c["name"] for c in columns]})
+        for name, (_, columns) in added.items()
+    ]
+
+    _stats["diffs"] += 1
+    _stats["tables_diffed"] += diffed
+    if baseline:
+        return []
+    conn.executemany(
+        f"INSERT INTO {CHANGES_TABLE} (detected_at, schema_version, change, table_name, column_name, detail, source) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(now, version, change, table, column, json.dumps(detail, default=str), source)
+         for change, table, column, detail in changes],
+    )
+    _stats["changes"] += len(changes)
+    return [
+        {"detected_at": now, "schema_version": version, "change": change, "table": table,
+         "column": column, "detail": detail}
+        for change, table, column, detail in changes
+    ]
+
+
+def _feed_pool():
+    return sources.get(sources.DEFAULT_SOURCE).pool()
+
+
+def check():
+    """Detect schema changes in the current source since the last check; returns the new changes.
+
+    The current source is only read; the snapshot and feed are written in the default database.
+    """
+    source = sources.current()
+    watched = database.get_pool().reader()
+    with _lock:
+        _stats["checks"] += 1
+    key = (source, database.get_pool().path)
+    version = watched.execute("PRAGMA schema_version").fetchone()[0]
+    if _versions.get(key) == version:
+        with _lock:
+            _stats["unchanged"] += 1
+        return []
+    with _lock:
+        with _feed_pool().writer() as conn:
+            version = watched.execute("PRAGMA schema_version").fetchone()[0]
+            if _versions.get(key) == version:
+                return []
+            _ensure_tables(conn)
+            changes = _diff(conn, watched, source, version)
+        # Creating the feed tables moves the default source's version; record the one after our own writes.
+        _versions[key] = watched.execute("PRAGMA schema_version").fetchone()[0]
+    return changes
+
+
+def changes(since=0, limit=100, table_name=None):
+    """Recorded changes of the current source with id > since, oldest first."""
+    sql = (f"SELECT id, detected_at, schema_version, change, table_name, column_name, detail "
+           f"FROM {CHANGES_TABLE} WHERE id > ? AND source = ?")
+    params = [since, sources.current()]
+    if table_name:
+        sql += " AND table_name = ?"
+        params.append(table_name)
+    sql += " ORDER BY id LIMIT ?"
+    params.append(limit)
+    try:
+        rows = _feed_pool().reader().execute(sql, params).fetchall()
+    except sqlite3.OperationalError:
+        return []  # nothing checked yet
+    return [
+        {"id": row_id, "detected_at": detected_at, "schema_version": version, "change": change,
+         "table": table, "column": column, "detail": json.loads(detail) if detail else None}
+        for row_id, detected_at, version, change, table, column, detail in rows
+    ]
+
+
+def enabled():
+    return settings_store.notification_enabled("schemaChanges")
+
+
+def _watch():
+    while True:
+        time.sleep(POLL_SECONDS)
+        if not enabled():
+            continue
+        try:
+            with sources.use(sources.active()):
+                check()
+        except Exception:
+            _stats["watch_errors"] += 1
+
+
+def start_watcher():
+    """Start the background poller once per process."""
+    global _watcher
+    with _lock:
+        if _watcher is None and POLL_SECONDS > 0:
+            _watcher = threading.Thread(target=_watch, name="datasage-schema-watch", daemon=True)
+            _watcher.start()
+
+
+def stats():
+    return {**_stats, "watching": _watcher is not None}
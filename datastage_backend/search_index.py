@@ -0,0 +1,310 @@
+"""Full-text search over catalog metadata and selected table columns, on SQLite FTS5.
+
+Two kinds of index live in the default source (other sources are never
+written to: searching them matches table and column names directly, with
+no row search):
+
+  _ds_search_catalog   table names, column names (with their types) and the
+                       generated documentation in the doc store
+  _ds_fts_<table>      one external-content FTS5 table per indexed data
+                       table, over the columns chosen in INDEXED_COLUMNS or
+                       with set_columns()
+
+Data tables and the doc store are kept in sync by AFTER INSERT/UPDATE/DELETE
+triggers, so writes update the index row by row. Schema changes have no
+triggers in SQLite; table and column names are re-indexed whenever PRAGMA
+schema_version moves, which is also when missing indexes and triggers are
+(re)installed.
+
+Queries are tokenized into prefix terms ("cust ema" matches "customers" and
+"email") and ranked with bm25 across all indexes.
+"""
+import json
+import re
+import sqlite3
+import threading
+
+import database
+import sources
+from database import quote_identifier
+
+CATALOG_TABLE = f"{database.INTERNAL_PREFIX}search_catalog"
+CONFIG_TABLE = f"{database.INTERNAL_PREFIX}search_config"
+DOC_STORE_TABLE = f"{database.INTERNAL_PREFIX}doc_store"
+ROW_INDEX_PREFIX = f"{database.INTERNAL_PREFIX}fts_"
+# Text columns indexed by default, per table; the table must exist to be indexed.
+INDEXED_COLUMNS = {"customers": ("first_name", "last_name", "email", "city")}
+TOKENIZER = "unicode61 remove_diacritics 2"
+MAX_LIMIT = 100
+SNIPPET_TOKENS = 10
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_lock = threading.Lock()
+_ready = {}  # pool path -> schema_version the indexes were last checked at
+
+
+class SearchUnavailable(RuntimeError):
+    """This SQLite build has no FTS5."""
+
+
+def match_query(text):
+    """Turn free text into an FTS5 query of quoted prefix terms, all of which must match."""
+    return " ".join(f'"{token}"*' for token in _TOKEN_RE.findall(text or ""))
+
+
+def _literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _row_index(table_name):
+    return f"{ROW_INDEX_PREFIX}{table_name}"
+
+
+def _trigger(table_name, op):
+    return quote_identifier(f"{ROW_INDEX_PREFIX}{table_name}_{op}")
+
+
+def _existing(conn, kind):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = ?", (kind,))}
+
+
+def _config(conn):
+    """{table: [columns]}: INDEXED_COLUMNS overlaid with the stored overrides (empty list = not indexed)."""
+    config = {table: list(columns) for table, columns in INDEXED_COLUMNS.items()}
+    try:
+        rows = conn.execute(f"SELECT table_name, columns FROM {CONFIG_TABLE}").fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    config.update({table: json.loads(columns) for table, columns in rows})
+    return config
+
+
+def _index_columns(conn, name):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(name)})")]
+
+
+def _install_row_index(conn, table_name, columns):
+    """Create (or recreate) the FTS table and triggers for table_name and fill it from the table."""
+    index = quote_identifier(_row_index(table_name))
+    qt = quote_identifier(table_name)
+    cols = ", ".join(quote_identifier(c) for c in columns)
+    old_cols = ", ".join(f"old.{quote_identifier(c)}" for c in columns)
+    new_cols = ", ".join(f"new.{quote_identifier(c)}" for c in columns)
+    _drop_row_index(conn, table_name)
+    conn.execute(
+        f"CREATE VIRTUAL TABLE {index} USING fts5({cols}, content={_literal(table_name)}, "
+        f"content_rowid='rowid', tokenize={_literal(TOKENIZER)}, prefix='2 3')"
+    )
+    delete = f"INSERT INTO {index} ({index}, rowid, {cols}) VALUES ('delete', old.rowid, {old_cols});"
+    insert = f"INSERT INTO {index} (rowid, {cols}) VALUES (new.rowid, {new_cols});"
+    database.ensure_trigger_guard(conn)
+    guard = f"WHEN {database.trigger_guard(table_name)}"
+    conn.execute(f"CREATE TRIGGER {_trigger(table_name, 'ins')} AFTER INSERT ON {qt} {guard} BEGIN {insert} END")
+    conn.execute(f"CREATE TRIGGER {_trigger(table_name, 'del')} AFTER DELETE ON {qt} {guard} BEGIN {delete} END")
+    conn.execute(
+        f"CREATE TRIGGER {_trigger(table_name, 'upd')} AFTER UPDATE ON {qt} {guard} BEGIN {delete} {insert} END"
+    )
+    conn.execute(f"INSERT INTO {index} ({index}) VALUES ('rebuild')")
+
+
+@database.on_bulk_write
+def rebuild_row_index(conn, table_name):
+    """Refill table_name's row index from the table, if it has one (after writes that bypassed its triggers)."""
+    index = _row_index(table_name)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (index,)).fetchone():
+        conn.execute(f"INSERT INTO {quote_identifier(index)} ({quote_identifier(index)}) VALUES ('rebuild')")
+
+
+def _drop_row_index(conn, table_name):
+    for op in ("ins", "del", "upd"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {_trigger(table_name, op)}")
+    conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(_row_index(table_name))}")
+
+
+def _install_doc_triggers(conn):
+    """Mirror the doc store into the catalog index; REPLACEs in the store arrive as plain inserts."""
+    catalog = CATALOG_TABLE
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {catalog}_doc_ins AFTER INSERT ON {DOC_STORE_TABLE} BEGIN
+            DELETE FROM {catalog} WHERE kind = 'doc' AND ref = new.doc_key;
+            INSERT INTO {catalog} (kind, ref, table_name, column_name, body)
+            VALUES ('doc', new.doc_key, new.table_name, COALESCE(new.column_name, ''), new.doc);
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {catalog}_doc_del AFTER DELETE ON {DOC_STORE_TABLE} BEGIN
+            DELETE FROM {catalog} WHERE kind = 'doc' AND ref = old.doc_key;
+        END
+    """)
+    conn.execute(f"DELETE FROM {catalog} WHERE kind = 'doc'")
+    conn.execute(
+        f"INSERT INTO {catalog} (kind, ref, table_name, column_name, body) "
+        f"SELECT 'doc', doc_key, table_name, COALESCE(column_name, ''), doc FROM {DOC_STORE_TABLE}"
+    )
+
+
+def _index_names(conn, schema):
+    conn.execute(f"DELETE FROM {CATALOG_TABLE} WHERE kind IN ('table', 'column')")
+    rows = []
+    for table_name, columns in schema.items():
+        rows.append(("table", table_name, table_name, "", ""))
+        rows += [("column", f"{table_name}.{c['name']}", table_name, c["name"], c["type"] or "") for c in columns]
+    conn.executemany(
+        f"INSERT INTO {CATALOG_TABLE} (kind, ref, table_name, column_name, body) VALUES (?, ?, ?, ?, ?)", rows
+    )
+
+
+def _indexed_source():
+    return sources.current() == sources.DEFAULT_SOURCE
+
+
+def ensure_indexes():
+    """Bring the indexes in line with the schema; one pragma read when the schema has not changed.
+
+    A no-op unless the current source is the default one.
+    """
+    if not _indexed_source():
+        return
+    pool = database.get_pool()
+    version = pool.reader().execute("PRAGMA schema_version").fetchone()[0]
+    if _ready.get(pool.path) == version:
+        return
+    schema = database.get_schema()
+    with _lock, pool.writer() as conn:
+        if _ready.get(pool.path) == conn.execute("PRAGMA schema_version").fetchone()[0]:
+            return
+        tables = _existing(conn, "table")
+        triggers = _existing(conn, "trigger")
+        row_triggers = database.guarded_triggers(conn, [
+            f"{ROW_INDEX_PREFIX}{table_name}_{op}" for table_name in _config(conn) for op in ("ins", "del", "upd")
+        ])
+        try:
+            if CATALOG_TABLE not in tables:
+                conn.execute(
+                    f"CREATE VIRTUAL TABLE {CATALOG_TABLE} USING fts5(kind UNINDEXED, ref UNINDEXED, "
+                    f"table_name, column_name, body, tokenize={_literal(TOKENIZER)}, prefix='2 3')"
+                )
+        except sqlite3.OperationalError as e:
+            if "no such module" in str(e):
+                raise SearchUnavailable("This SQLite build does not include FTS5") from e
+            raise
+        _index_names(conn, schema)
+        if DOC_STORE_TABLE in tables and f"{CATALOG_TABLE}_doc_ins" not in triggers:
+            _install_doc_triggers(conn)
+        for table_name, columns in _config(conn).items():
+            names = {c["name"] for c in schema.get(table_name, [])}
+            index = _row_index(table_name)
+            if not columns or not set(columns) <= names:
+                if index in tables:
+                    _drop_row_index(conn, table_name)
+                continue
+            installed = index in tables and all(
+                f"{ROW_INDEX_PREFIX}{table_name}_{op}" in row_triggers for op in ("ins", "del", "upd")
+            )
+            if not installed or _index_columns(conn, index) != list(columns):
+                _install_row_index(conn, table_name, columns)
+        _ready[pool.path] = conn.execute("PRAGMA schema_version").fetchone()[0]
+
+
+def set_columns(table_name, columns):
+    """Index table_name on columns (replacing the default choice); an empty list removes its index."""
+    if not _indexed_source():
+        raise ValueError("Row search can only be set up in the default source")
+    known = {c["name"] for c in database.get_table_info(table_name)}
+    missing = [c for c in columns if c not in known]
+    if missing:
+        raise ValueError(f"Unknown column(s) in {table_name}: {', '.join(missing)}")
+    with database.write_connection() as conn:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {CONFIG_TABLE} (table_name TEXT PRIMARY KEY, columns TEXT NOT NULL)")
+        conn.execute(f"INSERT OR REPLACE INTO {CONFIG_TABLE} VALUES (?, ?)", (table_name, json.dumps(list(columns))))
+    ensure_indexes()
+
+
+def indexed_tables():
+    """{table: [columns]} currently indexed for row search."""
+    if not _indexed_source():
+        return {}
+    ensure_indexes()
+    conn = database.read_connection()
+    tables = _existing(conn, "table")
+    return {t: cols for t, cols in _config(conn).items() if _row_index(t) in tables}
+
+
+def _search_catalog(conn, query, table_name, limit):
+    sql = (f"SELECT kind, table_name, column_name, bm25({CATALOG_TABLE}) AS rank, "
+           f"snippet({CATALOG_TABLE}, 4, '[', ']', '…', {SNIPPET_TOKENS}) "
+           f"FROM {CATALOG_TABLE} WHERE {CATALOG_TABLE} MATCH ?")
+    params = [query]
+    if table_name:
+        sql += " AND table_name = ?"
+        params.append(table_name)
+    sql += " ORDER BY rank LIMIT ?"
+    params.append(limit)
+    return [
+        {"kind": kind, "table": table, "column": column or None, "rank": rank,
+         "snippet": snippet if kind == "doc" else None}
+        for kind, table, column, rank, snippet in conn.execute(sql, params).fetchall()
+    ]
+
+
+def _search_names(text, table_name, limit):
+    """Catalog matches without an index: every term must prefix a word of the table name, or of a
+    column's name or type. Names the terms cover more of rank higher."""
+    terms = [t.lower() for t in _TOKEN_RE.findall(text)]
+    results = []
+    for table, columns in database.get_schema().items():
+        if table_name and table != table_name:
+            continue
+        entries = [("table", None, table)]
+        entries += [("column", c["name"], f"{table} {c['name']} {c['type'] or ''}") for c in columns]
+        for kind, column, body in entries:
+            words = _TOKEN_RE.findall(body.lower())
+            if all(any(w.startswith(t) for w in words) for t in terms):
+                rank = -min(1.0, len(terms) / len(words))
+                results.append({"kind": kind, "table": table, "column": column, "rank": rank, "snippet": None})
+    results.sort(key=lambda r: r["rank"])
+    return results[:limit]
+
+
+def _search_rows(conn, query, table_name, columns, limit):
+    index = quote_identifier(_row_index(table_name))
+    cols = ", ".join(quote_identifier(c) for c in columns)
+    rows = conn.execute(
+        f"SELECT rowid, bm25({index}) AS rank, snippet({index}, -1, '[', ']', '…', {SNIPPET_TOKENS}), {cols} "
+        f"FROM {index} WHERE {index} MATCH ? ORDER BY rank LIMIT ?",
+        (query, limit),
+    ).fetchall()
+    return [
+        {"kind": "row", "table": table_name, "rowid": row[0], "rank": row[1], "snippet": row[2],
+         "row": dict(zip(columns, row[3:]))}
+        for row in rows
+    ]
+
+
+def search(text, kind=None, table_name=None, limit=20, offset=0):
+    """Ranked matches for text across the catalog ("catalog") and/or indexed rows ("rows").
+
+    Returns (results, has_more); results carry a score where higher is better.
+    """
+    query = match_query(text)
+    if not query:
+        return [], False
+    ensure_indexes()
+    limit = max(1, min(limit, MAX_LIMIT))
+    wanted = offset + limit + 1
+    conn = database.read_connection()
+    results = []
+    if not _indexed_source():
+        if kind in (None, "catalog"):
+            results += _search_names(text, table_name, wanted)
+    elif kind in (None, "catalog"):
+        results += _search_catalog(conn, query, table_name, wanted)
+    if kind in (None, "rows"):
+        for indexed, columns in indexed_tables().items():
+            if table_name is None or table_name == indexed:
+                results += _search_rows(conn, query, indexed, columns, wanted)
+    results.sort(key=lambda r: r["rank"])
+    page = results[offset:offset + limit]
+    for result in page:
+        result["score"] = round(-result.pop("rank"), 4)
+    return page, len(results) > offset + limit
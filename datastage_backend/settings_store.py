@@ -41,6 +41,11 @@ def get_settings():
     return _load()
 
 
+def notification_enabled(name):
+    """Whether the given notification (e.g. "schemaChanges") is switched on."""
+    return bool(_load().get("notifications", {}).get(name, DEFAULTS["notifications"][name]))
+
+
 def update_profile(first_name=None, last_name=None, email=None):
     data = _load()
     if first_name is not None:
@@ -0,0 +1,303 @@
+"""Mergeable streaming sketches used by the approximate profiler.
+
+Each sketch has update(), merge(other) and a small, bounded memory footprint,
+so partial results from chunks (or workers) can be combined.
+"""
+import hashlib
+import heapq
+import math
+import random
+
+_MASK64 = (1 << 64) - 1
+
+
+def hash64(value):
+    """Stable 64-bit hash; 1 and 1.0 hash alike, matching SQLite's equality."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, bytes):
+        data = b"b" + value
+    else:
+        data = type(value).__name__[:1].encode() + str(value).encode("utf-8", "surrogatepass")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """Distinct-count estimator with 2**p registers (relative error ~1.04/sqrt(2**p))."""
+
+    def __init__(self, p=12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def update(self, value):
+        self.add_hash(hash64(value))
+
+    def add_values(self, values):
+        """Add many values using Python's built-in hash, several times faster than update().
+
+        hash() is salted per process, so only merge the result with sketches
+        built in the same process.
+        """
+        shift = 64 - self.p
+        mask = (1 << shift) - 1
+        registers = self.registers
+        for h in map(hash, values):
+            # splitmix64 finalizer: hash() of a small int is the int itself.
+            h &= _MASK64
+            h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+            h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & _MASK64
+            h ^= h >> 31
+            rank = shift - (h & mask).bit_length() + 1
+            if rank > registers[h >> shift]:
+                registers[h >> shift] = rank
+
+    def add_hash(self, h):
+        idx = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def estimate(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # Small-range correction: linear counting is far more accurate here.
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+    def relative_error(self):
+        return round(1.04 / math.sqrt(self.m), 4)
+
+
+class KLL:
+    """KLL quantile sketch; normalized rank error is roughly 3.3 / k."""
+
+    def __init__(self, k=200, c=2.0 / 3.0):
+        self.k = k
+        self.c = c
+        self.levels = [[]]
+        self.size = 0
+        self.n = 0
+        self.max_size = self._capacity(0)
+
+    def _capacity(self, height):
+        depth = len(self.levels) - height - 1
+        return int(math.ceil(self.c ** depth * self.k)) + 1
+
+    def _grow(self):
+        self.levels.append([])
+        self.max_size = sum(self._capacity(h) for h in range(len(self.levels)))
+
+    def _compress(self):
+        for h in range(len(self.levels)):
+            if len(self.levels[h]) >= self._capacity(h):
+                if h + 1 >= len(self.levels):
+                    self._grow()
+                items = sorted(self.levels[h])
+                keep = [items.pop()] if len(items) % 2 else []
+                self.levels[h + 1].extend(items[random.getrandbits(1)::2])
+                self.levels[h] = keep
+                self.size = sum(len(level) for level in self.levels)
+                if self.size < self.max_size:
+                    break
+
+    def update(self, value):
+        self.levels[0].append(value)
+        self.size += 1
+        self.n += 1
+        if self.size >= self.max_size:
+            self._compress()
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self._grow()
+        for h, level in enumerate(other.levels):
+            self.levels[h].extend(level)
+        self.n += other.n
+        self.size = sum(len(level) for level in self.levels)
+        while self.size >= self.max_size:
+            self._compress()
+        return self
+
+    def quantiles(self, fractions):
+        weighted = sorted(
+            (item, 1 << h) for h, level in enumerate(self.levels) for item in level
+        )
+        if not weighted:
+            return [None for _ in fractions]
+        total = sum(w for _, w in weighted)
+        result = []
+        for q in fractions:
+            target = q * total
+            cumulative = 0
+            for item, w in weighted:
+                cumulative += w
+                if cumulative >= target:
+                    result.append(item)
+                    break
+            else:
+                result.append(weighted[-1][0])
+        return result
+
+    def rank_error(self):
+        return round(min(1.0, 3.3 / self.k), 4)
+
+
+class MisraGries:
+    """Heavy-hitter counts; each estimate undercounts by at most n / (k + 1)."""
+
+    def __init__(self, k=64):
+        self.k = k
+        self.counters = {}
+        self.n = 0
+
+    def update(self, value):
+        self.n += 1
+        counters = self.counters
+        if value in counters:
+            counters[value] += 1
+        elif len(counters) < self.k:
+            counters[value] = 1
+        else:
+            for key in list(counters):
+                counters[key] -= 1
+                if not counters[key]:
+                    del counters[key]
+
+    def update_counts(self, counts):
+        """Add a batch of exact {value: count} (e.g. a chunk's Counter); same bound as merge()."""
+        return self._combine(counts, sum(counts.values()))
+
+    def merge(self, other):
+        return self._combine(other.counters, other.n)
+
+    def _combine(self, counters, n):
+        merged = dict(self.counters)
+        for key, count in counters.items():
+            merged[key] = merged.get(key, 0) + count
+        if len(merged) > self.k:
+            cut = heapq.nlargest(self.k + 1, merged.values())[-1]
+            merged = {key: c - cut for key, c in merged.items() if c > cut}
+        self.counters = merged
+        self.n += n
+        return self
+
+    def top(self, limit):
+        return sorted(self.counters.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+
+    def error_bound(self):
+        return self.n // (self.k + 1)
+
+
+class Reservoir:
+    """Uniform random sample of at most `size` items (Algorithm R)."""
+
+    def __init__(self, size=5):
+        self.size = size
+        self.items = []
+        self.n = 0
+
+    def update(self, item):
+        self.n += 1
+        if len(self.items) < self.size:
+            self.items.append(item)
+        else:
+            j = random.randrange(self.n)
+            if j < self.size:
+                self.items[j] = item
+
+    def merge(self, other):
+        total = self.n + other.n
+        if total == 0:
+            return self
+        pool_a, pool_b = list(self.items), list(other.items)
+        merged = []
+        while len(merged) < self.size and (pool_a or pool_b):
+            take_a = pool_a and (not pool_b or random.random() < self.n / total)
+            source = pool_a if take_a else pool_b
+            merged.append(source.pop(random.randrange(len(source))))
+        self.items = merged
+        self.n = total
+        return self
+
+
+class Moments:
+    """Exact running count/min/max/mean/variance (Welford, mergeable via Chan et al.)."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def update(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+
+    def update_counts(self, counts):
+        """Add {value: occurrences} in one step, skipping values that are not numbers.
+
+        The batch's variance is taken around its own mean and merged as in
+        merge(), so large values with a small spread keep their precision.
+        """
+        items = [(x, c) for x, c in counts.items() if isinstance(x, (int, float))]
+        if not items:
+            return self
+        batch = Moments()
+        batch.n = sum(c for _, c in items)
+        batch.mean = math.fsum(x * c for x, c in items) / batch.n
+        batch.m2 = math.fsum(c * (x - batch.mean) ** 2 for x, c in items)
+        batch.min = min(x for x, _ in items)
+        batch.max = max(x for x, _ in items)
+        return self.merge(batch)
+
+    def update_values(self, values):
+        """Add a batch of numbers in one step (see update_counts)."""
+        if not len(values):
+            return self
+        batch = Moments()
+        batch.n = len(values)
+        batch.mean = math.fsum(values) / batch.n
+        batch.m2 = math.fsum((x - batch.mean) ** 2 for x in values)
+        batch.min = min(values)
+        batch.max = max(values)
+        return self.merge(batch)
+
+    def merge(self, other):
+        if not other.n:
+            return self
+        if not self.n:
+            self.n, self.mean, self.m2, self.min, self.max = (
+                other.n, other.mean, other.m2, other.min, other.max
+            )
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def stddev(self):
+        if self.n < 2:
+            return None
+        return math.sqrt(self.m2 / (self.n - 1))
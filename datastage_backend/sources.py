@@ -0,0 +1,246 @@
+"""Registry of data sources; database.py resolves its pools through the current source.
+
+A source is a name plus a config dict ({"type": "sqlite", "database": path}).
+Registering a source only records its config; the source object and its
+connection pools are created the first time something uses it, so a long
+catalog of databases costs nothing until queried. The "default" source is
+always the built-in database at database.DB_PATH.
+
+The current source is a context variable: requests select one with
+use(name), and every database.* helper (and everything built on them, such
+as the profiler and the caches) then works against that source.
+"""
+import contextlib
+import contextvars
+import hashlib
+import os
+import threading
+
+import connection_store
+import database
+
+DEFAULT_SOURCE = "default"
+# DataSage's own tables for other sources (profile cache, docs, quality scores,
+# relationships) live in one state file per source here, so the source itself is only read.
+STATE_DIR = os.environ.get("DATASAGE_STATE_DIR")
+
+_current = contextvars.ContextVar("datasage_source", default=DEFAULT_SOURCE)
+_configs = None
+_active = None
+_sources = {}
+_lock = threading.Lock()
+
+
+class UnknownSource(KeyError):
+    """No source is registered under this name."""
+
+
+class SQLiteSource:
+    """One SQLite file with its own read/write pool and read-only pool, opened on first use."""
+
+    type = "sqlite"
+
+    def __init__(self, name, config):
+        self.name = name
+        self.config = config
+        self._pool = None
+        self._readonly_pool = None
+        self._state_pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return self.config["database"]
+
+    def pool(self):
+        with self._lock:
+            path = self.path
+            if self._pool is None or self._pool.path != path:
+                if self._pool is not None:
+                    self._pool.close()
+                self._pool = database.ConnectionPool(path)
+            return self._pool
+
+    def readonly_pool(self):
+        with self._lock:
+            path = self.path
+            if self._readonly_pool is None or self._readonly_pool.path != path:
+                if self._readonly_pool is not None:
+                    self._readonly_pool.close()
+                self._readonly_pool = database.ConnectionPool(path, readonly=True)
+            return self._readonly_pool
+
+    def state_pool(self):
+        """Read/write pool of the file holding DataSage's own tables for this source (see state_path)."""
+        with self._lock:
+            path = state_path(self.path)
+            if self._state_pool is None or self._state_pool.path != path:
+                if self._state_pool is not None:
+                    self._state_pool.close()
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self._state_pool = database.ConnectionPool(path)
+            return self._state_pool
+
+    def close(self):
+        with self._lock:
+            for pool in (self._pool, self._readonly_pool, self._state_pool):
+                if pool is not None:
+                    pool.close()
+            self._pool = self._readonly_pool = self._state_pool = None
+
+    def describe(self):
+        return {
+            "name": self.name,
+            "type": self.type,
+            "database": self.path,
+            "open": self._pool is not None or self._readonly_pool is not None,
+        }
+
+
+class _DefaultSource(SQLiteSource):
+    """The built-in database; follows database.DB_PATH."""
+
+    @property
+    def path(self):
+        return database.DB_PATH
+
+    def state_pool(self):
+        """The built-in database keeps DataSage's tables itself."""
+        return self.pool()
+
+
+SOURCE_TYPES = {"sqlite": SQLiteSource}
+
+
+def register_type(type_name, source_class):
+    """Make a new source type available to register(); source_class(name, config) must provide
+    pool(), readonly_pool(), state_pool(), close() and describe()."""
+    SOURCE_TYPES[type_name] = source_class
+
+
+def state_path(path):
+    """Sidecar SQLite file for the DataSage tables of the source database at path."""
+    base = STATE_DIR or os.path.join(os.path.dirname(os.path.abspath(database.DB_PATH)), ".datasage_state")
+    return os.path.join(base, hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:12] + ".db")
+
+
+def _load_configs():
+    global _configs
+    if _configs is None:
+        _configs = dict(connection_store.get_sources())
+    return _configs
+
+
+def register(name, config):
+    """Record (or replace) a source config; nothing is opened until the source is used."""
+    if name == DEFAULT_SOURCE:
+        raise ValueError(f"'{DEFAULT_SOURCE}' is reserved for the built-in database")
+    config = dict(config)
+    config.setdefault("type", "sqlite")
+    if config["type"] not in SOURCE_TYPES:
+        raise ValueError(f"Unsupported source type: {config['type']}")
+    if config["type"] == "sqlite":
+        if not config.get("database"):
+            raise ValueError("SQLite sources need a 'database' path")
+        config["database"] = os.path.abspath(config["database"])
+    with _lock:
+        configs = _load_configs()
+        if configs.get(name) == config:
+            return
+        old = _sources.pop(name, None)
+        configs[name] = config
+        connection_store.save_sources(configs)
+    if old is not None:
+        old.close()
+
+
+def unregister(name):
+    """Forget a source and close its pools."""
+    if name == DEFAULT_SOURCE:
+        raise ValueError(f"'{DEFAULT_SOURCE}' cannot be removed")
+    with _lock:
+        configs = _load_configs()
+        if name not in configs:
+            raise UnknownSource(name)
+        del configs[name]
+        connection_store.save_sources(configs)
+        old = _sources.pop(name, None)
+    if old is not None:
+        old.close()
+
+
+def exists(name):
+    with _lock:
+        return name == DEFAULT_SOURCE or name in _load_configs()
+
+
+def get(name=None):
+    """Return the source object for name (default: the current source), creating it on first use."""
+    name = name or _current.get()
+    with _lock:
+        source = _sources.get(name)
+        if source is not None:
+            return source
+        if name == DEFAULT_SOURCE:
+            source = _DefaultSource(name, {"type": "sqlite"})
+        else:
+            config = _load_configs().get(name)
+            if config is None:
+                raise UnknownSource(name)
+            source = SOURCE_TYPES[config["type"]](name, config)
+        _sources[name] = source
+        return source
+
+
+def active():
+    """Source chosen through /connect, used when a request does not name one."""
+    global _active
+    if _active is None:
+        config = connection_store.get_connection() or {}
+        _active = config.get("source") or DEFAULT_SOURCE
+    return _active if exists(_active) else DEFAULT_SOURCE
+
+
+def set_active(name):
+    global _active
+    if not exists(name):
+        raise UnknownSource(name)
+    _active = name
+
+
+def current():
+    """Name of the source the calling context is working against."""
+    return _current.get()
+
+
+def activate(name):
+    """Make name the current source for the rest of this context (e.g. one request)."""
+    if not exists(name):
+        raise UnknownSource(name)
+    _current.set(name)
+
+
+@contextlib.contextmanager
+def use(name):
+    """Run the block against source name."""
+    if not exists(name):
+        raise UnknownSource(name)
+    token = _current.set(name)
+    try:
+        yield get(name)
+    finally:
+        _current.reset(token)
+
+
+def describe():
+    """Every registered source, without opening any of them."""
+    with _lock:
+        configs = dict(_load_configs())
+        opened = dict(_sources)
+    listing = [get(DEFAULT_SOURCE).describe()]
+    for name, config in configs.items():
+        if name in opened:
+            listing.append(opened[name].describe())
+        else:
+            listing.append({"name": name, "type": config["type"], "database": config.get("database"), "open": False})
+    return listing
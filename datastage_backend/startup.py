@@ -0,0 +1,175 @@
+"""Startup pipeline: schema init guarded by an on-disk manifest, training data loaded in the background.
+
+Run `python startup.py` once before starting workers with DATASAGE_SKIP_INIT=1;
+those workers then only report readiness from the manifest.
+"""
+import json
+import os
+import threading
+import time
+
+import database
+import facts_store
+import search_index  # registers the bulk-write hook the CSV load relies on
+import sources
+
+MANIFEST_PATH = os.path.join(os.path.dirname(__file__), "startup_manifest.json")
+# Bump whenever database.init_schema creates or seeds something new.
+SCHEMA_REVISION = 1
+REQUIRED_TABLES = ("employees", "departments", "customers")
+
+_PROCESS_STARTED = time.perf_counter()
+_lock = threading.Lock()
+_started = False
+_state = {
+    "phase": "idle",
+    "ready": False,
+    "skip_init": False,
+    "error": None,
+    "timings_ms": {},
+}
+
+
+def skip_init_requested():
+    return os.environ.get("DATASAGE_SKIP_INIT", "").lower() in ("1", "true", "yes")
+
+
+def _load_manifest():
+    if os.path.isfile(MANIFEST_PATH):
+        try:
+            with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError):
+            pass
+    return {}
+
+
+def _save_manifest(data):
+    try:
+        with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+    except OSError:
+        pass
+
+
+def _manifest_entry():
+    """Return the built-in database's manifest entry if it is current and the tables still exist.
+
+    Readiness is about the default source only, whatever source the caller is using.
+    """
+    entry = _load_manifest().get(os.path.abspath(database.DB_PATH))
+    if not entry or entry.get("schema_revision") != SCHEMA_REVISION:
+        return None
+    if not os.path.isfile(database.DB_PATH):
+        return None
+    with sources.use(sources.DEFAULT_SOURCE):
+        schema = database.get_schema()
+    if any(t not in schema for t in REQUIRED_TABLES):
+        return None
+    return entry
+
+
+def _update_manifest(**fields):
+    manifest = _load_manifest()
+    entry = manifest.setdefault(os.path.abspath(database.DB_PATH), {})
+    entry.update(fields)
+    _save_manifest(manifest)
+
+
+def _timed(name, fn):
+    started = time.perf_counter()
+    result = fn()
+    _state["timings_ms"][name] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+
+def _init_schema():
+    # Startup always prepares the built-in database, whatever source the caller is using.
+    with sources.use(sources.DEFAULT_SOURCE):
+        _init_default_schema()
+
+
+def _init_default_schema():
+    if _manifest_entry() is None:
+        _timed("schema", database.init_schema)
+        _update_manifest(schema_revision=SCHEMA_REVISION, initialized_at=time.time())
+    else:
+        _state["timings_ms"]["schema"] = 0.0
+    # Before the CSV load, which refreshes the summary tables once it has written the rows.
+    _timed("facts_store", facts_store.ensure_installed)
+    _timed("change_tracking", database.track_all_tables)
+
+
+def _load_training_data():
+    try:
+        _state["phase"] = "loading_training_data"
+        with sources.use(sources.DEFAULT_SOURCE):
+            summary = _timed("training_data", database.load_customers_from_csv)
+        _update_manifest(training_data=summary, training_data_loaded_at=time.time())
+        _mark_ready()
+    except Exception as e:
+        _state["phase"] = "error"
+        _state["error"] = str(e)
+
+
+def _mark_ready():
+    _state["phase"] = "ready"
+    _state["ready"] = True
+    _state["timings_ms"]["cold_start"] = round((time.perf_counter() - _PROCESS_STARTED) * 1000, 2)
+
+
+def start(skip_init=None, background=True):
+    """Run the startup pipeline once per process; later calls are no-ops.
+
+    The schema phase is synchronous (and skipped when the manifest says it
+    already ran), the training data phase runs on a daemon thread unless
+    background is False. With skip_init the process never initializes and
+    becomes ready once another process has recorded it in the manifest.
+    """
+    global _started
+    # Held through the schema phase so concurrent first requests wait for the tables.
+    with _lock:
+        if _started:
+            return status()
+        _started = True
+        if skip_init is None:
+            skip_init = skip_init_requested()
+        _state["skip_init"] = skip_init
+        if skip_init:
+            _state["phase"] = "waiting_for_init"
+            return status()
+        try:
+            _state["phase"] = "schema"
+            _init_schema()
+        except Exception as e:
+            _state["phase"] = "error"
+            _state["error"] = str(e)
+            return status()
+    if background:
+        threading.Thread(target=_load_training_data, name="datasage-startup", daemon=True).start()
+    else:
+        _load_training_data()
+    return status()
+
+
+def status():
+    """Return readiness and startup timings; skip-init processes re-check the manifest here."""
+    if _state["skip_init"] and not _state["ready"]:
+        try:
+            entry = _manifest_entry()
+        except Exception:
+            entry = None
+        if entry is not None and entry.get("training_data_loaded_at"):
+            _mark_ready()
+    return {
+        "ready": _state["ready"],
+        "phase": _state["phase"],
+        "skip_init": _state["skip_init"],
+        "error": _state["error"],
+        "timings_ms": dict(_state["timings_ms"]),
+    }
+
+
+if __name__ == "__main__":
+    result = start(skip_init=False, background=False)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,67 @@
+"""Row encoders for streamed responses: each turns an iterable of row chunks into text lines."""
+import base64
+import csv
+import io
+import json
+
+
+def json_value(value):
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    return value
+
+
+def ndjson_lines(columns, chunks):
+    """One JSON object per row."""
+    for rows in chunks:
+        yield "".join(
+            json.dumps({c: json_value(v) for c, v in zip(columns, row)}) + "\n" for row in rows
+        )
+
+
+def csv_lines(columns, chunks, header=True):
+    """CSV with a header row; each chunk is written as one block."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if header:
+        writer.writerow(columns)
+        yield buf.getvalue()
+    for rows in chunks:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows([json_value(v) for v in row] for row in rows)
+        yield buf.getvalue()
+
+
+def columnar_lines(columns, chunks):
+    """Compact column-major JSON lines: a {"columns": [...]} header, then one
+    {"rows": n, "data": [[column values], ...]} line per chunk."""
+    yield json.dumps({"columns": columns}) + "\n"
+    for rows in chunks:
+        data = [[json_value(v) for v in values] for values in zip(*rows)]
+        yield json.dumps({"rows": len(rows), "data": data}, separators=(",", ":")) + "\n"
+
+
+def encode_cursor(data):
+    """Opaque, URL-safe pagination cursor."""
+    return base64.urlsafe_b64encode(json.dumps(data).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+MIMETYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "columnar": "application/x-ndjson",
+}
+ENCODERS = {
+    "ndjson": ndjson_lines,
+    "csv": csv_lines,
+    "columnar": columnar_lines,
+}
@@ -0,0 +1,113 @@
+"""Keyset-paginated table browsing and constant-memory export.
+
+Pages are read with `WHERE key > last ORDER BY key LIMIT n`, where the key is
+the rowid (or the primary key of a WITHOUT ROWID table), so page 1000 costs
+the same index seek as page 1. The last key travels in an opaque cursor.
+
+Exports run one query and hand its rows to the streaming encoders in chunks
+of EXPORT_CHUNK_SIZE straight from the cursor, so memory stays flat however
+large the table is.
+"""
+import sqlite3
+
+import database
+from database import quote_identifier
+from streaming import decode_cursor, encode_cursor, json_value
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+EXPORT_CHUNK_SIZE = 2000
+
+
+class BrowseError(Exception):
+    """Bad columns or cursor; the message is safe to return to the client."""
+
+
+class TableNotFound(BrowseError):
+    pass
+
+
+def _key_columns(conn, table_name):
+    """("rowid",) for ordinary tables, else the primary-key columns in key order."""
+    qt = quote_identifier(table_name)
+    try:
+        conn.execute(f"SELECT rowid FROM {qt} LIMIT 0")
+        return ("rowid",)
+    except sqlite3.OperationalError:
+        pass
+    pk = sorted((p, name) for _, name, _, _, _, p in conn.execute(f"PRAGMA table_info({qt})") if p)
+    return tuple(name for _, name in pk)
+
+
+def _columns(table_name, columns):
+    known = [c["name"] for c in database.get_table_info(table_name)]
+    if not known:
+        raise TableNotFound(f"Table not found: {table_name}")
+    if not columns:
+        return known
+    missing = [c for c in columns if c not in known]
+    if missing:
+        raise BrowseError(f"Unknown column(s): {', '.join(missing)}")
+    return list(columns)
+
+
+def browse(table_name, cursor=None, page_size=None, columns=None):
+    """One page of rows in key order; returns {"columns", "rows", "next_cursor"}."""
+    columns = _columns(table_name, columns)
+    page_size = max(1, min(int(page_size or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    conn = database.read_connection()
+    keys = _key_columns(conn, table_name)
+    key_sql = ", ".join(k if k == "rowid" else quote_identifier(k) for k in keys)
+    select = ", ".join(quote_identifier(c) for c in columns)
+    sql = f"SELECT {key_sql}, {select} FROM {quote_identifier(table_name)}"
+    params = []
+    if cursor:
+        try:
+            state = decode_cursor(cursor)
+            after = state["after"]
+            if state.get("table") != table_name or len(after) != len(keys):
+                raise ValueError
+        except (ValueError, KeyError, TypeError):
+            raise BrowseError("Invalid cursor")
+        sql += f" WHERE ({key_sql}) > ({', '.join('?' * len(keys))})"
+        params += after
+    sql += f" ORDER BY {key_sql} LIMIT ?"
+    params.append(page_size + 1)
+    rows = conn.execute(sql, params).fetchall()
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor({"table": table_name, "after": list(rows[-1][:len(keys)])})
+    return {
+        "table": table_name,
+        "columns": columns,
+        "rows": [[json_value(v) for v in row[len(keys):]] for row in rows],
+        "next_cursor": next_cursor,
+    }
+
+
+def export_chunks(table_name, columns=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """(columns, generator of row chunks) for the whole table in key order.
+
+    The generator holds one open cursor; closing it (or exhausting it)
+    releases the cursor.
+    """
+    columns = _columns(table_name, columns)
+    conn = database.read_connection()
+    keys = _key_columns(conn, table_name)
+    order = ", ".join(k if k == "rowid" else quote_identifier(k) for k in keys)
+    select = ", ".join(quote_identifier(c) for c in columns)
+    sql = f"SELECT {select} FROM {quote_identifier(table_name)} ORDER BY {order}"
+
+    def chunks():
+        cur = conn.execute(sql)
+        try:
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            cur.close()
+
+    return columns, chunks()